@@ -19,6 +19,9 @@ class User(AbstractUser):
     class Meta:
         db_table = 'users'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-date_joined']),
+        ]
     
     def __str__(self):
         return self.username
@@ -112,3 +112,28 @@ class AuthenticationTests(TestCase):
         self.assertEqual(user.first_name, 'Updated')
         self.assertEqual(user.study_profile.current_level, 'intermediate')
         self.assertEqual(user.study_profile.daily_minutes, 60)
+    
+    def test_profile_conditional_get(self):
+        """Test that an unchanged profile is answered with 304 until it is updated"""
+        user = User.objects.create_user(username='testuser', password='testpass123')
+        StudyProfile.objects.create(user=user)
+        login_response = self.client.post('/api/auth/login', {
+            'username': 'testuser',
+            'password': 'testpass123'
+        }, format='json')
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {login_response.data['access']}")
+        
+        response = self.client.get('/api/profile/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        
+        # Authentication and the study profile; nothing is serialized
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        
+        self.client.patch('/api/profile/', {'daily_minutes': 45}, format='json')
+        response = self.client.get('/api/profile/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
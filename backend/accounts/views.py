@@ -3,7 +3,10 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from plans.conditional import not_modified, profile_etag, with_etag
+from plans.speculative import enqueue_speculative_regeneration
 from .serializers import (
     UserRegistrationSerializer,
     CustomTokenObtainPairSerializer,
@@ -79,11 +82,19 @@ class ProfileView(generics.RetrieveUpdateAPIView):
             return UserProfileUpdateSerializer
         return UserProfileSerializer
     
+    def retrieve(self, request, *args, **kwargs):
+        etag = profile_etag(request)
+        return not_modified(request, etag) or with_etag(super().retrieve(request, *args, **kwargs), etag)
+    
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = UserProfileUpdateSerializer(instance, data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
         serializer.save()
         
+        # A regenerate with the new profile usually follows; start it early
+        if settings.PLAN_SPECULATIVE_ENABLED:
+            enqueue_speculative_regeneration(instance)
+        
         # Return updated profile
         return Response(UserProfileSerializer(instance).data, status=status.HTTP_200_OK)
@@ -63,7 +63,7 @@ class AdminUserDetailSerializer(serializers.ModelSerializer):
         return None
     
     def get_plans(self, obj):
-        plans = Plan.objects.filter(user=obj).order_by('-created_at')
+        plans = Plan.objects.filter(user=obj).with_version_summary().order_by('-created_at')
         return [
             {
                 'id': plan.id,
@@ -72,12 +72,12 @@ class AdminUserDetailSerializer(serializers.ModelSerializer):
                 'is_active': plan.is_active,
                 'created_at': plan.created_at.isoformat(),
                 'updated_at': plan.updated_at.isoformat(),
-                'versions_count': plan.versions.count(),
+                'versions_count': plan.versions_count,
                 'latest_version': {
-                    'version_number': plan.versions.first().version_number,
-                    'model_used': plan.versions.first().model_used,
-                    'created_at': plan.versions.first().created_at.isoformat()
-                } if plan.versions.exists() else None
+                    'version_number': plan.latest_version_number,
+                    'model_used': plan.latest_model_used,
+                    'created_at': plan.latest_version_created_at.isoformat()
+                } if plan.latest_version_id is not None else None
             }
             for plan in plans
         ]
@@ -95,3 +95,25 @@ class AdminMetricsSerializer(serializers.Serializer):
     active_users_this_week = serializers.IntegerField()
     plans_by_day = serializers.DictField()
     users_by_day = serializers.DictField()
+    circuit_breaker = serializers.DictField()
+    generation_counters = serializers.DictField()
+    speculative = serializers.DictField()
+
+
+class ModelLatencySerializer(serializers.Serializer):
+    """Upstream latency of one model over a period"""
+    model = serializers.CharField(source='model_used')
+    versions = serializers.IntegerField()
+    retries = serializers.IntegerField(source='total_retries')
+    p50_ms = serializers.FloatField()
+    p95_ms = serializers.FloatField()
+    p99_ms = serializers.FloatField()
+
+
+class TokenUsageSerializer(serializers.Serializer):
+    """Token usage of one model on one day"""
+    date = serializers.DateField()
+    model = serializers.CharField(source='model_used')
+    versions = serializers.IntegerField()
+    prompt_tokens = serializers.IntegerField(source='total_prompt_tokens')
+    completion_tokens = serializers.IntegerField(source='total_completion_tokens')
@@ -4,7 +4,9 @@ from .views import (
     AdminUserDetailView,
     deactivate_user,
     delete_user,
-    admin_metrics
+    admin_metrics,
+    latency_metrics,
+    token_metrics
 )
 
 urlpatterns = [
@@ -13,4 +15,6 @@ urlpatterns = [
     path('users/<int:user_id>/deactivate', deactivate_user, name='admin-deactivate-user'),
     path('users/<int:user_id>/delete', delete_user, name='admin-delete-user'),
     path('metrics', admin_metrics, name='admin-metrics'),
+    path('metrics/latency', latency_metrics, name='admin-latency-metrics'),
+    path('metrics/tokens', token_metrics, name='admin-token-metrics'),
 ]
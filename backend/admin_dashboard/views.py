@@ -8,18 +8,31 @@ from django.db.models import Count, Q
 from .serializers import (
     AdminUserSerializer,
     AdminUserDetailSerializer,
-    AdminMetricsSerializer
+    AdminMetricsSerializer,
+    ModelLatencySerializer,
+    TokenUsageSerializer
 )
 from accounts.permissions import IsSuperAdmin
 from plans.models import Plan
+from plans.circuit_breaker import openai_breaker
+from plans.metrics import get_counters
+from plans.pagination import KeysetPagination
+from plans.speculative import speculative_stats
+from plans.telemetry import latency_by_model, tokens_by_day, versions_by_source
 
 User = get_user_model()
 
 
+class AdminUserPagination(KeysetPagination):
+    """Users, most recently joined first, along the date_joined index"""
+    ordering = '-date_joined'
+
+
 class AdminUserListView(generics.ListAPIView):
     """List all users (super admin only)"""
     serializer_class = AdminUserSerializer
     permission_classes = [permissions.IsAuthenticated, IsSuperAdmin]
+    pagination_class = AdminUserPagination
     
     def get_queryset(self):
         queryset = User.objects.all().select_related('study_profile')
@@ -52,7 +65,7 @@ class AdminUserDetailView(generics.RetrieveAPIView):
     """Get user details with plans (super admin only)"""
     serializer_class = AdminUserDetailSerializer
     permission_classes = [permissions.IsAuthenticated, IsSuperAdmin]
-    queryset = User.objects.all().select_related('study_profile').prefetch_related('plans', 'plans__versions')
+    queryset = User.objects.all().select_related('study_profile')
 
 
 @api_view(['POST'])
@@ -132,8 +145,45 @@ def admin_metrics(request):
         'active_users_today': active_users_today,
         'active_users_this_week': active_users_this_week,
         'plans_by_day': plans_by_day,
-        'users_by_day': users_by_day
+        'users_by_day': users_by_day,
+        'circuit_breaker': openai_breaker.status(),
+        'generation_counters': get_counters(),
+        'speculative': speculative_stats()
     }
     
     serializer = AdminMetricsSerializer(metrics)
     return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+def _telemetry_window(request):
+    """Start of the period requested with ``?days=`` (default 30, at most 365)"""
+    try:
+        days = min(max(int(request.query_params.get('days', 30)), 1), 365)
+    except ValueError:
+        days = 30
+    return days, timezone.now() - timedelta(days=days)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, IsSuperAdmin])
+def latency_metrics(request):
+    """Upstream latency percentiles per model and versions per source (super admin only)"""
+    days, since = _telemetry_window(request)
+    
+    return Response({
+        'days': days,
+        'models': ModelLatencySerializer(latency_by_model(since), many=True).data,
+        'sources': versions_by_source(since)
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated, IsSuperAdmin])
+def token_metrics(request):
+    """Prompt and completion tokens per day and model (super admin only)"""
+    days, since = _telemetry_window(request)
+    
+    return Response({
+        'days': days,
+        'tokens_by_day': TokenUsageSerializer(tokens_by_day(since), many=True).data
+    }, status=status.HTTP_200_OK)
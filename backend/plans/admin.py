@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Plan, PlanVersion
+from .models import Plan, PlanVersion, PlanWeek, PlanGenerationJob, PlanCacheEntry, GenerationCounter, IdempotencyKey
 
 
 @admin.register(Plan)
@@ -15,8 +15,52 @@ class PlanAdmin(admin.ModelAdmin):
 @admin.register(PlanVersion)
 class PlanVersionAdmin(admin.ModelAdmin):
     """Admin interface for PlanVersion model"""
-    list_display = ('id', 'plan', 'version_number', 'model_used', 'created_at')
-    list_filter = ('model_used', 'created_at')
+    list_display = ('id', 'plan', 'version_number', 'model_used', 'source', 'latency_ms', 'created_at')
+    list_filter = ('model_used', 'source', 'created_at')
     search_fields = ('plan__title', 'plan__user__username')
     readonly_fields = ('created_at',)
     raw_id_fields = ('plan',)
+
+
+@admin.register(PlanWeek)
+class PlanWeekAdmin(admin.ModelAdmin):
+    """Admin interface for PlanWeek model"""
+    list_display = ('id', 'version', 'week', 'created_at')
+    search_fields = ('version__plan__title',)
+    readonly_fields = ('created_at',)
+    raw_id_fields = ('version',)
+
+
+@admin.register(PlanGenerationJob)
+class PlanGenerationJobAdmin(admin.ModelAdmin):
+    """Admin interface for PlanGenerationJob model"""
+    list_display = ('id', 'user', 'kind', 'status', 'worker_id', 'created_at', 'finished_at')
+    list_filter = ('kind', 'status', 'created_at')
+    search_fields = ('user__username', 'plan__title')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+    raw_id_fields = ('user', 'plan', 'version')
+
+
+@admin.register(PlanCacheEntry)
+class PlanCacheEntryAdmin(admin.ModelAdmin):
+    """Admin interface for PlanCacheEntry model"""
+    list_display = ('key', 'model_used', 'hit_count', 'created_at', 'last_used_at')
+    list_filter = ('model_used',)
+    search_fields = ('key',)
+    readonly_fields = ('created_at', 'last_used_at')
+
+
+@admin.register(GenerationCounter)
+class GenerationCounterAdmin(admin.ModelAdmin):
+    """Admin interface for GenerationCounter model"""
+    list_display = ('name', 'value', 'updated_at')
+    search_fields = ('name',)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    """Admin interface for IdempotencyKey model"""
+    list_display = ('key', 'user', 'endpoint', 'job', 'created_at')
+    search_fields = ('key', 'user__username')
+    readonly_fields = ('created_at',)
+    raw_id_fields = ('user', 'job')
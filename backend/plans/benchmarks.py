@@ -0,0 +1,516 @@
+"""
+Benchmarks for the plan generation path
+
+Each benchmark returns a dict of results; ``manage.py benchmark_plans``
+runs them and prints the numbers. All upstream calls go to the local
+stub server, never to OpenAI. Benchmarks that write on this thread's
+connection run in a transaction that is rolled back, so the users,
+plans, jobs, telemetry and counters they create never reach the
+configured database.
+"""
+import functools
+import os
+import statistics
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient
+
+from .jobs import enqueue_plan_job, run_job
+from .models import Plan, PlanVersion
+from .metrics import counter_buffer
+from .llm import build_openai_client, get_llm_backend, get_openai_client, reset_llm_backends, reset_openai_client
+from .scheduling import MAX_PLAN_WEEKS, schedule_plan
+from .serializers import PlanSerializer
+from .prompts import count_message_tokens
+from .rendered import rendered_versions
+from .services import build_messages, build_prompt, build_section_prompt, generate_plan_sections, generate_study_plan
+from .stub_server import StubLLMServer, section_stub_content
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Mean and percentiles of timings, in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        'mean_ms': statistics.mean(ordered) * 1000,
+        'p50_ms': ordered[len(ordered) // 2] * 1000,
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+    }
+
+
+def rolled_back(benchmark: Callable[..., Dict]) -> Callable[..., Dict]:
+    """Run ``benchmark`` in a transaction that is always rolled back"""
+    @functools.wraps(benchmark)
+    def run(*args, **kwargs):
+        try:
+            with transaction.atomic():
+                results = benchmark(*args, **kwargs)
+                transaction.set_rollback(True)
+            return results
+        finally:
+            # Counted in process during the run, they would be written at exit
+            counter_buffer.discard()
+    return run
+
+
+def _time_calls(call: Callable[[], None], calls: int) -> List[float]:
+    samples = []
+    for _ in range(calls):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def benchmark_client(calls: int = 200) -> Dict[str, Dict[str, float]]:
+    """
+    Per-call overhead of building a client for every request versus the
+    pooled process-wide client, against a zero-latency local stub.
+    """
+    messages = build_messages('benchmark prompt')
+
+    with StubLLMServer() as server, override_settings(OPENAI_API_KEY='stub', OPENAI_BASE_URL=server.url):
+        def per_call_client():
+            client = build_openai_client()
+            try:
+                client.chat.completions.create(model='stub', messages=messages)
+            finally:
+                client.close()
+
+        def pooled_client():
+            get_openai_client().chat.completions.create(model='stub', messages=messages)
+
+        reset_openai_client()
+        # Warm up both paths (imports, first connection) before measuring
+        per_call_client()
+        pooled_client()
+        results = {
+            'per_call_client': summarize(_time_calls(per_call_client, calls)),
+            'pooled_client': summarize(_time_calls(pooled_client, calls)),
+        }
+        reset_openai_client()
+
+    return results
+
+
+def benchmark_schedule(calls: int = 200) -> Dict[str, Dict[str, float]]:
+    """Local scheduler building a full-length plan with daily tasks for every day"""
+    today = date(2026, 1, 1)
+    deadline = (today + timedelta(weeks=MAX_PLAN_WEEKS)).isoformat()
+
+    def schedule():
+        schedule_plan(
+            goal_text='Pass IELTS with 7.0',
+            current_level='intermediate',
+            daily_minutes=90,
+            deadline=deadline,
+            focus_areas=['reading', 'writing', 'listening', 'speaking'],
+            preferred_resources=['books', 'videos', 'podcasts'],
+            today=today
+        )
+
+    schedule()
+    return {f'{MAX_PLAN_WEEKS}_week_plan': summarize(_time_calls(schedule, calls))}
+
+
+def benchmark_parallel(calls: int = 3, token_delay: float = 0.0002) -> Dict[str, Dict[str, float]]:
+    """
+    Wall-clock time of a whole plan as one completion versus a roadmap
+    call plus concurrent section calls, against a stub that takes
+    ``token_delay`` seconds per completion token.
+    """
+    inputs = {
+        'goal_text': 'Pass IELTS with 7.0',
+        'current_level': 'intermediate',
+        'daily_minutes': 60,
+        'focus_areas': ['reading', 'writing', 'listening', 'speaking'],
+        'preferred_resources': ['books', 'videos'],
+    }
+    plan = schedule_plan(**inputs)
+    overrides = {
+        'PLAN_CACHE_ENABLED': False,
+        'PLAN_SINGLE_FLIGHT_ENABLED': False,
+        'PLAN_BREAKER_ENABLED': False,
+    }
+
+    results = {}
+    with StubLLMServer(content=section_stub_content(plan), token_delay=token_delay) as server:
+        with override_settings(OPENAI_API_KEY='stub', OPENAI_MODEL='stub', OPENAI_BASE_URL=server.url, **overrides):
+            reset_openai_client()
+            for mode, parallel in (('single_call', False), ('parallel_sections', True)):
+                with override_settings(PLAN_PARALLEL_SECTIONS=parallel):
+                    requests_before = server.requests
+                    results[mode] = summarize(_time_calls(lambda: generate_study_plan(**inputs), calls))
+                    results[mode]['requests_per_plan'] = (server.requests - requests_before) / calls
+            reset_openai_client()
+
+    return results
+
+
+def benchmark_load(
+    calls: int = 200,
+    concurrency: int = 16,
+    latency: str = 'lognormal:0.2,0.5',
+    error_rate: float = 0.02
+) -> Dict[str, Dict[str, float]]:
+    """
+    Throughput and tail latency of concurrent plan generations through the
+    stub backend, with a long-tailed upstream latency and occasional
+    upstream errors (retried by the client, then answered by the mock).
+    """
+    inputs = {
+        'goal_text': 'Pass IELTS with 7.0',
+        'current_level': 'intermediate',
+        'daily_minutes': 60,
+        'focus_areas': ['reading', 'writing', 'listening', 'speaking'],
+        'preferred_resources': ['books', 'videos'],
+    }
+    overrides = {
+        'PLAN_LLM_BACKEND': 'stub',
+        'PLAN_STUB_LATENCY': latency,
+        'PLAN_STUB_ERROR_RATE': error_rate,
+        'PLAN_CACHE_ENABLED': False,
+        'PLAN_SINGLE_FLIGHT_ENABLED': False,
+        'PLAN_BREAKER_ENABLED': False,
+        'OPENAI_MAX_CONNECTIONS': concurrency,
+        'OPENAI_MAX_KEEPALIVE_CONNECTIONS': concurrency,
+    }
+
+    def timed_plan():
+        started = time.perf_counter()
+        plan = generate_study_plan(**inputs)
+        return time.perf_counter() - started, plan['model_used'] == 'mock-mode'
+
+    with override_settings(**overrides):
+        reset_llm_backends()
+        server = get_llm_backend().start()
+        timed_plan()
+        requests_before, errors_before = server.requests, server.errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            outcomes = list(executor.map(lambda _: timed_plan(), range(calls)))
+        elapsed = time.perf_counter() - started
+        reset_llm_backends()
+
+    return {
+        'plans': summarize([seconds for seconds, _ in outcomes]),
+        'throughput': {
+            'plans_per_second': calls / elapsed,
+            'upstream_requests': server.requests - requests_before,
+            'upstream_errors': server.errors - errors_before,
+            'fallback_plans': sum(1 for _, fallback in outcomes if fallback),
+        },
+    }
+
+
+@rolled_back
+def benchmark_replay(calls: int = 20, latency: str = 'lognormal:0.2,0.5') -> Dict[str, Dict[str, float]]:
+    """
+    The full create-plan job path (generation, parsing, repair and
+    persistence) replaying ``calls`` recorded stub completions, with the
+    recorded latency and without it. Both runs see identical responses.
+    """
+    user, _ = get_user_model().objects.get_or_create(username='benchmark-replay')
+    params = [
+        {
+            'title': f'Replay {i}',
+            'goal_text': f'Pass IELTS with 7.0 (run {i})',
+            'current_level': 'intermediate',
+            'daily_minutes': 60,
+            'deadline': None,
+            'focus_areas': ['reading', 'writing', 'listening', 'speaking'],
+            'preferred_resources': ['books', 'videos'],
+            'preferred_language': 'en',
+        }
+        for i in range(calls)
+    ]
+    overrides = {
+        'PLAN_LLM_BACKEND': 'stub',
+        'PLAN_STUB_LATENCY': latency,
+        'PLAN_CACHE_ENABLED': False,
+        'PLAN_SINGLE_FLIGHT_ENABLED': False,
+        'PLAN_BREAKER_ENABLED': False,
+    }
+
+    def create_plan_jobs():
+        samples = []
+        for job_params in params:
+            job = enqueue_plan_job(user, 'create', job_params)
+            started = time.perf_counter()
+            run_job(job)
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'benchmark.jsonl')
+        with override_settings(PLAN_LLM_CASSETTE_PATH=path, **overrides):
+            reset_llm_backends()
+            with override_settings(PLAN_LLM_CASSETTE_MODE='record'):
+                results['recorded'] = summarize(create_plan_jobs())
+            for mode, replay_latency in (('replay_with_latency', True), ('replay_without_latency', False)):
+                with override_settings(PLAN_LLM_CASSETTE_MODE='replay', PLAN_LLM_CASSETTE_REPLAY_LATENCY=replay_latency):
+                    results[mode] = summarize(create_plan_jobs())
+            reset_llm_backends()
+
+    return results
+
+
+@rolled_back
+def benchmark_routing(
+    calls: int = 20,
+    fast_latency: str = 'lognormal:0.15,0.3',
+    standard_latency: str = 'lognormal:0.6,0.3'
+) -> Dict[str, Dict[str, float]]:
+    """
+    Median create-plan latency of a mixed workload (half two-week plans,
+    half open-ended plans) without and with model routing. Each policy
+    is recorded once through the stub, whose latency depends on the
+    requested model, and the recordings are replayed with their latency.
+    """
+    user, _ = get_user_model().objects.get_or_create(username='benchmark-routing')
+    short_deadline = (date.today() + timedelta(days=14)).isoformat()
+    params = [
+        {
+            'title': f'Routing {i}',
+            'goal_text': f'Pass IELTS with 7.0 (run {i})',
+            'current_level': 'intermediate',
+            'daily_minutes': 60,
+            'deadline': short_deadline if i % 2 else None,
+            'focus_areas': ['reading', 'writing', 'listening', 'speaking'],
+            'preferred_resources': ['books', 'videos'],
+            'preferred_language': 'en',
+        }
+        for i in range(calls)
+    ]
+    fast, standard = settings.PLAN_MODEL_TIERS['fast'][0], settings.PLAN_MODEL_TIERS['standard'][0]
+    overrides = {
+        'PLAN_LLM_BACKEND': 'stub',
+        'PLAN_STUB_MODEL_LATENCY': {fast: fast_latency, standard: standard_latency},
+        'OPENAI_MODEL': standard,
+        'PLAN_CACHE_ENABLED': False,
+        'PLAN_SINGLE_FLIGHT_ENABLED': False,
+        'PLAN_BREAKER_ENABLED': False,
+    }
+
+    def create_plan_jobs():
+        samples = []
+        for job_params in params:
+            job = enqueue_plan_job(user, 'create', job_params)
+            started = time.perf_counter()
+            run_job(job)
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for policy, enabled in (('unrouted', False), ('routed', True)):
+            path = os.path.join(directory, f'{policy}.jsonl')
+            with override_settings(PLAN_LLM_CASSETTE_PATH=path, PLAN_ROUTING_ENABLED=enabled, **overrides):
+                reset_llm_backends()
+                with override_settings(PLAN_LLM_CASSETTE_MODE='record'):
+                    create_plan_jobs()
+                with override_settings(PLAN_LLM_CASSETTE_MODE='replay'):
+                    results[policy] = summarize(create_plan_jobs())
+                reset_llm_backends()
+
+    results['change'] = {
+        'p50_ms': results['routed']['p50_ms'] - results['unrouted']['p50_ms'],
+        'p50_ratio': results['routed']['p50_ms'] / results['unrouted']['p50_ms'],
+    }
+    return results
+
+
+@rolled_back
+def benchmark_prompt(calls: int = 20, latency: float = 0.05, prompt_token_delay: float = 0.0005) -> Dict[str, Dict[str, float]]:
+    """
+    Prompt size and end-to-end latency of the pretty-printed prompts
+    versus the compact, budgeted ones, for a whole plan and for one week
+    of daily tasks of a year-long plan, against a stub that reads
+    ``prompt_token_delay`` seconds per prompt token.
+    """
+    inputs = {
+        'goal_text': 'Pass IELTS with 7.0',
+        'current_level': 'intermediate',
+        'daily_minutes': 60,
+        'deadline': (date.today() + timedelta(weeks=MAX_PLAN_WEEKS)).isoformat(),
+        'focus_areas': ['reading', 'writing', 'listening', 'speaking'],
+        'preferred_resources': ['books', 'videos'],
+    }
+    roadmap = schedule_plan(**inputs)['weekly_roadmap']
+    overrides = {
+        'PLAN_LLM_BACKEND': 'stub',
+        'PLAN_STUB_LATENCY': latency,
+        'PLAN_STUB_PROMPT_TOKEN_DELAY': prompt_token_delay,
+        'PLAN_CACHE_ENABLED': False,
+        'PLAN_SINGLE_FLIGHT_ENABLED': False,
+        'PLAN_BREAKER_ENABLED': False,
+    }
+
+    def plan():
+        generate_study_plan(**inputs)
+
+    def week():
+        generate_plan_sections(['daily_tasks'], {'weekly_roadmap': roadmap}, weeks=(26, 26), **inputs)
+
+    results = {}
+    for style, compact in (('pretty', False), ('compact', True)):
+        with override_settings(PLAN_PROMPT_COMPACT=compact, **overrides):
+            reset_llm_backends()
+            get_llm_backend().start()
+            prompts = {
+                'plan': build_prompt(**inputs),
+                'week': build_section_prompt(['daily_tasks'], {'weekly_roadmap': roadmap}, weeks=(26, 26), **inputs),
+            }
+            for name, call in (('plan', plan), ('week', week)):
+                call()
+                results[f'{style}_{name}'] = {
+                    'prompt_tokens': count_message_tokens(build_messages(prompts[name])),
+                    'prompt_chars': len(prompts[name]),
+                    **summarize(_time_calls(call, calls)),
+                }
+            reset_llm_backends()
+
+    return results
+
+
+@rolled_back
+def benchmark_plan_list(plans: int = 50, versions: int = 20, calls: int = 5) -> Dict[str, Dict[str, float]]:
+    """
+    Queries, payload size and time of GET /api/plans/ (first page) and of
+    a plan's detail for a user with ``plans`` plans of ``versions``
+    versions each, with the full nested serializer the list used to
+    return versus the annotated summary list, and of the sparse detail a
+    dashboard asks for (latest version, one week of roadmap and tasks)
+    """
+    user, _ = get_user_model().objects.get_or_create(username='benchmark-plan-list')
+    content = schedule_plan(
+        goal_text='Pass IELTS with 7.0',
+        current_level='intermediate',
+        daily_minutes=60,
+        focus_areas=['reading', 'writing', 'listening', 'speaking'],
+        preferred_resources=['books', 'videos']
+    )
+    for index in range(plans):
+        plan = Plan.objects.create(user=user, title=f'Plan {index}', goal_text='Pass IELTS with 7.0', is_active=False)
+        PlanVersion.objects.bulk_create([
+            PlanVersion(plan=plan, version_number=number, content_json=content, prompt_used='', model_used='gpt-test')
+            for number in range(1, versions + 1)
+        ])
+    client = APIClient()
+    client.force_authenticate(user)
+    plan_id = Plan.objects.filter(user=user).values_list('id', flat=True).first()
+    page_size = api_settings.PAGE_SIZE
+
+    def nested_list():
+        page = Plan.objects.filter(user=user)[:page_size]
+        return JSONRenderer().render(PlanSerializer(page, many=True).data)
+
+    def unprefetched_detail():
+        return JSONRenderer().render(PlanSerializer(Plan.objects.get(pk=plan_id)).data)
+
+    requests = {
+        'nested_list': nested_list,
+        'summary_list': lambda: client.get('/api/plans/').content,
+        'unprefetched_detail': unprefetched_detail,
+        'detail': lambda: client.get(f'/api/plans/{plan_id}').content,
+        'sparse_detail': lambda: client.get(
+            f'/api/plans/{plan_id}?fields=id,title,latest_version&sections=weekly_roadmap,daily_tasks&week=3'
+        ).content,
+    }
+    results = {}
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for name, request in requests.items():
+            with CaptureQueriesContext(connection) as queries:
+                payload = request()
+            results[name] = {
+                'queries': len(queries),
+                'payload_kb': len(payload) / 1024,
+                **summarize(_time_calls(request, calls)),
+            }
+
+    return results
+
+
+@rolled_back
+def benchmark_rendered(versions: int = 10, calls: int = 20) -> Dict[str, Dict[str, float]]:
+    """
+    Latency and queries of the detail of a plan with ``versions``
+    year-long versions: serialized on every request, spliced from the
+    in-process rendered cache, and from the directory cache alone (as a
+    fresh process would see it)
+    """
+    user, _ = get_user_model().objects.get_or_create(username='benchmark-rendered')
+    content = schedule_plan(
+        goal_text='Pass IELTS with 7.0',
+        current_level='intermediate',
+        daily_minutes=90,
+        deadline=date.today() + timedelta(weeks=MAX_PLAN_WEEKS),
+        focus_areas=['reading', 'writing', 'listening', 'speaking'],
+        preferred_resources=['books', 'videos', 'podcasts']
+    )
+    plan = Plan.objects.create(user=user, title='Year plan', goal_text='Pass IELTS with 7.0', is_active=False)
+    PlanVersion.objects.bulk_create([
+        PlanVersion(plan=plan, version_number=number, content_json=content, prompt_used='', model_used='gpt-test')
+        for number in range(1, versions + 1)
+    ])
+    client = APIClient()
+    client.force_authenticate(user)
+
+    def detail():
+        return client.get(f'/api/plans/{plan.id}').content
+
+    def cold_process_detail():
+        rendered_versions.clear()
+        return detail()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        caches = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'plan_versions': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }
+        runs = {
+            'serialized': ({'PLAN_RENDERED_CACHE_ENABLED': False}, detail),
+            'memory': ({'PLAN_RENDERED_CACHE_ENABLED': True}, detail),
+            'directory': ({'PLAN_RENDERED_CACHE_ENABLED': True, 'CACHES': caches}, cold_process_detail),
+        }
+        for name, (overrides, request) in runs.items():
+            rendered_versions.clear()
+            with override_settings(ALLOWED_HOSTS=['testserver'], **overrides):
+                payload = request()
+                with CaptureQueriesContext(connection) as queries:
+                    request()
+                results[name] = {
+                    'queries': len(queries),
+                    'payload_kb': len(payload) / 1024,
+                    **summarize(_time_calls(request, calls)),
+                }
+    rendered_versions.clear()
+
+    return results
+
+
+BENCHMARKS = {
+    'client': benchmark_client,
+    'schedule': benchmark_schedule,
+    'parallel': benchmark_parallel,
+    'load': benchmark_load,
+    'replay': benchmark_replay,
+    'routing': benchmark_routing,
+    'prompt': benchmark_prompt,
+    'plan_list': benchmark_plan_list,
+    'rendered': benchmark_rendered,
+}
@@ -0,0 +1,145 @@
+"""
+Content-addressed cache for generated study plans
+
+Inputs that only differ in whitespace, case or list order hash to the
+same key, so near-identical requests are served from the database
+instead of a new model call.
+"""
+import hashlib
+import json
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metrics
+from .models import PlanCacheEntry
+
+# Sections stored in the cache; prompt_used/model_used are per call
+CACHED_SECTIONS = ('weekly_roadmap', 'daily_tasks', 'topics', 'resources', 'checkpoints')
+
+
+def _normalize_text(value: Optional[str]) -> str:
+    return ' '.join((value or '').split()).lower()
+
+
+def _normalize_list(values: Optional[list]) -> list:
+    return sorted({_normalize_text(value) for value in values or [] if value})
+
+
+def normalize_inputs(
+    goal_text: str,
+    current_level: str,
+    daily_minutes: int,
+    deadline: Optional[str] = None,
+    focus_areas: list = None,
+    preferred_resources: list = None,
+    preferred_language: str = 'en'
+) -> Dict[str, Any]:
+    """Canonical form of the build_prompt inputs"""
+    return {
+        'goal_text': _normalize_text(goal_text),
+        'current_level': _normalize_text(current_level),
+        'daily_minutes': int(daily_minutes),
+        'deadline': str(deadline) if deadline else None,
+        'focus_areas': _normalize_list(focus_areas),
+        'preferred_resources': _normalize_list(preferred_resources),
+        'preferred_language': _normalize_text(preferred_language),
+    }
+
+
+def plan_cache_key(model: str, **inputs) -> str:
+    """SHA-256 of the model name and normalized generation inputs"""
+    payload = json.dumps({'model': model, **normalize_inputs(**inputs)}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PlanCache:
+    """
+    Database-backed plan cache with TTL and LRU eviction.
+
+    Entries older than ``ttl`` seconds are treated as misses; once more
+    than ``max_entries`` are stored the least recently used are deleted.
+    """
+
+    def __init__(self, ttl: Optional[int] = None, max_entries: Optional[int] = None):
+        self._ttl = ttl
+        self._max_entries = max_entries
+
+    @property
+    def ttl(self) -> int:
+        return self._ttl if self._ttl is not None else settings.PLAN_CACHE_TTL
+
+    @property
+    def max_entries(self) -> int:
+        return self._max_entries if self._max_entries is not None else settings.PLAN_CACHE_MAX_ENTRIES
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return cached sections for ``key`` or None on a miss"""
+        entry = PlanCacheEntry.objects.filter(key=key).first()
+        if entry and entry.created_at < timezone.now() - timedelta(seconds=self.ttl):
+            entry.delete()
+            entry = None
+
+        if entry is None:
+            metrics.increment('plan_cache.miss')
+            return None
+
+        PlanCacheEntry.objects.filter(pk=entry.pk).update(
+            hit_count=F('hit_count') + 1,
+            last_used_at=timezone.now()
+        )
+        metrics.increment('plan_cache.hit')
+        return entry.content_json
+
+    def contains(self, key: str) -> bool:
+        """Whether ``key`` has a fresh entry; unlike get() it counts no hit or miss"""
+        return PlanCacheEntry.objects.filter(
+            key=key,
+            created_at__gte=timezone.now() - timedelta(seconds=self.ttl)
+        ).exists()
+
+    def set(self, key: str, model: str, plan_content: Dict[str, Any]):
+        """Store the plan sections of ``plan_content`` under ``key``"""
+        content = {section: plan_content.get(section, []) for section in CACHED_SECTIONS}
+        try:
+            with transaction.atomic():
+                PlanCacheEntry.objects.update_or_create(
+                    key=key,
+                    defaults={
+                        'model_used': model,
+                        'content_json': content,
+                        'created_at': timezone.now(),
+                        'last_used_at': timezone.now(),
+                    }
+                )
+        except IntegrityError:
+            # A concurrent generation stored the same key
+            return
+        self.evict()
+
+    def evict(self) -> int:
+        """Delete least recently used entries beyond ``max_entries``"""
+        stale_ids = list(
+            PlanCacheEntry.objects.order_by('-last_used_at')
+            .values_list('id', flat=True)[self.max_entries:]
+        )
+        if stale_ids:
+            PlanCacheEntry.objects.filter(id__in=stale_ids).delete()
+            metrics.increment('plan_cache.evicted', len(stale_ids))
+        return len(stale_ids)
+
+    def stats(self) -> Dict[str, int]:
+        counters = metrics.get_counters('plan_cache.')
+        return {
+            'entries': PlanCacheEntry.objects.count(),
+            'hits': counters.get('plan_cache.hit', 0),
+            'misses': counters.get('plan_cache.miss', 0),
+            'evicted': counters.get('plan_cache.evicted', 0),
+        }
+
+
+plan_cache = PlanCache()
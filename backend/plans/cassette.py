@@ -0,0 +1,202 @@
+"""
+Record/replay of model responses
+
+With PLAN_LLM_CASSETTE_MODE=record every completion sent through the
+configured backend is appended to a JSON lines file (the cassette) with
+the latency it took, keyed by a hash of the request (model, messages and
+sampling parameters). With PLAN_LLM_CASSETTE_MODE=replay no backend is
+called: responses are served from the cassette, after the recorded
+latency when PLAN_LLM_CASSETTE_REPLAY_LATENCY is on, so the full
+create-plan path can be benchmarked and regression tested offline with
+the outputs production actually got.
+
+A request recorded several times is replayed in recording order and then
+starts over. A request missing from the cassette raises CassetteMiss,
+which callers treat like any other upstream error.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.utils import timezone
+
+from .llm import LLMBackend
+
+logger = logging.getLogger(__name__)
+
+# Request arguments that do not change the response
+UNKEYED_ARGUMENTS = ('stream', 'timeout')
+
+
+class CassetteMiss(LookupError):
+    """The replayed request was never recorded"""
+
+
+def request_key(request: Dict[str, Any]) -> str:
+    """Hash of the request arguments that determine the response"""
+    keyed = {name: value for name, value in request.items() if name not in UNKEYED_ARGUMENTS}
+    return hashlib.sha256(json.dumps(keyed, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Append-only JSON lines store of recorded completions"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Optional[Dict[str, List[Dict[str, Any]]]] = None
+        self._next: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, List[Dict[str, Any]]]:
+        entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as cassette:
+                for number, line in enumerate(cassette, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A record cut short by a crash; everything before it is intact
+                        logger.warning(f"Skipping unreadable line {number} of cassette {self.path}")
+                        continue
+                    entries.setdefault(entry['key'], []).append(entry)
+        return entries
+
+    def append(
+        self,
+        key: str,
+        response: Dict[str, Any],
+        latency: float,
+        first_token_latency: Optional[float] = None,
+        chunks: Optional[List[str]] = None
+    ):
+        """Record one completion; the line is written in a single append"""
+        entry = {
+            'key': key,
+            'recorded_at': timezone.now().isoformat(),
+            'latency': latency,
+            'first_token_latency': first_token_latency,
+            'response': response,
+            'chunks': chunks,
+        }
+        line = json.dumps(entry) + '\n'
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as cassette:
+                cassette.write(line)
+            if self._entries is not None:
+                self._entries.setdefault(key, []).append(entry)
+
+    def next_entry(self, key: str) -> Dict[str, Any]:
+        """The next recording of ``key``, cycling through them in order"""
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            recordings = self._entries.get(key)
+            if not recordings:
+                raise CassetteMiss(f'No recorded response for request {key[:12]} in {self.path}')
+            index = self._next.get(key, 0)
+            self._next[key] = (index + 1) % len(recordings)
+            return recordings[index]
+
+
+def _completion_from_chunks(chunks: List[Any], content: str) -> Dict[str, Any]:
+    """A chat.completion dict equivalent to a recorded stream"""
+    first = chunks[0] if chunks else None
+    return {
+        'id': getattr(first, 'id', 'chatcmpl-recorded'),
+        'object': 'chat.completion',
+        'created': getattr(first, 'created', int(time.time())),
+        'model': getattr(first, 'model', ''),
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': None,
+    }
+
+
+class RecordingBackend(LLMBackend):
+    """Passes requests to ``backend`` and records every completed response"""
+
+    def __init__(self, backend: LLMBackend, cassette: Cassette):
+        self.backend = backend
+        self.cassette = cassette
+        self.name = f'{backend.name}+record'
+
+    def is_available(self) -> bool:
+        return self.backend.is_available()
+
+    def create_completion(self, **request) -> Any:
+        key = request_key(request)
+        started = time.monotonic()
+        response = self.backend.create_completion(**request)
+        if request.get('stream'):
+            return self._record_stream(key, response, started)
+        self.cassette.append(key, response.model_dump(), time.monotonic() - started)
+        return response
+
+    def _record_stream(self, key: str, stream, started: float) -> Iterator[Any]:
+        chunks, deltas, first_token = [], [], None
+        for chunk in stream:
+            if first_token is None:
+                first_token = time.monotonic() - started
+            chunks.append(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                deltas.append(chunk.choices[0].delta.content)
+            yield chunk
+        # Only complete streams are recorded
+        content = ''.join(deltas)
+        self.cassette.append(
+            key, _completion_from_chunks(chunks, content), time.monotonic() - started, first_token, deltas
+        )
+
+    def close(self):
+        self.backend.close()
+
+
+class ReplayBackend(LLMBackend):
+    """Serves recorded responses without calling any model"""
+    name = 'replay'
+
+    def __init__(self, cassette: Cassette, latency: bool = True):
+        self.cassette = cassette
+        self.latency = latency
+
+    def is_available(self) -> bool:
+        return True
+
+    def create_completion(self, **request) -> Any:
+        from openai.types.chat import ChatCompletion
+
+        entry = self.cassette.next_entry(request_key(request))
+        if request.get('stream'):
+            return self._replay_stream(entry)
+        if self.latency:
+            time.sleep(entry['latency'])
+        return ChatCompletion.model_validate(entry['response'])
+
+    def _replay_stream(self, entry: Dict[str, Any]) -> Iterator[Any]:
+        from openai.types.chat import ChatCompletionChunk
+
+        response = entry['response']
+        deltas = entry['chunks'] or [response['choices'][0]['message']['content']]
+        first_token = entry['first_token_latency'] or 0.0
+        # Spread the rest of the recorded time evenly over the chunks
+        between = max(0.0, entry['latency'] - first_token) / len(deltas)
+        if self.latency:
+            time.sleep(first_token)
+        for index, delta in enumerate(deltas):
+            if self.latency and index:
+                time.sleep(between)
+            yield ChatCompletionChunk.model_validate({
+                'id': response['id'],
+                'object': 'chat.completion.chunk',
+                'created': response['created'],
+                'model': response['model'],
+                'choices': [{'index': 0, 'delta': {'content': delta}, 'finish_reason': None}],
+            })
@@ -0,0 +1,171 @@
+"""
+Circuit breaker around the upstream model call
+
+Closed: calls go through and their outcome is counted in a fixed time
+window. Once enough calls fail or are slow the breaker opens and calls
+are skipped (callers use the local fallback) until the cooldown ends.
+Then a single half-open trial call decides whether to close again.
+
+State lives in the CircuitBreakerState table so every process sees the
+same breaker; each process keeps a copy for ``refresh_interval`` seconds
+so an open breaker is answered without a database query.
+"""
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Any, Iterable, Optional
+
+from django.conf import settings
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
+
+from . import metrics
+from .models import CircuitBreakerState
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Database-backed circuit breaker"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._local: Optional[CircuitBreakerState] = None
+        self._fetched_at = 0.0
+
+    def _row(self) -> CircuitBreakerState:
+        row, _ = CircuitBreakerState.objects.get_or_create(name=self.name)
+        self._local = row
+        self._fetched_at = time.monotonic()
+        return row
+
+    def _state(self) -> CircuitBreakerState:
+        if self._local is None or time.monotonic() - self._fetched_at > settings.PLAN_BREAKER_REFRESH_INTERVAL:
+            return self._row()
+        return self._local
+
+    def _cooldown_elapsed(self, row: CircuitBreakerState) -> bool:
+        return timezone.now() - row.changed_at >= timedelta(seconds=settings.PLAN_BREAKER_COOLDOWN)
+
+    def allow(self) -> bool:
+        """Whether a call may go upstream now"""
+        if not settings.PLAN_BREAKER_ENABLED:
+            return True
+
+        row = self._state()
+        if row.state == 'closed':
+            return True
+        if not self._cooldown_elapsed(row):
+            return False
+
+        # Cooldown is over: exactly one caller gets the half-open trial
+        return self._transition(('open', 'half_open'), 'half_open', 'cooldown elapsed', stale_only=True)
+
+    def would_allow(self) -> bool:
+        """Whether a call could go upstream now, without claiming the half-open trial"""
+        if not settings.PLAN_BREAKER_ENABLED:
+            return True
+
+        row = self._state()
+        return row.state == 'closed' or self._cooldown_elapsed(row)
+
+    def record_success(self, latency: float):
+        """Count a completed upstream call that took ``latency`` seconds"""
+        if not settings.PLAN_BREAKER_ENABLED:
+            return
+        slow = latency >= settings.PLAN_BREAKER_SLOW_CALL_SECONDS
+        row = self._record(failed=False, slow=slow)
+        if row.state == 'half_open':
+            if slow:
+                self._transition(('half_open',), 'open', f'trial call took {latency:.1f}s')
+            else:
+                self._transition(('half_open',), 'closed', 'trial call succeeded')
+        else:
+            self._evaluate(row)
+
+    def record_failure(self):
+        """Count a failed upstream call"""
+        if not settings.PLAN_BREAKER_ENABLED:
+            return
+        row = self._record(failed=True, slow=False)
+        if row.state == 'half_open':
+            self._transition(('half_open',), 'open', 'trial call failed')
+        else:
+            self._evaluate(row)
+
+    def _record(self, failed: bool, slow: bool) -> CircuitBreakerState:
+        """Count a call, starting a new window first if the current one is over; returns the updated row"""
+        now = timezone.now()
+        expired = Q(window_started_at__lt=now - timedelta(seconds=settings.PLAN_BREAKER_WINDOW))
+
+        def counted(field: str, amount: int):
+            return Case(When(expired, then=Value(amount)), default=F(field) + amount)
+
+        # One UPDATE both resets an expired window and counts the call
+        rows = CircuitBreakerState.objects.filter(name=self.name)
+        changes = {
+            'window_started_at': Case(When(expired, then=Value(now)), default=F('window_started_at')),
+            'calls': counted('calls', 1),
+            'failures': counted('failures', int(failed)),
+            'slow_calls': counted('slow_calls', int(slow)),
+        }
+        if not rows.update(**changes):
+            # First call of this breaker anywhere
+            self._row()
+            rows.update(**changes)
+        return self._row()
+
+    def _evaluate(self, row: CircuitBreakerState):
+        if row.state != 'closed' or row.calls < settings.PLAN_BREAKER_MIN_CALLS:
+            return
+        error_rate = row.failures / row.calls
+        slow_rate = row.slow_calls / row.calls
+        if error_rate >= settings.PLAN_BREAKER_ERROR_RATE:
+            self._transition(('closed',), 'open', f'error rate {error_rate:.0%} over {row.calls} calls')
+        elif slow_rate >= settings.PLAN_BREAKER_SLOW_CALL_RATE:
+            self._transition(('closed',), 'open', f'slow call rate {slow_rate:.0%} over {row.calls} calls')
+
+    def _transition(self, from_states: Iterable[str], to_state: str, reason: str, stale_only: bool = False) -> bool:
+        now = timezone.now()
+        rows = CircuitBreakerState.objects.filter(name=self.name, state__in=from_states)
+        if stale_only:
+            rows = rows.filter(changed_at__lte=now - timedelta(seconds=settings.PLAN_BREAKER_COOLDOWN))
+        changed = rows.update(
+            state=to_state,
+            changed_at=now,
+            window_started_at=now,
+            calls=0,
+            failures=0,
+            slow_calls=0
+        )
+        self._row()
+        if changed:
+            logger.warning(f"Circuit breaker '{self.name}' is now {to_state}: {reason}")
+            metrics.increment(f'circuit_breaker.{to_state}')
+        return bool(changed)
+
+    def error_rate(self) -> float:
+        """Share of failed calls in the current window (0 until it has PLAN_BREAKER_MIN_CALLS calls)"""
+        row = self._state()
+        if row.calls < settings.PLAN_BREAKER_MIN_CALLS:
+            return 0.0
+        return row.failures / row.calls
+
+    def forget(self):
+        """Drop the local copy so the next check reads the shared state"""
+        self._local = None
+
+    def status(self) -> Dict[str, Any]:
+        """Current shared state, for the admin dashboard"""
+        row = self._row()
+        return {
+            'name': row.name,
+            'state': row.state,
+            'changed_at': row.changed_at.isoformat(),
+            'window_calls': row.calls,
+            'window_failures': row.failures,
+            'window_slow_calls': row.slow_calls,
+        }
+
+
+openai_breaker = CircuitBreaker('openai')
@@ -0,0 +1,51 @@
+"""
+Conditional GET for polled endpoints
+
+The plan list, plan detail and profile carry a strong ETag computed
+from a few cheap columns (update times and counts; saving a version
+touches its plan's updated_at) instead of from the serialized body. A request whose
+If-None-Match matches gets a 304 before anything is serialized.
+"""
+import hashlib
+from typing import Optional
+
+from django.db.models import Count, Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+
+def make_etag(request, *parts) -> str:
+    """Strong ETag of ``parts`` for the requested URL and representation"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    key = ':'.join(str(part) for part in (request.get_full_path(), getattr(renderer, 'format', ''), *parts))
+    return '"' + hashlib.sha256(key.encode('utf-8')).hexdigest()[:32] + '"'
+
+
+def not_modified(request, etag: str) -> Optional[HttpResponse]:
+    """The 304 response when the client already has ``etag``"""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def with_etag(response, etag: str):
+    """Tag a 200 response; clients must revalidate and shared caches must not store it"""
+    if response.status_code == 200:
+        response['ETag'] = etag
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def plans_etag(request, plans) -> str:
+    """ETag of plans: one aggregate query over the plans, without joining their versions"""
+    state = plans.aggregate(plan_count=Count('id'), last_updated_at=Max('updated_at'))
+    return make_etag(request, request.user.pk, *state.values())
+
+
+def profile_etag(request) -> str:
+    """ETag of the user's profile; loads the study profile the serializer reads anyway"""
+    user = request.user
+    profile = getattr(user, 'study_profile', None)
+    return make_etag(request, user.pk, user.updated_at, user.last_login, profile and profile.updated_at)
@@ -0,0 +1,80 @@
+"""
+Idempotency keys for plan create and regenerate
+
+A client that sends an ``Idempotency-Key`` header can retry a timed-out
+request safely: the first request with a key queues the generation job
+and records it; any retry with the same key within
+PLAN_IDEMPOTENCY_TTL gets that job back in its current state (pending,
+running, or done with its version) instead of starting another
+generation. Reusing a key for a different request is rejected.
+"""
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from typing import Callable, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from . import metrics
+from .models import IdempotencyKey, PlanGenerationJob
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'This Idempotency-Key was already used for a different request.'
+    default_code = 'idempotency_key_reused'
+
+
+def request_hash(request) -> str:
+    """Hash of the request body, to tell a retry from a different request"""
+    return hashlib.sha256(json.dumps(request.data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def _replay(record: IdempotencyKey, endpoint: str, body_hash: str) -> PlanGenerationJob:
+    if record.endpoint != endpoint or record.request_hash != body_hash:
+        raise IdempotencyKeyReused()
+    metrics.increment('idempotency.replayed')
+    logger.info(f"Replaying job {record.job_id} for idempotency key of user {record.user_id}")
+    return PlanGenerationJob.objects.select_related('version').get(pk=record.job_id)
+
+
+def idempotent_job(request, endpoint: str, enqueue: Callable[[], PlanGenerationJob]) -> Tuple[PlanGenerationJob, bool]:
+    """
+    The job for ``request``: the one recorded for its Idempotency-Key,
+    or a new one from ``enqueue``. Returns the job and whether it was
+    replayed. Without the header ``enqueue`` simply runs.
+    """
+    key = request.headers.get(HEADER)
+    if not key:
+        return enqueue(), False
+    if len(key) > IdempotencyKey._meta.get_field('key').max_length:
+        raise ValidationError({HEADER: 'Must be at most 255 characters.'})
+
+    body_hash = request_hash(request)
+    expires = timezone.now() - timedelta(seconds=settings.PLAN_IDEMPOTENCY_TTL)
+    record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+    if record is not None:
+        if record.created_at >= expires:
+            return _replay(record, endpoint, body_hash), True
+        record.delete()
+
+    try:
+        # The job only exists if its key was recorded, so a concurrent retry cannot queue a second one
+        with transaction.atomic():
+            job = enqueue()
+            IdempotencyKey.objects.create(user=request.user, key=key, endpoint=endpoint, request_hash=body_hash, job=job)
+    except IntegrityError:
+        return _replay(IdempotencyKey.objects.get(user=request.user, key=key), endpoint, body_hash), True
+
+    IdempotencyKey.objects.filter(created_at__lt=expires).delete()
+    return job, False
@@ -0,0 +1,192 @@
+"""
+Incremental plan regeneration
+
+Compares the inputs of a regenerate request with the ones the previous
+version was generated from and only recomputes the sections affected by
+what changed; everything else is copied from the previous version.
+"""
+import logging
+import math
+from typing import Any, Dict, List, Optional
+
+from .cache import normalize_inputs
+from .jobs import GENERATION_PARAMS
+from .scheduling import fit_day_to_budget, plan_days, schedule_plan
+
+logger = logging.getLogger(__name__)
+
+# Inputs that only change the schedule, not what is studied
+SCHEDULE_PARAMS = ('daily_minutes', 'deadline')
+
+
+def changed_params(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """Names of the generation inputs that differ after normalization"""
+    old = normalize_inputs(**{key: previous.get(key) for key in GENERATION_PARAMS})
+    new = normalize_inputs(**{key: current.get(key) for key in GENERATION_PARAMS})
+    return [name for name in new if old.get(name) != new[name]]
+
+
+def reschedule_daily_minutes(content: Dict[str, Any], old_minutes: int, new_minutes: int) -> Dict[str, Any]:
+    """Adapt daily_tasks and weekly estimated_hours to a new daily budget"""
+    daily_tasks = [
+        dict(day, tasks=fit_day_to_budget(day.get('tasks', []), new_minutes))
+        for day in content.get('daily_tasks', [])
+    ]
+
+    factor = new_minutes / old_minutes if old_minutes else 1
+    weekly_roadmap = []
+    for week in content.get('weekly_roadmap', []):
+        hours = week.get('estimated_hours')
+        if isinstance(hours, (int, float)):
+            week = dict(week, estimated_hours=round(hours * factor, 1))
+        weekly_roadmap.append(week)
+
+    return {'weekly_roadmap': weekly_roadmap, 'daily_tasks': daily_tasks}
+
+
+def source_weeks(old_weeks: int, new_weeks: int) -> List[range]:
+    """For each new week, the old weeks (0-based) whose content it takes over"""
+    sources = []
+    for week in range(new_weeks):
+        start = week * old_weeks // new_weeks
+        sources.append(range(start, max((week + 1) * old_weeks // new_weeks, start + 1)))
+    return sources
+
+
+def remap_roadmap(roadmap: List[Dict[str, Any]], weeks: int, days: int, daily_minutes: int) -> List[Dict[str, Any]]:
+    """Stretch or squeeze the roadmap onto ``weeks`` weeks, keeping each week's focus and topics"""
+    remapped = []
+    for week, sources in enumerate(source_weeks(len(roadmap), weeks)):
+        merged = [roadmap[index] for index in sources]
+        topics = []
+        for entry in merged:
+            topics.extend(topic for topic in entry.get('topics') or [] if topic not in topics)
+        focus = '; '.join(dict.fromkeys(str(entry['focus']) for entry in merged if entry.get('focus')))
+        remapped.append(dict(
+            merged[0],
+            week=week + 1,
+            focus=focus,
+            topics=topics,
+            estimated_hours=round(min(7, days - week * 7) * daily_minutes / 60, 1),
+        ))
+    return remapped
+
+
+def remap_checkpoints(checkpoints: List[Dict[str, Any]], old_weeks: int, new_weeks: int) -> List[Dict[str, Any]]:
+    """Move checkpoints to the same point of the new schedule; ones landing on the same week are merged"""
+    remapped = {}
+    for checkpoint in checkpoints:
+        week = checkpoint.get('week')
+        if not isinstance(week, int):
+            continue
+        week = min(new_weeks, max(1, round(week * new_weeks / old_weeks)))
+        earlier = remapped.get(week, {}).get('topics_covered') or []
+        covered = earlier + [topic for topic in checkpoint.get('topics_covered') or [] if topic not in earlier]
+        remapped[week] = dict(checkpoint, week=week, topics_covered=covered) if covered else dict(checkpoint, week=week)
+    return [remapped[week] for week in sorted(remapped)]
+
+
+def remap_daily_tasks(
+    daily_tasks: List[Dict[str, Any]],
+    old_weeks: int,
+    new_weeks: int,
+    days: int,
+    daily_minutes: int
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Fill the days of the new schedule with the days of the old weeks each
+    new week took over, fitted to ``daily_minutes``. Returns None when an
+    old week has no days to take.
+    """
+    by_week: Dict[int, List[Dict[str, Any]]] = {}
+    for day in daily_tasks:
+        if isinstance(day.get('day'), int):
+            by_week.setdefault(day.get('week') or (day['day'] - 1) // 7 + 1, []).append(day)
+
+    remapped = []
+    for week, sources in enumerate(source_weeks(old_weeks, new_weeks)):
+        pool = [day for index in sources for day in by_week.get(index + 1, [])]
+        if not pool:
+            return None
+        week_days = min(7, days - week * 7)
+        for offset in range(week_days):
+            # Sample evenly from a longer pool, cycle through a shorter one
+            day = pool[offset * len(pool) // week_days if len(pool) > week_days else offset % len(pool)]
+            remapped.append(dict(
+                day,
+                day=week * 7 + offset + 1,
+                week=week + 1,
+                tasks=fit_day_to_budget(day.get('tasks', []), daily_minutes),
+            ))
+    return remapped
+
+
+def reschedule_deadline(content: Dict[str, Any], params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Remap the roadmap, checkpoints and (unless deferred) daily tasks of a
+    plan onto the number of weeks until the new deadline. Only estimated
+    hours and task durations are recomputed; the model-authored focus,
+    topics and checkpoints are kept. Returns None when the plan has no
+    roadmap to remap.
+    """
+    roadmap = [entry for entry in content.get('weekly_roadmap') or [] if isinstance(entry, dict)]
+    if not roadmap:
+        return None
+
+    days = plan_days(params.get('deadline'))
+    weeks = math.ceil(days / 7)
+    daily_minutes = params['daily_minutes']
+    remapped = {
+        'weekly_roadmap': remap_roadmap(roadmap, weeks, days, daily_minutes),
+        'checkpoints': remap_checkpoints(content.get('checkpoints') or [], len(roadmap), weeks),
+    }
+    if not content.get('daily_tasks_deferred'):
+        daily_tasks = remap_daily_tasks(content.get('daily_tasks') or [], len(roadmap), weeks, days, daily_minutes)
+        if daily_tasks is None:
+            return None
+        remapped['daily_tasks'] = daily_tasks
+    return remapped
+
+
+def regenerate_incrementally(
+    previous_content: Dict[str, Any],
+    previous_params: Dict[str, Any],
+    params: Dict[str, Any]
+) -> Optional[Dict[str, Any]]:
+    """
+    Build the new plan from the previous one when only schedule inputs changed.
+
+    Returns None when a full regeneration is needed: unknown previous
+    inputs, changes to what is studied, or no change at all (an explicit
+    request for a fresh plan). No model call is made either way.
+    """
+    if not previous_params or not previous_content:
+        return None
+
+    changed = changed_params(previous_params, params)
+    if not changed or any(name not in SCHEDULE_PARAMS for name in changed):
+        return None
+
+    plan = dict(previous_content)
+    if 'deadline' in changed:
+        # The number of weeks changes: stretch or squeeze the existing weeks onto the new schedule
+        remapped = reschedule_deadline(previous_content, params)
+        if remapped is None:
+            # Nothing to remap: lay the same topics out over the new schedule
+            scheduled = schedule_plan(
+                **{key: params.get(key) for key in GENERATION_PARAMS if key != 'preferred_language'},
+                topics=previous_content.get('topics')
+            )
+            remapped = {name: scheduled[name] for name in ('weekly_roadmap', 'daily_tasks', 'checkpoints')}
+            if previous_content.get('daily_tasks_deferred'):
+                # Daily tasks are generated per week on request
+                del remapped['daily_tasks']
+        plan.update(remapped)
+        regenerated = list(remapped)
+    else:
+        plan.update(reschedule_daily_minutes(previous_content, previous_params['daily_minutes'], params['daily_minutes']))
+        regenerated = ['weekly_roadmap', 'daily_tasks']
+
+    plan['regenerated_sections'] = regenerated
+    logger.info(f"Incremental regeneration ({', '.join(changed)} changed): rebuilt {', '.join(regenerated)}")
+    return plan
@@ -0,0 +1,328 @@
+"""
+Background plan generation jobs
+
+Views enqueue a PlanGenerationJob and return immediately; the
+``run_plan_worker`` management command claims pending jobs and runs
+``generate_study_plan`` outside the request/response cycle.
+"""
+import logging
+import os
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Plan, PlanVersion, PlanGenerationJob
+
+logger = logging.getLogger(__name__)
+
+# Keys of PlanGenerationJob.params that are passed to generate_study_plan
+GENERATION_PARAMS = (
+    'goal_text', 'current_level', 'daily_minutes', 'deadline',
+    'focus_areas', 'preferred_resources', 'preferred_language',
+)
+
+
+def create_plan_params(validated_data, profile):
+    """Resolve generation parameters for a new plan from request data and profile"""
+    deadline = validated_data.get('deadline')
+    
+    # Get profile data or use provided values
+    return {
+        'title': validated_data['title'],
+        'goal_text': validated_data['goal_text'],
+        'deadline': str(deadline) if deadline else None,
+        'current_level': validated_data.get('current_level') or (profile.current_level if profile else 'beginner'),
+        'daily_minutes': validated_data.get('daily_minutes') or (profile.daily_minutes if profile else 30),
+        'focus_areas': validated_data.get('focus_areas') or (profile.focus_areas if profile else []),
+        'preferred_resources': validated_data.get('preferred_resources') or (profile.preferred_resources if profile else []),
+        'preferred_language': profile.preferred_language if profile else 'en',
+    }
+
+
+def regenerate_plan_params(plan, validated_data, profile):
+    """Resolve generation parameters for regenerating a plan, falling back to existing values"""
+    deadline = validated_data.get('deadline') or plan.deadline
+    
+    if profile:
+        default_level = profile.current_level
+    else:
+        latest = plan.versions.first()
+        default_level = latest.content_json.get('current_level', 'beginner') if latest else 'beginner'
+    
+    return {
+        'goal_text': plan.goal_text,
+        'deadline': str(deadline) if deadline else None,
+        'current_level': validated_data.get('current_level') or default_level,
+        'daily_minutes': validated_data.get('daily_minutes') or (profile.daily_minutes if profile else 30),
+        'focus_areas': validated_data.get('focus_areas') or (profile.focus_areas if profile else []),
+        'preferred_resources': validated_data.get('preferred_resources') or (profile.preferred_resources if profile else []),
+        'preferred_language': profile.preferred_language if profile else 'en',
+    }
+
+
+def enqueue_plan_job(user, kind: str, params: Dict[str, Any], plan: Optional[Plan] = None) -> PlanGenerationJob:
+    """Queue a plan generation job for the worker"""
+    return PlanGenerationJob.objects.create(user=user, plan=plan, kind=kind, params=params)
+
+
+def save_plan_version(plan: Plan, plan_content: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> PlanVersion:
+    """Store generated content as the next version of a plan"""
+    latest_version = plan.versions.order_by('-version_number').first()
+    next_version = (latest_version.version_number + 1) if latest_version else 1
+
+    # Telemetry goes to its own columns, not into the content
+    content = {key: value for key, value in plan_content.items() if key != 'telemetry'}
+    telemetry = plan_content.get('telemetry') or {}
+    return PlanVersion.objects.create(
+        plan=plan,
+        version_number=next_version,
+        content_json=content,
+        prompt_used=plan_content.get('prompt_used', ''),
+        model_used=plan_content.get('model_used', 'mock-mode'),
+        generation_params={key: params.get(key) for key in GENERATION_PARAMS} if params else {},
+        source=telemetry.get('source', ''),
+        prompt_tokens=telemetry.get('prompt_tokens'),
+        completion_tokens=telemetry.get('completion_tokens'),
+        latency_ms=telemetry.get('latency_ms'),
+        retries=telemetry.get('retries') or 0
+    )
+
+
+def create_plan(user, params: Dict[str, Any], plan_content: Dict[str, Any]) -> Plan:
+    """Create a new active plan with its first version"""
+    with transaction.atomic():
+        plan = Plan.objects.create(
+            user=user,
+            title=params['title'],
+            goal_text=params['goal_text'],
+            deadline=params.get('deadline'),
+            is_active=True  # New plan is active by default
+        )
+        save_plan_version(plan, plan_content, params)
+    return plan
+
+
+def claim_jobs(worker_id: str, limit: int) -> List[PlanGenerationJob]:
+    """
+    Atomically move up to ``limit`` pending jobs to running.
+
+    The conditional UPDATE makes claiming safe when several worker
+    processes poll the same table.
+    """
+    claimed = []
+    if limit <= 0:
+        return claimed
+
+    candidate_ids = list(
+        PlanGenerationJob.objects.filter(status='pending')
+        .order_by('created_at')
+        .values_list('id', flat=True)[:limit]
+    )
+    for job_id in candidate_ids:
+        updated = PlanGenerationJob.objects.filter(id=job_id, status='pending').update(
+            status='running',
+            worker_id=worker_id,
+            started_at=timezone.now()
+        )
+        if updated:
+            claimed.append(PlanGenerationJob.objects.select_related('user', 'plan').get(id=job_id))
+    return claimed
+
+
+def requeue_stale_jobs(max_age_seconds: int) -> int:
+    """Return jobs stuck in running (e.g. after a worker crash) to the queue"""
+    cutoff = timezone.now() - timedelta(seconds=max_age_seconds)
+    return PlanGenerationJob.objects.filter(status='running', started_at__lt=cutoff).update(
+        status='pending',
+        worker_id='',
+        started_at=None
+    )
+
+
+def generate_for_job(job: PlanGenerationJob, generate: Optional[Callable[..., Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """Call the generator with the job's stored parameters"""
+    if job.kind == 'expand_week':
+        from .weeks import generate_week_days, stored_week
+        version = PlanVersion.objects.get(pk=job.params['version'])
+        # A retried or duplicate job finds the week already stored
+        days = stored_week(version, job.params['week'])
+        return {'daily_tasks': days if days is not None else generate_week_days(version, job.params['week'])}
+
+    kwargs = {key: job.params.get(key) for key in GENERATION_PARAMS}
+    if generate is not None:
+        # An explicit regenerate asks for a fresh plan, not the cached one
+        return generate(**kwargs, use_cache=job.kind == 'create')
+
+    from .services import generate_study_plan, regenerate_study_plan
+    if job.kind in ('regenerate', 'speculative'):
+        return regenerate_study_plan(job.plan.versions.first(), **kwargs)
+    return generate_study_plan(**kwargs)
+
+
+def _unchanged(job: PlanGenerationJob):
+    """
+    The job's row while it is still as this caller got it: a job
+    requeued as stale and claimed again has a new status, worker or start
+    """
+    return PlanGenerationJob.objects.filter(
+        pk=job.pk, status=job.status, worker_id=job.worker_id, started_at=job.started_at
+    )
+
+
+def complete_job(job: PlanGenerationJob, plan_content: Dict[str, Any]) -> PlanGenerationJob:
+    """
+    Persist generated content for a job and mark it done
+
+    The result is dropped if the job was requeued while it ran; whoever
+    holds it now persists their own result.
+    """
+    params = job.params
+    with transaction.atomic():
+        # Locked so a requeue cannot slip in between the check and the writes
+        kind = _unchanged(job).select_for_update().values_list('kind', flat=True).first()
+        if kind is None:
+            logger.warning(f"Plan generation job {job.id} was requeued while it ran; dropping its result")
+            return PlanGenerationJob.objects.get(pk=job.pk)
+        # A regenerate request may have adopted a speculative job while it ran
+        job.kind = kind
+
+        if job.kind == 'create':
+            plan = create_plan(job.user, params, plan_content)
+            version = plan.versions.first()
+        elif job.kind == 'expand_week':
+            from .weeks import save_week
+            plan = job.plan
+            version = PlanVersion.objects.get(pk=params['version'])
+            save_week(version, params['week'], plan_content['daily_tasks'])
+        elif job.kind == 'speculative':
+            # Kept on the job until a matching regenerate adopts it
+            plan = job.plan
+            version = None
+            job.result_json = plan_content
+        else:
+            plan = job.plan
+            version = save_plan_version(plan, plan_content, params)
+
+            # Update plan if deadline changed
+            if params.get('deadline'):
+                plan.deadline = params['deadline']
+                plan.save()
+
+        job.plan = plan
+        job.version = version
+        job.status = 'done'
+        job.finished_at = timezone.now()
+        job.save(update_fields=['plan', 'version', 'result_json', 'status', 'finished_at'])
+    return job
+
+
+def fail_job(job: PlanGenerationJob, error: Exception) -> PlanGenerationJob:
+    """Mark a job failed with the error that stopped it"""
+    logger.error(f"Plan generation job {job.id} failed: {error}")
+    finished_at = timezone.now()
+    if not _unchanged(job).update(status='failed', error=str(error), finished_at=finished_at):
+        logger.warning(f"Plan generation job {job.id} was requeued while it ran; not marking it failed")
+        return PlanGenerationJob.objects.get(pk=job.pk)
+    job.status = 'failed'
+    job.error = str(error)
+    job.finished_at = finished_at
+    return job
+
+
+def run_job(job: PlanGenerationJob, generate: Optional[Callable[..., Dict[str, Any]]] = None) -> PlanGenerationJob:
+    """Generate the plan for a claimed job and persist the resulting version"""
+    try:
+        return complete_job(job, generate_for_job(job, generate))
+    except Exception as e:
+        return fail_job(job, e)
+
+
+def run_pending_jobs(generate: Optional[Callable[..., Dict[str, Any]]] = None, worker_id: str = 'inline') -> int:
+    """Process every pending job on the current thread"""
+    processed = 0
+    while True:
+        jobs = claim_jobs(worker_id, 1)
+        if not jobs:
+            return processed
+        run_job(jobs[0], generate=generate)
+        processed += 1
+
+
+class PlanWorker:
+    """
+    Polls the job table and runs up to ``concurrency`` generations at once.
+
+    Each generation runs on its own thread so a slow upstream call only
+    occupies one slot of this worker.
+    """
+
+    def __init__(
+        self,
+        concurrency: Optional[int] = None,
+        poll_interval: Optional[float] = None,
+        generate: Optional[Callable[..., Dict[str, Any]]] = None,
+        requeue_interval: Optional[float] = None
+    ):
+        self.concurrency = concurrency or settings.PLAN_WORKER_CONCURRENCY
+        self.poll_interval = poll_interval if poll_interval is not None else settings.PLAN_WORKER_POLL_INTERVAL
+        self.requeue_interval = (
+            requeue_interval if requeue_interval is not None else settings.PLAN_WORKER_REQUEUE_INTERVAL
+        )
+        self.generate = generate
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.processed = 0
+        self._requeued_at = None
+
+    def _requeue_stale(self):
+        """Return jobs abandoned by crashed workers to the queue, at most every requeue_interval seconds"""
+        now = time.monotonic()
+        if self._requeued_at is not None and now - self._requeued_at < self.requeue_interval:
+            return
+        self._requeued_at = now
+        requeued = requeue_stale_jobs(settings.PLAN_JOB_STALE_AFTER)
+        if requeued:
+            logger.warning(f"Requeued {requeued} stale plan generation jobs")
+
+    def _generate(self, job: PlanGenerationJob) -> Dict[str, Any]:
+        try:
+            return generate_for_job(job, self.generate)
+        finally:
+            # Worker threads own their connections
+            connection.close()
+
+    def _finish(self, job: PlanGenerationJob, future):
+        try:
+            complete_job(job, future.result())
+        except Exception as e:
+            fail_job(job, e)
+        self.processed += 1
+
+    def run(self, burst: bool = False) -> int:
+        """Process jobs until interrupted, or until the queue is empty in burst mode"""
+        # Upstream calls run on the pool; claiming and persisting stay on
+        # this thread so the worker holds a single database connection.
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                # Other workers can crash at any time, not just before this one starts
+                self._requeue_stale()
+                for job in claim_jobs(self.worker_id, self.concurrency - len(in_flight)):
+                    in_flight[executor.submit(self._generate, job)] = job
+
+                if not in_flight:
+                    if burst:
+                        break
+                    time.sleep(self.poll_interval)
+                    continue
+
+                done, _ = wait(in_flight, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish(in_flight.pop(future), future)
+
+        return self.processed
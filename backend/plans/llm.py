@@ -0,0 +1,250 @@
+"""
+LLM backends and the process-wide OpenAI client
+
+Plan generation talks to the model through the backend selected by
+PLAN_LLM_BACKEND:
+
+- ``openai``: the OpenAI API (or any compatible OPENAI_BASE_URL)
+- ``stub``: the bundled local chat completions server, started in this
+  process on first use, with PLAN_STUB_* latency, error and token speed
+- ``mock``: no model at all; plans come from the local scheduler
+
+PLAN_LLM_CASSETTE_MODE records the responses of the backend, or replays
+them instead of calling it (see plans.cassette).
+
+The OpenAI client and its HTTP connection pool are built on first use
+and then reused by every generation in the process, so calls after the
+first skip client construction and TLS setup.
+"""
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .telemetry import count_attempt
+
+logger = logging.getLogger(__name__)
+
+# Try to import OpenAI, but handle gracefully if not available
+try:
+    import httpx
+    from openai import OpenAI
+    OPENAI_AVAILABLE = True
+except ImportError:
+    OPENAI_AVAILABLE = False
+    logger.warning("OpenAI library not available. Running in mock mode.")
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def build_timeout() -> 'httpx.Timeout':
+    """Per-phase HTTP timeouts from settings"""
+    return httpx.Timeout(
+        connect=settings.OPENAI_CONNECT_TIMEOUT,
+        read=settings.OPENAI_READ_TIMEOUT,
+        write=settings.OPENAI_WRITE_TIMEOUT,
+        pool=settings.OPENAI_POOL_TIMEOUT
+    )
+
+
+def build_openai_client(api_key: Optional[str] = None, base_url: Optional[str] = None) -> 'OpenAI':
+    """Create an OpenAI client with a keep-alive connection pool"""
+    timeout = build_timeout()
+    http_client = httpx.Client(
+        timeout=timeout,
+        event_hooks={'request': [count_attempt]},  # Counts retries for telemetry
+        limits=httpx.Limits(
+            max_connections=settings.OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY
+        )
+    )
+    return OpenAI(
+        api_key=api_key or settings.OPENAI_API_KEY,
+        base_url=base_url or settings.OPENAI_BASE_URL or None,
+        timeout=timeout,
+        max_retries=settings.OPENAI_MAX_RETRIES,
+        http_client=http_client
+    )
+
+
+def get_openai_client() -> 'OpenAI':
+    """
+    Return the client for this process, building it on first use.
+
+    The process id is checked so a client created before a fork (e.g. by
+    gunicorn --preload) is never shared with the child's sockets.
+    """
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                _client = build_openai_client()
+                _client_pid = pid
+    return _client
+
+
+def reset_openai_client():
+    """Close and drop the cached client (e.g. after changing settings)"""
+    global _client, _client_pid
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        _client_pid = None
+
+
+class LLMBackend(ABC):
+    """
+    Interface of a model backend
+
+    ``create_completion`` takes the keyword arguments of
+    ``chat.completions.create`` and returns an object shaped like the
+    OpenAI response (or, with ``stream=True``, an iterable of chunks).
+    A backend missing either method cannot be instantiated.
+    """
+    name = ''
+
+    @abstractmethod
+    def is_available(self) -> bool:
+        """Whether plans can be generated with this backend right now"""
+
+    @abstractmethod
+    def create_completion(self, **request) -> Any:
+        """Make one chat completion request"""
+
+    def close(self):
+        """Release connections or servers held by the backend"""
+
+
+class OpenAIBackend(LLMBackend):
+    """The OpenAI API, through the process-wide client"""
+    name = 'openai'
+
+    def is_available(self) -> bool:
+        return OPENAI_AVAILABLE and bool(settings.OPENAI_API_KEY)
+
+    def create_completion(self, **request) -> Any:
+        return get_openai_client().chat.completions.create(**request)
+
+    def close(self):
+        reset_openai_client()
+
+
+class StubBackend(LLMBackend):
+    """
+    The bundled stub server, run on a background thread of this process
+
+    The real OpenAI client talks to it over HTTP, so the whole request
+    path is exercised without network access or token costs.
+    """
+    name = 'stub'
+
+    def __init__(self):
+        self._server = None
+        self._client = None
+        self._lock = threading.Lock()
+
+    def is_available(self) -> bool:
+        return OPENAI_AVAILABLE
+
+    def start(self):
+        """Start the stub server unless it is running; returns the server"""
+        from .stub_server import StubLLMServer
+        with self._lock:
+            if self._server is None:
+                server = StubLLMServer(
+                    latency=settings.PLAN_STUB_LATENCY,
+                    token_delay=settings.PLAN_STUB_TOKEN_DELAY,
+                    prompt_token_delay=settings.PLAN_STUB_PROMPT_TOKEN_DELAY,
+                    error_rate=settings.PLAN_STUB_ERROR_RATE,
+                    model_latency=settings.PLAN_STUB_MODEL_LATENCY
+                ).start()
+                self._client = build_openai_client(api_key='stub', base_url=server.url)
+                self._server = server
+                logger.info(f"Started LLM stub server at {server.url}")
+        return self._server
+
+    def create_completion(self, **request) -> Any:
+        if self._server is None:
+            self.start()
+        return self._client.chat.completions.create(**request)
+
+    def close(self):
+        with self._lock:
+            if self._server is not None:
+                self._client.close()
+                self._server.stop()
+            self._server = None
+            self._client = None
+
+
+class MockBackend(LLMBackend):
+    """No model: every plan is built by the local scheduler"""
+    name = 'mock'
+
+    def is_available(self) -> bool:
+        return False
+
+    def create_completion(self, **request) -> Any:
+        raise RuntimeError("The mock backend has no model; plans come from the local scheduler")
+
+
+LLM_BACKENDS = {backend.name: backend for backend in (OpenAIBackend, StubBackend, MockBackend)}
+
+CASSETTE_MODES = ('', 'record', 'replay')
+
+_backends: Dict[tuple, LLMBackend] = {}
+
+
+def build_llm_backend() -> LLMBackend:
+    """
+    The backend selected by PLAN_LLM_BACKEND, wrapped to record its
+    responses or replaced by their replay per PLAN_LLM_CASSETTE_MODE
+    """
+    from .cassette import Cassette, RecordingBackend, ReplayBackend
+
+    name = settings.PLAN_LLM_BACKEND
+    mode = settings.PLAN_LLM_CASSETTE_MODE
+    if name not in LLM_BACKENDS:
+        raise ImproperlyConfigured(f"Unknown PLAN_LLM_BACKEND '{name}'; choose one of {', '.join(LLM_BACKENDS)}")
+    if mode not in CASSETTE_MODES:
+        raise ImproperlyConfigured(f"Unknown PLAN_LLM_CASSETTE_MODE '{mode}'; use record, replay or leave it empty")
+
+    if mode == 'replay':
+        return ReplayBackend(Cassette(settings.PLAN_LLM_CASSETTE_PATH), latency=settings.PLAN_LLM_CASSETTE_REPLAY_LATENCY)
+    backend = LLM_BACKENDS[name]()
+    if mode == 'record':
+        return RecordingBackend(backend, Cassette(settings.PLAN_LLM_CASSETTE_PATH))
+    return backend
+
+
+def get_llm_backend() -> LLMBackend:
+    """The backend for the current settings, one instance per process"""
+    key = (
+        settings.PLAN_LLM_BACKEND,
+        settings.PLAN_LLM_CASSETTE_MODE,
+        str(settings.PLAN_LLM_CASSETTE_PATH),
+        settings.PLAN_LLM_CASSETTE_REPLAY_LATENCY,
+    )
+    if key not in _backends:
+        backend = build_llm_backend()
+        with _client_lock:
+            _backends.setdefault(key, backend)
+    return _backends[key]
+
+
+def reset_llm_backends():
+    """Close every backend instance (e.g. after changing settings)"""
+    with _client_lock:
+        backends = list(_backends.values())
+        _backends.clear()
+    for backend in backends:
+        backend.close()
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from plans.benchmarks import BENCHMARKS
+
+
+class Command(BaseCommand):
+    """Run plan generation benchmarks against the local LLM stub"""
+    help = 'Benchmark parts of the plan generation path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=sorted(BENCHMARKS), help='Benchmark to run')
+        parser.add_argument('--calls', type=int, help='Number of measured calls (default depends on the benchmark)')
+
+    def handle(self, *args, **options):
+        kwargs = {'calls': options['calls']} if options['calls'] else {}
+        results = BENCHMARKS[options['benchmark']](**kwargs)
+        for name, stats in results.items():
+            if isinstance(stats, dict):
+                formatted = ', '.join(f'{key}={value:.2f}' for key, value in stats.items())
+            else:
+                formatted = stats
+            self.stdout.write(f'{name}: {formatted}')
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from plans.stub_server import StubLLMServer
+
+
+class Command(BaseCommand):
+    """Serve the bundled OpenAI-compatible stub for load tests (point OPENAI_BASE_URL at it)"""
+    help = 'Run the local chat completions stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+        parser.add_argument('--port', type=int, default=8001, help='Port to listen on')
+        parser.add_argument(
+            '--latency',
+            default=settings.PLAN_STUB_LATENCY,
+            help='Seconds or a distribution: fixed:S, uniform:A,B, normal:MEAN,SD, lognormal:MEDIAN,SIGMA, exponential:MEAN'
+        )
+        parser.add_argument(
+            '--model-latency',
+            action='append',
+            default=[],
+            metavar='MODEL=LATENCY',
+            help='Latency for requests to one model (repeatable)'
+        )
+        parser.add_argument(
+            '--token-delay',
+            type=float,
+            default=settings.PLAN_STUB_TOKEN_DELAY,
+            help='Extra seconds per completion token'
+        )
+        parser.add_argument(
+            '--prompt-token-delay',
+            type=float,
+            default=settings.PLAN_STUB_PROMPT_TOKEN_DELAY,
+            help='Extra seconds per prompt token before the first token'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=settings.PLAN_STUB_ERROR_RATE,
+            help='Share of requests answered with --error-status'
+        )
+        parser.add_argument('--error-status', type=int, default=500, help='HTTP status of failed requests')
+        parser.add_argument('--seed', type=int, help='Random seed for repeatable latencies and failures')
+
+    def handle(self, *args, **options):
+        model_latency = {}
+        for spec in options['model_latency']:
+            model, separator, latency = spec.partition('=')
+            if not separator:
+                raise CommandError(f"--model-latency expects MODEL=LATENCY, got '{spec}'")
+            model_latency[model] = latency
+
+        server = StubLLMServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            token_delay=options['token_delay'],
+            prompt_token_delay=options['prompt_token_delay'],
+            error_rate=options['error_rate'],
+            error_status=options['error_status'],
+            seed=options['seed'],
+            model_latency=model_latency
+        )
+        self.stdout.write(f"LLM stub listening on {server.url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        self.stdout.write(self.style.SUCCESS(f"Served {server.requests} requests ({server.errors} failed)"))
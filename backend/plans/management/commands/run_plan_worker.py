@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from plans.jobs import PlanWorker
+
+
+class Command(BaseCommand):
+    """Run the background worker that processes plan generation jobs"""
+    help = 'Process queued plan generation jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.PLAN_WORKER_CONCURRENCY,
+            help='Maximum number of generations running at once in this worker'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.PLAN_WORKER_POLL_INTERVAL,
+            help='Seconds to wait between queue polls'
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling forever'
+        )
+
+    def handle(self, *args, **options):
+        worker = PlanWorker(
+            concurrency=options['concurrency'],
+            poll_interval=options['poll_interval']
+        )
+        self.stdout.write(f"Plan worker {worker.worker_id} started (concurrency={worker.concurrency})")
+        try:
+            processed = worker.run(burst=options['burst'])
+        except KeyboardInterrupt:
+            processed = worker.processed
+        self.stdout.write(self.style.SUCCESS(f"Processed {processed} jobs"))
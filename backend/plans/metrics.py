@@ -0,0 +1,103 @@
+"""
+Process-independent counters for plan generation metrics
+
+With PLAN_METRICS_FLUSH_INTERVAL set, increments are summed in process
+and written in one batch at most every that many seconds (and at exit),
+so hot counters do not cost an UPDATE on every request. Counts not yet
+written are only visible to get_counters in the process that made them.
+"""
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Dict
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import F
+
+from .models import GenerationCounter
+
+logger = logging.getLogger(__name__)
+
+
+def write_counter(name: str, amount: int):
+    """Add ``amount`` to the named counter row, creating it on first use"""
+    if GenerationCounter.objects.filter(name=name).update(value=F('value') + amount):
+        return
+    try:
+        with transaction.atomic():
+            GenerationCounter.objects.create(name=name, value=amount)
+    except IntegrityError:
+        # Another process created it first
+        GenerationCounter.objects.filter(name=name).update(value=F('value') + amount)
+
+
+class CounterBuffer:
+    """Increments of this process that are not in the database yet"""
+
+    def __init__(self):
+        self._pending: Counter = Counter()
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, name: str, amount: int):
+        with self._lock:
+            self._pending[name] += amount
+            due = time.monotonic() - self._flushed_at >= settings.PLAN_METRICS_FLUSH_INTERVAL
+        # A flush inside a transaction would be lost with it if the caller rolls back
+        if due and not connection.in_atomic_block:
+            self.flush()
+
+    def pending(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """Write the pending increments, one row update per counter"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._flushed_at = time.monotonic()
+        for name, amount in pending.items():
+            try:
+                write_counter(name, amount)
+            except DatabaseError as e:
+                logger.warning(f"Could not write counter {name}: {str(e)}")
+                with self._lock:
+                    self._pending[name] += amount
+
+    def discard(self):
+        """Forget the pending increments"""
+        with self._lock:
+            self._pending.clear()
+
+
+counter_buffer = CounterBuffer()
+
+
+@atexit.register
+def _flush_at_exit():
+    if counter_buffer.pending():
+        try:
+            counter_buffer.flush()
+        except Exception as e:
+            logger.warning(f"Could not write counters at exit: {str(e)}")
+
+
+def increment(name: str, amount: int = 1):
+    """Add ``amount`` to the named counter"""
+    if settings.PLAN_METRICS_FLUSH_INTERVAL > 0:
+        counter_buffer.add(name, amount)
+    else:
+        write_counter(name, amount)
+
+
+def get_counters(prefix: str = '') -> Dict[str, int]:
+    """Return counter values, optionally limited to names starting with ``prefix``"""
+    counters = GenerationCounter.objects.all()
+    if prefix:
+        counters = counters.filter(name__startswith=prefix)
+    values = Counter(dict(counters.values_list('name', 'value')))
+    values.update({name: amount for name, amount in counter_buffer.pending().items() if name.startswith(prefix)})
+    return dict(values)
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0005_circuitbreakerstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planversion',
+            name='generation_params',
+            field=models.JSONField(blank=True, default=dict, help_text='Inputs the content was generated from'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0006_planversion_generation_params'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='plangenerationjob',
+            name='kind',
+            field=models.CharField(choices=[('create', 'Create'), ('regenerate', 'Regenerate'), ('expand_week', 'Expand week')], default='create', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='PlanWeek',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('week', models.PositiveIntegerField()),
+                ('days_json', models.JSONField(help_text='Daily tasks of the week, in the daily_tasks schema')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='weeks', to='plans.planversion')),
+            ],
+            options={
+                'db_table': 'plan_weeks',
+                'ordering': ['week'],
+                'unique_together': {('version', 'week')},
+            },
+        ),
+    ]
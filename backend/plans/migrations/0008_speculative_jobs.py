@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0007_planweek'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plangenerationjob',
+            name='result_json',
+            field=models.JSONField(blank=True, help_text='Content of a speculative job, kept until a regenerate adopts it', null=True),
+        ),
+        migrations.AlterField(
+            model_name='plangenerationjob',
+            name='kind',
+            field=models.CharField(choices=[('create', 'Create'), ('regenerate', 'Regenerate'), ('expand_week', 'Expand week'), ('speculative', 'Speculative regenerate')], default='create', max_length=20),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 02:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('plans', '0008_speculative_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='planversion',
+            name='completion_tokens',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='planversion',
+            name='latency_ms',
+            field=models.IntegerField(blank=True, help_text='Wall-clock time of the upstream calls', null=True),
+        ),
+        migrations.AddField(
+            model_name='planversion',
+            name='prompt_tokens',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='planversion',
+            name='retries',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='planversion',
+            name='source',
+            field=models.CharField(blank=True, choices=[('llm', 'LLM'), ('cache', 'Cache'), ('fallback', 'Fallback'), ('incremental', 'Incremental')], default='', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='planversion',
+            index=models.Index(fields=['created_at', 'model_used'], name='plan_versio_created_7f8c62_idx'),
+        ),
+    ]
@@ -1,5 +1,28 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
+
+
+class PlanQuerySet(models.QuerySet):
+    def with_version_summary(self):
+        """
+        Annotate each plan with its version count and the number, model and
+        creation time of its latest version, in the same query; no version
+        content is loaded
+        """
+        versions = PlanVersion.objects.filter(plan=models.OuterRef('pk'))
+        latest = versions.order_by('-version_number')
+        return self.annotate(
+            versions_count=Coalesce(
+                models.Subquery(versions.order_by().values('plan').annotate(count=models.Count('id')).values('count')),
+                0
+            ),
+            latest_version_id=models.Subquery(latest.values('id')[:1]),
+            latest_version_number=models.Subquery(latest.values('version_number')[:1]),
+            latest_model_used=models.Subquery(latest.values('model_used')[:1]),
+            latest_version_created_at=models.Subquery(latest.values('created_at')[:1]),
+        )
 
 
 class Plan(models.Model):
@@ -12,6 +35,8 @@ class Plan(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True, help_text='Whether this is the user\'s current active plan')
     
+    objects = PlanQuerySet.as_manager()
+    
     class Meta:
         db_table = 'plans'
         ordering = ['-created_at']
@@ -24,8 +49,11 @@ class Plan(models.Model):
     
     def save(self, *args, **kwargs):
         # If this plan is set as active, deactivate other plans for the user
+        # (touching updated_at, which their ETags are derived from)
         if self.is_active:
-            Plan.objects.filter(user=self.user, is_active=True).exclude(pk=self.pk).update(is_active=False)
+            Plan.objects.filter(user=self.user, is_active=True).exclude(pk=self.pk).update(
+                is_active=False, updated_at=timezone.now()
+            )
         super().save(*args, **kwargs)
 
 
@@ -36,6 +64,20 @@ class PlanVersion(models.Model):
     content_json = models.JSONField(help_text='Structured plan content: weekly roadmap, daily tasks, topics, resources, checkpoints')
     prompt_used = models.TextField(help_text='The prompt sent to OpenAI')
     model_used = models.CharField(max_length=50, default='gpt-4-turbo-preview')
+    generation_params = models.JSONField(default=dict, blank=True, help_text='Inputs the content was generated from')
+    
+    # Generation telemetry; empty source means the version predates it
+    SOURCE_CHOICES = [
+        ('llm', 'LLM'),
+        ('cache', 'Cache'),
+        ('fallback', 'Fallback'),
+        ('incremental', 'Incremental'),
+    ]
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, blank=True, default='')
+    prompt_tokens = models.IntegerField(null=True, blank=True)
+    completion_tokens = models.IntegerField(null=True, blank=True)
+    latency_ms = models.IntegerField(null=True, blank=True, help_text='Wall-clock time of the upstream calls')
+    retries = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -44,7 +86,167 @@ class PlanVersion(models.Model):
         unique_together = ['plan', 'version_number']
         indexes = [
             models.Index(fields=['plan', '-created_at']),
+            models.Index(fields=['created_at', 'model_used']),
         ]
     
     def __str__(self):
         return f"Plan {self.plan.id} - Version {self.version_number}"
+    
+    def save(self, *args, **kwargs):
+        # A new version changes the plan as listed (touching updated_at, which its ETags are derived from)
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        if adding:
+            Plan.objects.filter(pk=self.plan_id).update(updated_at=timezone.now())
+
+
+class PlanWeek(models.Model):
+    """Daily tasks of one week of a plan version, generated the first time the week is requested"""
+    version = models.ForeignKey(PlanVersion, on_delete=models.CASCADE, related_name='weeks')
+    week = models.PositiveIntegerField()
+    days_json = models.JSONField(help_text='Daily tasks of the week, in the daily_tasks schema')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'plan_weeks'
+        ordering = ['week']
+        unique_together = ['version', 'week']
+
+    def __str__(self):
+        return f"Version {self.version_id} - Week {self.week}"
+
+
+class PlanGenerationJob(models.Model):
+    """Queued plan generation processed by the plan worker"""
+    KIND_CHOICES = [
+        ('create', 'Create'),
+        ('regenerate', 'Regenerate'),
+        ('expand_week', 'Expand week'),
+        ('speculative', 'Speculative regenerate'),
+    ]
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='plan_jobs')
+    plan = models.ForeignKey(Plan, on_delete=models.CASCADE, null=True, blank=True, related_name='generation_jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='create')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    params = models.JSONField(default=dict, help_text='Resolved generation parameters')
+    version = models.ForeignKey(PlanVersion, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    result_json = models.JSONField(null=True, blank=True, help_text='Content of a speculative job, kept until a regenerate adopts it')
+    error = models.TextField(blank=True)
+    worker_id = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'plan_generation_jobs'
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.kind}, {self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('done', 'failed')
+
+
+class PlanCacheEntry(models.Model):
+    """Generated plan content keyed by a hash of the normalized generation inputs"""
+    key = models.CharField(max_length=64, unique=True)
+    model_used = models.CharField(max_length=50)
+    content_json = models.JSONField(help_text='Plan sections returned by the model')
+    hit_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'plan_cache_entries'
+
+    def __str__(self):
+        return f"Cache {self.key[:12]} ({self.model_used})"
+
+
+class GenerationCounter(models.Model):
+    """Named counter for plan generation metrics shared by all processes"""
+    name = models.CharField(max_length=100, unique=True)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'generation_counters'
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name}={self.value}"
+
+
+class GenerationFlight(models.Model):
+    """In-flight upstream generation that identical concurrent requests wait on"""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    key = models.CharField(max_length=64, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    owner = models.CharField(max_length=100, blank=True)
+    result_json = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'generation_flights'
+
+    def __str__(self):
+        return f"Flight {self.key[:12]} ({self.status})"
+
+
+class CircuitBreakerState(models.Model):
+    """Circuit breaker state for an upstream service, shared by all processes"""
+    STATE_CHOICES = [
+        ('closed', 'Closed'),
+        ('open', 'Open'),
+        ('half_open', 'Half-open'),
+    ]
+
+    name = models.CharField(max_length=50, unique=True)
+    state = models.CharField(max_length=20, choices=STATE_CHOICES, default='closed')
+    changed_at = models.DateTimeField(default=timezone.now)
+    window_started_at = models.DateTimeField(default=timezone.now)
+    calls = models.IntegerField(default=0)
+    failures = models.IntegerField(default=0)
+    slow_calls = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'circuit_breakers'
+
+    def __str__(self):
+        return f"{self.name}: {self.state}"
+
+
+class IdempotencyKey(models.Model):
+    """Generation job started by a create or regenerate request, returned again to retries with the same key"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    endpoint = models.CharField(max_length=100)
+    request_hash = models.CharField(max_length=64)
+    job = models.ForeignKey(PlanGenerationJob, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        unique_together = ['user', 'key']
+
+    def __str__(self):
+        return f"{self.key} ({self.endpoint})"
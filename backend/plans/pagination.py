@@ -0,0 +1,57 @@
+"""
+Keyset pagination for lists that grow without bound
+
+Pages continue from the last row of the previous page (an opaque
+``cursor``) instead of an OFFSET, so deep pages cost the same as the
+first, and no COUNT(*) runs. ``?count=estimated`` adds a ``count`` from
+the PostgreSQL planner's row estimate for the query; other databases
+count exactly.
+"""
+import json
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from django.db import DatabaseError, connection
+from rest_framework.pagination import CursorPagination
+
+logger = logging.getLogger(__name__)
+
+
+def estimated_count(queryset) -> Optional[int]:
+    """Rows the planner expects ``queryset`` to return (exact count off PostgreSQL)"""
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    try:
+        plan = json.loads(queryset.order_by().explain(format='json'))
+    except (DatabaseError, ValueError) as e:
+        logger.warning(f"Could not estimate row count: {str(e)}")
+        return None
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination with an opt-in estimated count"""
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'estimated':
+            self.count = estimated_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = OrderedDict([('count', self.count), *response.data.items()])
+        return response
+
+    def get_paginated_response_schema(self, schema):
+        response = super().get_paginated_response_schema(schema)
+        response['properties'] = {'count': {'type': 'integer', 'example': 123}, **response['properties']}
+        return response
+
+
+class PlanPagination(KeysetPagination):
+    """Plans of a user, newest first, along the (user, -created_at) index"""
+    ordering = '-created_at'
@@ -0,0 +1,121 @@
+"""
+Incremental parsing of the plan JSON returned by the model
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+WHITESPACE = ' \t\r\n'
+
+# A comma directly before a closing bracket, e.g. ``[1, 2,]``
+TRAILING_COMMA = re.compile(r',(\s*[\]}])')
+
+
+def loads_lenient(raw: str) -> Any:
+    """json.loads that also accepts trailing commas, a common model slip"""
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        return json.loads(TRAILING_COMMA.sub(r'\1', raw))
+
+
+class SectionParser:
+    """
+    Incremental parser for a top-level JSON object.
+
+    Text is fed in arbitrary chunks (e.g. streamed completion deltas) and
+    every top-level ``key: value`` pair is returned as soon as its value is
+    complete, without waiting for the rest of the document.
+    """
+
+    def __init__(self):
+        self.sections: Dict[str, Any] = {}
+        self._buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._key_start: Optional[int] = None
+        self._key: Optional[str] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume ``chunk`` and return the sections it completed"""
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+
+        while self._pos < len(buffer):
+            pos = self._pos
+            ch = buffer[pos]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._key_start is not None:
+                        self._key = json.loads(buffer[self._key_start:pos + 1])
+                        self._key_start = None
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    if self._key is None:
+                        self._key_start = pos
+                    elif self._value_start is None:
+                        self._value_start = pos
+            elif ch in '{[':
+                if self._depth == 1 and self._key is not None and self._value_start is None:
+                    self._value_start = pos
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 1 and self._value_start is not None:
+                    # A nested object/array value just closed
+                    self._emit(buffer[self._value_start:pos + 1], completed)
+                elif self._depth == 0 and self._value_start is not None:
+                    # Scalar value terminated by the closing brace
+                    self._emit(buffer[self._value_start:pos], completed)
+            elif ch == ',' and self._depth == 1:
+                if self._value_start is not None:
+                    self._emit(buffer[self._value_start:pos], completed)
+            elif (
+                self._depth == 1 and self._key is not None and self._value_start is None
+                and ch not in WHITESPACE and ch != ':'
+            ):
+                # Start of a number, true, false or null
+                self._value_start = pos
+
+        return completed
+
+    def _emit(self, raw: str, completed: List[Tuple[str, Any]]):
+        key = self._key
+        self._key = None
+        self._value_start = None
+        try:
+            value = loads_lenient(raw)
+        except json.JSONDecodeError:
+            return
+        self.sections[key] = value
+        completed.append((key, value))
+
+
+def recover_sections(text: str) -> Dict[str, Any]:
+    """
+    Salvage the complete top-level sections of a truncated or malformed
+    JSON object, e.g. a completion cut off by the token limit.
+
+    Text before the opening brace (such as a markdown code fence) is
+    ignored; sections whose value cannot be decoded are left out.
+    """
+    start = text.find('{')
+    if start == -1:
+        return {}
+    parser = SectionParser()
+    parser.feed(text[start:])
+    return parser.sections
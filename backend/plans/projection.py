@@ -0,0 +1,108 @@
+"""
+Sparse plan payloads
+
+Plan detail accepts ``?fields=`` (top-level fields of the plan),
+``?sections=`` (sections of each version's content) and ``?week=``
+(only the entries of that week in the sections whose entries carry a
+week). On PostgreSQL the requested sections are extracted in the query
+with JSONB operators, so the full content of a version never leaves the
+database; other databases load the content and project it in Python.
+"""
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from django.db import connection
+from django.db.models import Func, JSONField, QuerySet, Value
+from django.db.models.fields.json import KeyTransform
+from rest_framework.exceptions import ValidationError
+
+from .services import PLAN_SECTIONS
+
+# Sections whose entries belong to one week
+WEEKLY_SECTIONS = ('weekly_roadmap', 'daily_tasks', 'checkpoints')
+
+# Entries of the week bound to $week
+WEEK_PATH = '$[*] ? (@.week == $week)'
+
+
+class JSONBPathQueryArray(Func):
+    """PostgreSQL ``jsonb_path_query_array(target, path, vars)``"""
+    function = 'jsonb_path_query_array'
+    arity = 3
+    output_field = JSONField()
+
+    def as_sql(self, compiler, connection, **extra_context):
+        target, path, variables = (compiler.compile(expression) for expression in self.get_source_expressions())
+        sql = f'{self.function}({target[0]}, ({path[0]})::jsonpath, ({variables[0]})::jsonb)'
+        return sql, (*target[1], *path[1], *variables[1])
+
+
+def _parse_list(value: Optional[str], allowed, name: str) -> Optional[Tuple[str, ...]]:
+    if value is None:
+        return None
+    items = tuple(dict.fromkeys(item.strip() for item in value.split(',') if item.strip()))
+    unknown = [item for item in items if item not in allowed]
+    if unknown:
+        raise ValidationError({name: f"Unknown {name}: {', '.join(unknown)}. Must be among {', '.join(allowed)}"})
+    return items
+
+
+@dataclass(frozen=True)
+class Projection:
+    """The parts of a plan a request asked for; None means everything"""
+    fields: Optional[Tuple[str, ...]] = None
+    sections: Optional[Tuple[str, ...]] = None
+    week: Optional[int] = None
+
+    @classmethod
+    def from_request(cls, request, fields) -> 'Projection':
+        """Parse ``fields``, ``sections`` and ``week`` query parameters (400 on invalid values)"""
+        params = request.query_params
+        week = params.get('week')
+        if week is not None:
+            try:
+                week = int(week)
+            except ValueError:
+                raise ValidationError({'week': 'Must be a week number.'})
+        sections = _parse_list(params.get('sections'), PLAN_SECTIONS, 'sections')
+        if week is not None and sections is None:
+            sections = PLAN_SECTIONS
+        return cls(_parse_list(params.get('fields'), fields, 'fields'), sections, week)
+
+    @property
+    def projects_content(self) -> bool:
+        return self.sections is not None
+
+    def includes(self, field: str) -> bool:
+        return self.fields is None or field in self.fields
+
+    def versions(self, queryset: QuerySet) -> QuerySet:
+        """Versions with only the requested sections of their content, extracted in the query on PostgreSQL"""
+        if not self.projects_content or connection.vendor != 'postgresql':
+            return queryset
+        return queryset.defer('content_json', 'prompt_used').annotate(**{
+            f'section_{name}': self._section_expression(name) for name in self.sections
+        })
+
+    def _section_expression(self, name: str):
+        section = KeyTransform(name, 'content_json')
+        if self.week is None or name not in WEEKLY_SECTIONS:
+            return section
+        return JSONBPathQueryArray(section, Value(WEEK_PATH), Value(json.dumps({'week': self.week})))
+
+    def content(self, version) -> Dict[str, Any]:
+        """The projected content of a version fetched through versions()"""
+        if not self.projects_content:
+            return version.content_json
+        # Sections annotated by versions() were already extracted (and filtered by week) in the query
+        extracted = f'section_{self.sections[0]}' in version.__dict__
+        projected = {}
+        for name in self.sections:
+            value = getattr(version, f'section_{name}') if extracted else version.content_json.get(name)
+            if value is None:
+                continue
+            if not extracted and self.week is not None and name in WEEKLY_SECTIONS and isinstance(value, list):
+                value = [entry for entry in value if isinstance(entry, dict) and entry.get('week') == self.week]
+            projected[name] = value
+        return projected
@@ -0,0 +1,220 @@
+"""
+Compact, token-budgeted plan prompts
+
+The prompts built by ``build_prompt`` carry a pretty-printed example of
+every section. With PLAN_PROMPT_COMPACT the same prompts are compiled
+instead: each section's example is reduced once, at import time, to a
+one-line type signature (``{"week":int,"topics":[str]}``), and the
+instructions are terse. Tokens are counted locally and, above
+PLAN_PROMPT_TOKEN_BUDGET, context sections are trimmed, entries
+furthest from the requested weeks first. The user's inputs (goal,
+level, time, deadline, focus areas, preferred resources) and the schema
+are never trimmed: a prompt still over budget is sent whole and its
+overrun is reported.
+"""
+import json
+import logging
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Pre-tokenization close to OpenAI's cl100k encoding: words, up to three digits, punctuation runs, whitespace
+_PIECES = re.compile(r"""'(?:[sdmt]|ll|ve|re)| ?[^\W\d_]+| ?\d{1,3}| ?[^\s\w]+|_+|\s+""")
+
+# Characters per token of compact plan JSON, measured with count_tokens on scheduled plans
+JSON_CHARS_PER_TOKEN = 3.7
+
+# Tokens added per chat message and to prime the reply
+MESSAGE_OVERHEAD = 3
+REPLY_OVERHEAD = 3
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate number of model tokens in ``text``
+
+    Common words and short numbers are one token; long words are split
+    every eight letters and punctuation runs every two characters. Close
+    enough to budget prompts without a tokenizer download.
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        word = piece.strip()
+        if not word:
+            tokens += 1 if piece == ' ' or '\n' in piece else 0
+        elif word[0].isalpha():
+            tokens += math.ceil(len(word) / 8)
+        elif word[0].isdigit() or word[0] == '_':
+            tokens += 1
+        else:
+            tokens += math.ceil(len(word) / 2)
+    return tokens
+
+
+def count_message_tokens(messages: Sequence[Dict[str, str]]) -> int:
+    """Approximate prompt tokens of a chat request"""
+    return sum(count_tokens(message['content']) + MESSAGE_OVERHEAD for message in messages) + REPLY_OVERHEAD
+
+
+def estimate_json_tokens(value: Any) -> int:
+    """Approximate tokens of ``value`` written as JSON; much cheaper than count_tokens on large values"""
+    return round(len(json.dumps(value, ensure_ascii=False, separators=(',', ':'))) / JSON_CHARS_PER_TOKEN)
+
+
+def compact_schema(example: Any) -> str:
+    """
+    One-line type signature of an example value: ``int``, ``str``,
+    ``str?`` (optional), ``[T]`` for lists and quoted ``"a|b"`` enums
+    """
+    if isinstance(example, dict):
+        return '{' + ','.join(f'"{name}":{compact_schema(value)}' for name, value in example.items()) + '}'
+    if isinstance(example, list):
+        return f'[{compact_schema(example[0])}]' if example else '[]'
+    if isinstance(example, bool):
+        return 'bool'
+    if isinstance(example, int):
+        return 'int'
+    if isinstance(example, float):
+        return 'num'
+    if '|' in example:
+        return json.dumps(example)
+    return 'str?' if example.startswith('optional') else 'str'
+
+
+@dataclass
+class CompiledPrompt:
+    """A prompt with its approximate token count (system message included) and tokens over budget"""
+    text: str
+    tokens: int
+    trimmed: List[str] = field(default_factory=list)
+    overrun: int = 0
+
+
+class PromptCompiler:
+    """Builds compact plan prompts from the section examples given once at construction"""
+
+    def __init__(self, section_schemas: Dict[str, str], system_message: str):
+        self.schemas = {
+            name: compact_schema(json.loads('{' + example + '}')[name])
+            for name, example in section_schemas.items()
+        }
+        self.system_message = system_message
+        # Everything in a request but the prompt text: the system message and per-message overheads
+        self._fixed_tokens = count_tokens(system_message) + 2 * MESSAGE_OVERHEAD + REPLY_OVERHEAD
+        # Templates by requested sections; there are only a few combinations
+        self._templates: Dict[Tuple[str, ...], str] = {}
+        self.template(tuple(section_schemas))
+
+    def template(self, sections: Tuple[str, ...]) -> str:
+        """The fixed part of a prompt for ``sections``, with ``{header}`` and ``{details}`` slots"""
+        if sections not in self._templates:
+            self._templates[sections] = self._build_template(sections)
+        return self._templates[sections]
+
+    def _build_template(self, sections: Tuple[str, ...]) -> str:
+        schema = '{' + ','.join(f'"{name}":{self.schemas[name]}' for name in sections) + '}'
+        schema = schema.replace('{', '{{').replace('}', '}}')
+        return (
+            '{intro}\n{header}{details}\n'
+            f'Reply with one JSON object: {schema}\n'
+            'Types: int, str, str? (optional), [T] list of T, "a|b" one of. '
+            'Keep it realistic and progressive for the level; tasks of a day total at most {minutes} minutes.'
+        )
+
+    def compile(
+        self,
+        sections: Sequence[str],
+        goal_text: str,
+        current_level: str,
+        daily_minutes: int,
+        deadline: Optional[str] = None,
+        focus_areas: list = None,
+        preferred_resources: list = None,
+        preferred_language: str = 'en',
+        context: Optional[Dict[str, Any]] = None,
+        weeks: Optional[Tuple[int, int]] = None,
+        budget: Optional[int] = None
+    ) -> CompiledPrompt:
+        """
+        The prompt asking for ``sections``, given the final ``context``
+        sections and optionally limited to a range of ``weeks``, with
+        context trimmed to ``budget`` tokens (PLAN_PROMPT_TOKEN_BUDGET by
+        default)
+        """
+        budget = settings.PLAN_PROMPT_TOKEN_BUDGET if budget is None else budget
+        focus_areas = focus_areas or []
+        preferred_resources = preferred_resources or []
+        context = {name: list(value) if isinstance(value, list) else value for name, value in (context or {}).items()}
+        template = self.template(tuple(sections))
+
+        def render() -> str:
+            lines = [f'goal: {goal_text}', f'level: {current_level}', f'minutes/day: {daily_minutes}']
+            if deadline:
+                lines.append(f'deadline: {deadline}')
+            if focus_areas:
+                lines.append(f"focus: {', '.join(focus_areas)}")
+            if preferred_resources:
+                lines.append(f"resources: {', '.join(preferred_resources)}")
+            lines.append(f'ui language: {preferred_language}')
+
+            details = ''
+            if context:
+                details += '\nFinal sections, stay consistent: ' + json.dumps(context, ensure_ascii=False, separators=(',', ':'))
+            if weeks:
+                first, last = weeks
+                details += f'\nOnly daily tasks of weeks {first}-{last}; day numbers count from plan start (week {first} starts on day {(first - 1) * 7 + 1}).'
+
+            intro = 'Study plan part' if set(sections) != set(self.schemas) else 'Study plan'
+            if context:
+                intro += ' (update)'
+            return template.format(intro=intro + ' for:', header='\n'.join(lines), details=details, minutes=daily_minutes)
+
+        trimmed = []
+        overrun = 0
+        text = render()
+        tokens = self._fixed_tokens + count_tokens(text)
+        while budget and tokens > budget:
+            reduced = self._trim(context, weeks)
+            if not reduced:
+                # Only the user's own inputs are left; they are sent whole
+                overrun = tokens - budget
+                logger.warning(f"Prompt for {', '.join(sections)} is {tokens} tokens, over the {budget} token budget")
+                metrics.increment('prompt.over_budget')
+                break
+            if reduced not in trimmed:
+                trimmed.append(reduced)
+            text = render()
+            tokens = self._fixed_tokens + count_tokens(text)
+
+        if trimmed:
+            metrics.increment('prompt.trimmed')
+        return CompiledPrompt(text, tokens, trimmed, overrun)
+
+    @staticmethod
+    def _trim(context: Dict[str, Any], weeks: Optional[Tuple[int, int]]) -> Optional[str]:
+        """Drop the context entry furthest from ``weeks`` (or the last one) from the longest context section"""
+        if not context:
+            return None
+        name = max(context, key=lambda section: len(context[section]) if isinstance(context[section], list) else 0)
+        entries = context[name]
+        if isinstance(entries, list) and len(entries) > 1:
+            if weeks:
+                middle = (weeks[0] + weeks[1]) / 2
+
+                def distance(index: int) -> float:
+                    entry = entries[index]
+                    week = entry.get('week') if isinstance(entry, dict) else None
+                    return abs(week - middle) if isinstance(week, (int, float)) else float('inf')
+                entries.pop(max(reversed(range(len(entries))), key=distance))
+            else:
+                entries.pop()
+        else:
+            del context[name]
+        return f'context.{name}'
@@ -0,0 +1,128 @@
+"""
+Cache of rendered plan version JSON
+
+Plan versions are never modified after creation, so a serialized
+version is rendered to JSON once and the bytes are kept: in a
+per-process LRU bounded by PLAN_RENDERED_CACHE_MAX_BYTES and, when
+CACHES has a ``plan_versions`` alias (a directory with
+PLAN_RENDERED_CACHE_DIR, or a shared backend), there too. Plan detail
+splices the bytes into its response, so cached versions are neither
+loaded from the database nor serialized again.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.renderers import JSONRenderer
+
+from .models import PlanVersion
+
+CACHE_ALIAS = 'plan_versions'
+
+# Bump when PlanVersionSerializer output changes, so stale renderings are not served
+RENDER_FORMAT = 1
+
+
+def version_key(version_id: int, created_at) -> str:
+    # created_at guards against ids reused after a delete (SQLite)
+    return f'plan_version:{RENDER_FORMAT}:{version_id}:{int(created_at.timestamp() * 1_000_000)}'
+
+
+def render_version(version: PlanVersion) -> bytes:
+    """JSON of ``version`` exactly as the plan serializers render it"""
+    from .serializers import PlanVersionSerializer
+    return JSONRenderer().render(PlanVersionSerializer(version).data)
+
+
+def splice(rendered: bytes, members: Dict[str, bytes]) -> bytes:
+    """Add members already rendered as JSON to the end of a rendered JSON object"""
+    if not members:
+        return rendered
+    spliced = b','.join(JSONRenderer().render(name) + b':' + value for name, value in members.items())
+    return rendered[:-1] + (b',' if rendered != b'{}' else b'') + spliced + b'}'
+
+
+class RenderedVersionCache:
+    """Rendered version JSON by version, in a size-bounded LRU backed by an optional Django cache"""
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self._max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        return self._max_bytes if self._max_bytes is not None else settings.PLAN_RENDERED_CACHE_MAX_BYTES
+
+    @property
+    def shared(self):
+        return caches[CACHE_ALIAS] if CACHE_ALIAS in settings.CACHES else None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get_many(self, keys: List[str]) -> Dict[str, bytes]:
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+        missing = [key for key in keys if key not in found]
+        if missing and self.shared is not None:
+            shared = self.shared.get_many(missing)
+            for key, data in shared.items():
+                self._remember(key, data)
+            found.update(shared)
+        return found
+
+    def set_many(self, entries: Dict[str, bytes]):
+        for key, data in entries.items():
+            self._remember(key, data)
+        if entries and self.shared is not None:
+            self.shared.set_many(entries, timeout=None)
+
+    def _remember(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= len(self._entries.pop(key))
+            self._entries[key] = data
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self):
+        """Forget the local entries (the shared cache is left alone)"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def render(self, versions) -> List[bytes]:
+        """
+        Rendered JSON of the versions of a queryset, in its order; only
+        versions missing from the cache are loaded and rendered
+        """
+        rows: List[Tuple[int, str]] = [
+            (version_id, version_key(version_id, created_at))
+            for version_id, created_at in versions.values_list('id', 'created_at')
+        ]
+        found = self.get_many([key for _, key in rows])
+        missing = {version_id: key for version_id, key in rows if key not in found}
+        if missing:
+            rendered = {
+                missing[version.id]: render_version(version)
+                for version in PlanVersion.objects.filter(id__in=missing)
+            }
+            self.set_many(rendered)
+            found.update(rendered)
+        return [found[key] for _, key in rows]
+
+
+rendered_versions = RenderedVersionCache()
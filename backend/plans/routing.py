@@ -0,0 +1,162 @@
+"""
+Latency-aware model routing
+
+With PLAN_ROUTING_ENABLED, each generation picks a model tier from the
+size of its prompt and of the plan it asks for: short prompts for short
+plans (or outlines without daily tasks) go to the ``fast`` tier,
+everything else to ``standard``. Each tier is a fallback chain of models
+(PLAN_MODEL_TIERS); the chain is reordered by recent health so a model
+that is currently failing or slow is tried last, and models whose own
+circuit breaker is open are skipped. Ordering the chain never claims a
+breaker's half-open trial; only the model actually called does, in
+``call_with_fallback``.
+
+Health comes from two shared sources: a circuit breaker per model
+(calls and failures in the breaker window) and the latency recorded on
+recent plan versions. Without routing the chain is just OPENAI_MODEL.
+"""
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import metrics
+from .circuit_breaker import CircuitBreaker
+from .prompts import count_tokens
+from .scheduling import plan_days
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+# (fetched at, p50 latency in ms per model)
+_latency_snapshot = (0.0, {})
+
+
+@dataclass
+class Route:
+    """Models to try for one generation, in order"""
+    tier: str
+    primary: str  # First model of the tier's configured chain; keys the plan cache
+    models: List[str]
+
+
+def model_breaker(model: str) -> CircuitBreaker:
+    """Circuit breaker tracking one model's recent calls"""
+    if model not in _breakers:
+        _breakers[model] = CircuitBreaker(f'model:{model}'[:50])
+    return _breakers[model]
+
+
+def recent_latency() -> Dict[str, float]:
+    """Median upstream latency per model over PLAN_ROUTING_WINDOW, refreshed every few seconds"""
+    global _latency_snapshot
+    fetched_at, latency = _latency_snapshot
+    if time.monotonic() - fetched_at > settings.PLAN_ROUTING_REFRESH_INTERVAL:
+        from .telemetry import latency_by_model
+        since = timezone.now() - timedelta(seconds=settings.PLAN_ROUTING_WINDOW)
+        latency = {row['model_used']: row['p50_ms'] for row in latency_by_model(since)}
+        _latency_snapshot = (time.monotonic(), latency)
+    return latency
+
+
+def is_degraded(model: str, latency: Dict[str, float]) -> bool:
+    """Whether ``model`` has recently been failing or slow"""
+    if model_breaker(model).error_rate() >= settings.PLAN_ROUTING_MAX_ERROR_RATE:
+        return True
+    return latency.get(model, 0) > settings.PLAN_ROUTING_MAX_P50_MS
+
+
+def choose_tier(prompt: str, deadline: Optional[str] = None, daily_tasks: bool = True) -> str:
+    """``fast`` for small prompts asking for a short plan (or no daily tasks), else ``standard``"""
+    if count_tokens(prompt) > settings.PLAN_ROUTING_FAST_MAX_PROMPT_TOKENS:
+        return 'standard'
+    if daily_tasks and plan_days(deadline) > settings.PLAN_ROUTING_FAST_MAX_DAYS:
+        return 'standard'
+    return 'fast'
+
+
+def primary_model(prompt: str, deadline: Optional[str] = None, daily_tasks: bool = True) -> str:
+    """First model of the configured chain a generation would be routed to; keys the plan cache"""
+    if not settings.PLAN_ROUTING_ENABLED:
+        return settings.OPENAI_MODEL
+    return settings.PLAN_MODEL_TIERS[choose_tier(prompt, deadline, daily_tasks)][0]
+
+
+def route(prompt: str, deadline: Optional[str] = None, daily_tasks: bool = True, dry_run: bool = False) -> Route:
+    """
+    The tier and ordered fallback chain for a generation
+
+    A ``dry_run`` route (for estimates) is neither logged nor counted.
+    """
+    if not settings.PLAN_ROUTING_ENABLED:
+        return Route('default', settings.OPENAI_MODEL, [settings.OPENAI_MODEL])
+
+    tier = choose_tier(prompt, deadline, daily_tasks)
+    chain = list(dict.fromkeys(settings.PLAN_MODEL_TIERS[tier]))
+    available = [model for model in chain if model_breaker(model).would_allow()]
+    latency = recent_latency()
+    degraded = [model for model in available if is_degraded(model, latency)]
+    models = [model for model in available if model not in degraded] + degraded
+
+    if dry_run:
+        return Route(tier, chain[0], models)
+    if models[:1] != chain[:1]:
+        skipped = [model for model in chain if model not in available]
+        logger.info(f"Routing {tier} tier to {models[:1]}: open {skipped}, degraded {degraded}")
+    metrics.increment(f'routing.{tier}')
+    return Route(tier, chain[0], models)
+
+
+def claim(model: str) -> bool:
+    """Whether ``model`` may be called now; claims its breaker's half-open trial if it is due"""
+    return not settings.PLAN_ROUTING_ENABLED or model_breaker(model).allow()
+
+
+def call_with_fallback(route: Route, call: Callable[[str], T]) -> Tuple[T, str]:
+    """
+    Call ``call(model)`` for the models of ``route`` in order until one
+    succeeds; returns its result and model. Models whose breaker no
+    longer allows a call are skipped. The last error is raised when
+    every model fails.
+    """
+    failed, error = None, None
+    for model in route.models:
+        if not claim(model):
+            continue
+        if error is not None:
+            logger.warning(f"Model {failed} failed ({str(error)}); falling back to {model}")
+            metrics.increment('routing.fallback')
+        try:
+            return call(model), model
+        except Exception as e:
+            failed, error = model, e
+    if error is not None:
+        raise error
+    raise RuntimeError(f'No model of the {route.tier} tier is available')
+
+
+def record_success(model: str, latency: float):
+    """Count a successful call of ``model`` for routing"""
+    if settings.PLAN_ROUTING_ENABLED:
+        model_breaker(model).record_success(latency)
+
+
+def record_failure(model: str):
+    """Count a failed call of ``model`` for routing"""
+    if settings.PLAN_ROUTING_ENABLED:
+        model_breaker(model).record_failure()
+
+
+def reset_routing():
+    """Drop the local breaker and latency snapshots so the next route reads the shared state"""
+    global _latency_snapshot
+    for breaker in _breakers.values():
+        breaker.forget()
+    _latency_snapshot = (0.0, {})
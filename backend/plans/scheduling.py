@@ -0,0 +1,206 @@
+"""
+Deterministic local study scheduler
+
+Builds a complete plan (same sections as the model returns) from the
+generation inputs alone: the weeks left until the deadline are split
+into phases, every focus area gets a share of each phase's topics, and
+every day until the deadline gets tasks that add up to daily_minutes.
+Used when the model is unavailable and to re-plan an existing plan
+around a new deadline without a model call.
+"""
+import math
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+DEFAULT_PLAN_WEEKS = 12
+MAX_PLAN_WEEKS = 52
+
+DEFAULT_FOCUS_AREAS = ['reading', 'writing', 'listening', 'speaking']
+DEFAULT_RESOURCES = ['videos', 'books']
+
+# (name, share of the plan that ends with this phase, topic priority)
+PHASES = (
+    ('Foundation', 0.3, 'high'),
+    ('Development', 0.7, 'high'),
+    ('Consolidation', 0.9, 'medium'),
+    ('Review', 1.0, 'low'),
+)
+
+# Checkpoints are placed at these fractions of the plan
+CHECKPOINT_FRACTIONS = (0.25, 0.5, 0.75, 1.0)
+
+# A day gets one task per this many minutes, up to one per focus area
+MINUTES_PER_TASK = 20
+
+# Shortest task kept when squeezing a day into its budget
+MIN_TASK_MINUTES = 5
+
+
+def plan_days(deadline: Optional[Union[str, date]] = None, today: Optional[date] = None) -> int:
+    """Number of study days until ``deadline`` (ISO date), capped at MAX_PLAN_WEEKS"""
+    if not deadline:
+        return DEFAULT_PLAN_WEEKS * 7
+    if isinstance(deadline, str):
+        try:
+            deadline = date.fromisoformat(deadline)
+        except ValueError:
+            return DEFAULT_PLAN_WEEKS * 7
+    days = (deadline - (today or date.today())).days
+    return min(max(days, 1), MAX_PLAN_WEEKS * 7)
+
+
+def split_minutes(total: int, parts: int) -> List[int]:
+    """Split ``total`` into ``parts`` integers that differ by at most one"""
+    base, extra = divmod(total, parts)
+    return [base + 1 if i < extra else base for i in range(parts)]
+
+
+def fit_day_to_budget(tasks: List[Dict[str, Any]], daily_minutes: int) -> List[Dict[str, Any]]:
+    """
+    Rescale a day's task estimates proportionally so they fill
+    ``daily_minutes``, trimming the longest tasks if rounding overshoots.
+    """
+    total = sum(task.get('estimated_minutes') or 0 for task in tasks)
+    if total <= 0:
+        return tasks
+
+    # A budget below the usual minimum task still gets one task that fits it
+    floor = min(MIN_TASK_MINUTES, daily_minutes)
+    factor = daily_minutes / total
+    fitted = [
+        dict(task, estimated_minutes=max(floor, round((task.get('estimated_minutes') or 0) * factor)))
+        for task in tasks
+    ]
+
+    # Drop the shortest tasks if even the minimum durations do not fit
+    while len(fitted) > 1 and floor * len(fitted) > daily_minutes:
+        fitted.remove(min(fitted, key=lambda task: task['estimated_minutes']))
+
+    overflow = sum(task['estimated_minutes'] for task in fitted) - daily_minutes
+    for task in sorted(fitted, key=lambda task: -task['estimated_minutes']):
+        if overflow <= 0:
+            break
+        cut = min(overflow, task['estimated_minutes'] - floor)
+        task['estimated_minutes'] -= cut
+        overflow -= cut
+    return fitted
+
+
+def phase_bounds(weeks: int) -> List[int]:
+    """Last week of each phase; later phases get at least one week when there is room"""
+    bounds = []
+    for index, (_, end, _) in enumerate(PHASES):
+        remaining_phases = len(PHASES) - index - 1
+        last = max(round(weeks * end), bounds[-1] + 1 if bounds else 1)
+        bounds.append(min(last, max(weeks - remaining_phases, 1)) if remaining_phases else weeks)
+    return bounds
+
+
+def build_topics(goal_text: str, focus_areas: Sequence[str], weeks: int, daily_minutes: int) -> List[Dict[str, Any]]:
+    """One topic per focus area and phase, sharing the plan's study hours"""
+    topics = []
+    count = len(PHASES) * len(focus_areas)
+    hours = round(weeks * 7 * daily_minutes / 60 / count, 1)
+    for phase, _, priority in PHASES:
+        for area in focus_areas:
+            topics.append({
+                'name': f'{area.capitalize()} {phase.lower()}',
+                'priority': priority,
+                'estimated_hours': hours,
+                'description': f'{phase} stage of {area} for your goal: {goal_text[:50]}',
+            })
+    return topics
+
+
+def schedule_plan(
+    goal_text: str,
+    current_level: str,
+    daily_minutes: int,
+    deadline: Optional[Union[str, date]] = None,
+    focus_areas: list = None,
+    preferred_resources: list = None,
+    topics: Optional[List[Dict[str, Any]]] = None,
+    today: Optional[date] = None
+) -> Dict[str, Any]:
+    """
+    Schedule a plan until ``deadline``.
+
+    Pass ``topics`` to lay out existing topics (e.g. from a previous
+    version) instead of generating new ones; they are spread over the
+    weeks in the given order.
+    """
+    focus_areas = list(focus_areas or DEFAULT_FOCUS_AREAS)
+    preferred_resources = list(preferred_resources or DEFAULT_RESOURCES)
+    days = plan_days(deadline, today)
+    weeks = math.ceil(days / 7)
+    if not topics:
+        topics = build_topics(goal_text, focus_areas, weeks, daily_minutes)
+    names = [topic.get('name', f'Topic {i + 1}') for i, topic in enumerate(topics)] or [goal_text[:50]]
+
+    # Spread topics over the weeks in order: each week gets a contiguous slice
+    week_topics = []
+    for week in range(weeks):
+        start = week * len(names) // weeks
+        end = max((week + 1) * len(names) // weeks, start + 1)
+        week_topics.append(names[start:end])
+
+    bounds = phase_bounds(weeks)
+    weekly_roadmap = []
+    for week in range(weeks):
+        phase = PHASES[next(i for i, last in enumerate(bounds) if week < last)][0]
+        week_days = min(7, days - week * 7)
+        weekly_roadmap.append({
+            'week': week + 1,
+            'focus': f'{phase}: {", ".join(week_topics[week])}',
+            'topics': week_topics[week],
+            'estimated_hours': round(week_days * daily_minutes / 60, 1),
+        })
+
+    tasks_per_day = max(1, min(len(focus_areas), daily_minutes // MINUTES_PER_TASK))
+    minutes = split_minutes(daily_minutes, tasks_per_day)
+    daily_tasks = []
+    for day in range(days):
+        current = week_topics[day // 7]
+        tasks = []
+        for slot in range(tasks_per_day):
+            area = focus_areas[(day + slot) % len(focus_areas)]
+            topic = current[(day + slot) % len(current)]
+            resource = preferred_resources[(day + slot) % len(preferred_resources)]
+            tasks.append({
+                'title': f'{area.capitalize()}: {topic}',
+                'description': f'Practice {area} on {topic} using {resource}',
+                'estimated_minutes': minutes[slot],
+                'type': area,
+            })
+        daily_tasks.append({'day': day + 1, 'week': day // 7 + 1, 'tasks': tasks})
+
+    checkpoints = []
+    covered_from = 0
+    checkpoint_weeks = sorted({max(1, round(weeks * fraction)) for fraction in CHECKPOINT_FRACTIONS})
+    for week in checkpoint_weeks:
+        covered = [name for week_names in week_topics[covered_from:week] for name in week_names]
+        checkpoints.append({
+            'week': week,
+            'type': 'review' if week == weeks else 'assessment',
+            'description': f'Week {week} progress assessment and review',
+            'topics_covered': list(dict.fromkeys(covered)),
+        })
+        covered_from = week
+
+    resources = [
+        {
+            'title': f'Recommended {res_type.capitalize()} Resource {i + 1}',
+            'type': res_type,
+            'description': f'A high-quality {res_type} resource for {current_level} level learners',
+            'url': None,
+        }
+        for i, res_type in enumerate(preferred_resources[:5])
+    ]
+
+    return {
+        'weekly_roadmap': weekly_roadmap,
+        'daily_tasks': daily_tasks,
+        'topics': topics,
+        'resources': resources,
+        'checkpoints': checkpoints,
+    }
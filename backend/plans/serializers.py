@@ -1,9 +1,11 @@
 from rest_framework import serializers
-from .models import Plan, PlanVersion
+from .models import Plan, PlanVersion, PlanGenerationJob
 
 
 class PlanVersionSerializer(serializers.ModelSerializer):
     """Serializer for plan version"""
+    content_json = serializers.SerializerMethodField()
+    
     class Meta:
         model = PlanVersion
         fields = (
@@ -11,6 +13,13 @@ class PlanVersionSerializer(serializers.ModelSerializer):
             'created_at'
         )
         read_only_fields = ('id', 'created_at')
+    
+    def get_content_json(self, obj):
+        """The content, or only the sections asked for by the context's projection"""
+        projection = self.context.get('projection')
+        if projection is None:
+            return obj.content_json
+        return projection.content(obj)
 
 
 class PlanSerializer(serializers.ModelSerializer):
@@ -26,14 +35,65 @@ class PlanSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id', 'created_at', 'updated_at', 'versions')
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        projection = self.context.get('projection')
+        if projection is not None:
+            for name in list(self.fields):
+                if not projection.includes(name):
+                    self.fields.pop(name)
+    
     def get_latest_version(self, obj):
         """Get the most recent version"""
-        latest = obj.versions.first()
+        projection = self.context.get('projection')
+        # Uses the prefetched versions when there are any, else fetches only the latest one
+        if projection is None or 'versions' in getattr(obj, '_prefetched_objects_cache', {}):
+            latest = obj.versions.first()
+        else:
+            latest = projection.versions(obj.versions.all()).first()
         if latest:
-            return PlanVersionSerializer(latest).data
+            return PlanVersionSerializer(latest, context=self.context).data
         return None
 
 
+class PlanListSerializer(serializers.ModelSerializer):
+    """Plan metadata with its version count and latest version summary, for lists"""
+    versions_count = serializers.IntegerField(read_only=True)
+    latest_version = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Plan
+        fields = (
+            'id', 'title', 'goal_text', 'deadline', 'is_active',
+            'created_at', 'updated_at', 'versions_count', 'latest_version'
+        )
+        read_only_fields = fields
+    
+    def get_latest_version(self, obj):
+        """Summary from the with_version_summary() annotations"""
+        if obj.latest_version_id is None:
+            return None
+        return {
+            'id': obj.latest_version_id,
+            'version_number': obj.latest_version_number,
+            'model_used': obj.latest_model_used,
+            'created_at': serializers.DateTimeField().to_representation(obj.latest_version_created_at),
+        }
+
+
+class PlanGenerationJobSerializer(serializers.ModelSerializer):
+    """Serializer for plan generation job status"""
+    version = PlanVersionSerializer(read_only=True)
+
+    class Meta:
+        model = PlanGenerationJob
+        fields = (
+            'id', 'kind', 'status', 'plan', 'version', 'error',
+            'created_at', 'started_at', 'finished_at'
+        )
+        read_only_fields = fields
+
+
 class PlanCreateSerializer(serializers.Serializer):
     """Serializer for creating a new plan"""
     title = serializers.CharField(max_length=200, required=True)
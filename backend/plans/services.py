@@ -3,19 +3,55 @@ Service layer for AI plan generation
 """
 import json
 import logging
-from typing import Dict, Any, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Any, Iterator, Optional, Tuple
 from django.conf import settings
-from decouple import config
+from django.utils import timezone
+from . import metrics, routing, telemetry
+from .cache import plan_cache, plan_cache_key
+from .circuit_breaker import openai_breaker
+from .incremental import regenerate_incrementally
+from .llm import LLMBackend, get_llm_backend
+from .parsing import SectionParser, recover_sections
+from .prompts import PromptCompiler, count_message_tokens, estimate_json_tokens
+from .scheduling import schedule_plan
+from .single_flight import single_flight
+from .validation import repair_plan
 
 logger = logging.getLogger(__name__)
 
-# Try to import OpenAI, but handle gracefully if not available
-try:
-    from openai import OpenAI
-    OPENAI_AVAILABLE = True
-except ImportError:
-    OPENAI_AVAILABLE = False
-    logger.warning("OpenAI library not available. Running in mock mode.")
+SYSTEM_MESSAGE = "You are an expert educational planner. Create detailed, structured study plans in JSON format."
+
+# Top-level sections of a plan, in the order the prompt asks for them
+PLAN_SECTIONS = ('weekly_roadmap', 'daily_tasks', 'topics', 'resources', 'checkpoints')
+
+# Sections generated up front when daily tasks are expanded lazily, week by week
+OUTLINE_SECTIONS = tuple(name for name in PLAN_SECTIONS if name != 'daily_tasks')
+
+# Request headers naming the sections, and weeks of daily tasks, a completion asks for
+SECTIONS_HEADER = 'X-Plan-Sections'
+WEEKS_HEADER = 'X-Plan-Weeks'
+
+
+def plan_inputs(
+    goal_text: str,
+    current_level: str,
+    daily_minutes: int,
+    deadline: Optional[str] = None,
+    focus_areas: list = None,
+    preferred_resources: list = None
+) -> Dict[str, Any]:
+    """The user's inputs that shape a plan, as passed to the prompt builders and the scheduler"""
+    return {
+        'goal_text': goal_text,
+        'current_level': current_level,
+        'daily_minutes': daily_minutes,
+        'deadline': deadline,
+        'focus_areas': focus_areas or [],
+        'preferred_resources': preferred_resources or [],
+    }
 
 
 def generate_study_plan(
@@ -25,10 +61,23 @@ def generate_study_plan(
     deadline: Optional[str] = None,
     focus_areas: list = None,
     preferred_resources: list = None,
-    preferred_language: str = 'en'
+    preferred_language: str = 'en',
+    use_cache: bool = True,
+    daily_tasks: Optional[bool] = None
 ) -> Dict[str, Any]:
     """
-    Generate a study plan using OpenAI API or mock mode
+    Generate a study plan with the configured LLM backend or mock mode
+    
+    Model responses are cached by a hash of the normalized inputs. With
+    ``use_cache=False`` the cache is not read (explicit regenerate) but
+    the fresh result still replaces the cached one. Concurrent calls with
+    the same inputs and the same ``use_cache`` wait for a single upstream
+    request.
+    
+    With ``daily_tasks=False`` (the default when PLAN_LAZY_DAILY_TASKS is
+    on) only the outline is generated: daily_tasks is left empty,
+    ``daily_tasks_deferred`` is set, and each week's tasks are generated
+    when it is first requested (see plans.weeks).
     
     Returns a structured plan with:
     - weekly_roadmap: List of weekly plans
@@ -39,83 +88,419 @@ def generate_study_plan(
     """
     focus_areas = focus_areas or []
     preferred_resources = preferred_resources or []
+    if daily_tasks is None:
+        daily_tasks = not settings.PLAN_LAZY_DAILY_TASKS
+    sections = PLAN_SECTIONS if daily_tasks else OUTLINE_SECTIONS
+    inputs = plan_inputs(goal_text, current_level, daily_minutes, deadline, focus_areas, preferred_resources)
+    
+    def finish(plan: Dict[str, Any], source: str, usage: Optional[telemetry.GenerationTelemetry] = None) -> Dict[str, Any]:
+        if not daily_tasks:
+            plan.update({'daily_tasks': [], 'daily_tasks_deferred': True})
+        plan['telemetry'] = usage.as_dict(source) if usage else telemetry.telemetry_for(source)
+        return plan
     
     # Build the prompt
-    prompt = build_prompt(
-        goal_text=goal_text,
-        current_level=current_level,
-        daily_minutes=daily_minutes,
-        deadline=deadline,
-        focus_areas=focus_areas,
-        preferred_resources=preferred_resources,
-        preferred_language=preferred_language
+    if daily_tasks:
+        prompt = build_prompt(preferred_language=preferred_language, **inputs)
+    else:
+        prompt = build_section_prompt(sections, {}, preferred_language=preferred_language, **inputs)
+    
+    # Check if a model backend is available
+    backend = get_llm_backend()
+    
+    if not backend.is_available():
+        logger.info(f"LLM backend '{backend.name}' not available. Using mock mode.")
+        return finish(generate_mock_plan(**inputs), telemetry.SOURCE_FALLBACK)
+    
+    # The cache is keyed by the first choice of the tier the generation would be routed to
+    model = routing.primary_model(prompt, deadline, daily_tasks)
+    
+    # Outlines are cached separately from full plans for the same inputs
+    cache_key = plan_cache_key(
+        model if daily_tasks else f'{model}:outline',
+        preferred_language=preferred_language,
+        **inputs
     )
+    if use_cache and settings.PLAN_CACHE_ENABLED:
+        cached = plan_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Plan cache hit. Model: {model}")
+            return finish({**cached, 'model_used': model, 'prompt_used': prompt}, telemetry.SOURCE_CACHE)
     
-    # Check if OpenAI API key is available
-    api_key = config('OPENAI_API_KEY', default='')
-    model = config('OPENAI_MODEL', default='gpt-4-turbo-preview')
-    
-    if not api_key or not OPENAI_AVAILABLE:
-        logger.info("OpenAI API key not configured. Using mock mode.")
-        return generate_mock_plan(
-            goal_text=goal_text,
-            current_level=current_level,
-            daily_minutes=daily_minutes,
-            deadline=deadline,
-            focus_areas=focus_areas,
-            preferred_resources=preferred_resources
-        )
+    # While OpenAI is failing, skip it instead of waiting for each timeout
+    if not openai_breaker.allow():
+        logger.info("OpenAI circuit breaker is open. Using mock mode.")
+        metrics.increment('circuit_breaker.short_circuited')
+        return finish(generate_mock_plan(**inputs), telemetry.SOURCE_FALLBACK)
     
-    try:
-        client = OpenAI(api_key=api_key)
-        
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert educational planner. Create detailed, structured study plans in JSON format."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            temperature=0.7,
-            response_format={"type": "json_object"}
-        )
-        
-        content = response.choices[0].message.content
-        plan_data = json.loads(content)
-        
-        # Log the API call (without sensitive data)
-        logger.info(f"OpenAI API call successful. Model: {model}, Tokens used: {response.usage.total_tokens if hasattr(response, 'usage') else 'N/A'}")
+    # Pick the models to try, only when the model will be called
+    chain = routing.route(prompt, deadline, daily_tasks)
+    called = []
+    
+    def call_model():
+        called.append(True)
+        with telemetry.collect() as usage:
+            return generate_with_model(usage)
+    
+    def generate_with_model(usage: telemetry.GenerationTelemetry):
+        try:
+            if settings.PLAN_PARALLEL_SECTIONS:
+                plan_data, model_used = routing.call_with_fallback(chain, lambda model: generate_sections_parallel(
+                    model, daily_tasks=daily_tasks, backend=backend, preferred_language=preferred_language, **inputs
+                ))
+            else:
+                response, model_used = routing.call_with_fallback(
+                    chain, lambda model: request_completion(model, prompt, backend, sections=sections)
+                )
+                
+                content = response.choices[0].message.content
+                
+                # Log the API call (without sensitive data)
+                logger.info(f"OpenAI API call successful. Model: {model_used}, Tokens used: {getattr(response.usage, 'total_tokens', 'N/A')}")
+                
+                try:
+                    plan_data = json.loads(content)
+                except json.JSONDecodeError:
+                    plan_data = recover_plan(content, sections=sections, preferred_language=preferred_language, **inputs)
+            
+            # Fix over-budget days and schema problems before anyone sees them
+            repaired, _ = repair_plan(plan_data, sections=sections, **inputs)
+            result = {name: repaired.get(name, []) for name in PLAN_SECTIONS}
+            result.update({'model_used': model_used, 'prompt_used': prompt})
+            if settings.PLAN_CACHE_ENABLED:
+                plan_cache.set(cache_key, model_used, result)
+            return finish(result, telemetry.SOURCE_LLM, usage)
         
-        return {
-            'weekly_roadmap': plan_data.get('weekly_roadmap', []),
-            'daily_tasks': plan_data.get('daily_tasks', []),
-            'topics': plan_data.get('topics', []),
-            'resources': plan_data.get('resources', []),
-            'checkpoints': plan_data.get('checkpoints', []),
-            'model_used': model,
-            'prompt_used': prompt
-        }
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            # Fallback to mock mode on error
+            logger.info("Falling back to mock mode due to API error.")
+            return finish(generate_mock_plan(**inputs), telemetry.SOURCE_FALLBACK, usage)
     
-    except Exception as e:
-        logger.error(f"OpenAI API error: {str(e)}")
-        # Fallback to mock mode on error
-        logger.info("Falling back to mock mode due to API error.")
-        return generate_mock_plan(
-            goal_text=goal_text,
-            current_level=current_level,
-            daily_minutes=daily_minutes,
-            deadline=deadline,
-            focus_areas=focus_areas,
-            preferred_resources=preferred_resources
+    # Identical concurrent requests share one upstream call; a regenerate
+    # must not be handed the result of a create that may have read the cache
+    if settings.PLAN_SINGLE_FLIGHT_ENABLED:
+        flight_key = cache_key if use_cache else f'{cache_key}:regenerate'
+        plan = single_flight.run(flight_key, call_model)
+        if not called:
+            # Another request paid for this result
+            plan['telemetry'] = telemetry.telemetry_for(telemetry.SOURCE_CACHE)
+        return plan
+    return call_model()
+
+
+def estimate_study_plan(
+    goal_text: str,
+    current_level: str,
+    daily_minutes: int,
+    deadline: Optional[str] = None,
+    focus_areas: list = None,
+    preferred_resources: list = None,
+    preferred_language: str = 'en',
+    daily_tasks: Optional[bool] = None
+) -> Dict[str, Any]:
+    """
+    What generate_study_plan would do with these inputs, without doing it
+    
+    Resolves the backend, route, cache entry and circuit breaker the same
+    way but makes no upstream call and changes no shared state. Returns
+    the source the plan would come from (llm, cache or fallback), the
+    model, the request's input tokens, its output tokens (sized from the
+    local scheduler's plan for the same inputs) and the expected latency
+    from the model's recent milliseconds per completion token. Tokens and
+    latency are 0 when no model call would be made, and the latency is
+    None while the model has no recent telemetry. With
+    PLAN_PROMPT_COMPACT, ``prompt_overrun_tokens`` is how far the compiled
+    prompt is over PLAN_PROMPT_TOKEN_BUDGET.
+    """
+    focus_areas = focus_areas or []
+    preferred_resources = preferred_resources or []
+    if daily_tasks is None:
+        daily_tasks = not settings.PLAN_LAZY_DAILY_TASKS
+    sections = PLAN_SECTIONS if daily_tasks else OUTLINE_SECTIONS
+    inputs = plan_inputs(goal_text, current_level, daily_minutes, deadline, focus_areas, preferred_resources)
+    estimate = {
+        'source': telemetry.SOURCE_FALLBACK,
+        'model': 'mock-mode',
+        'tier': None,
+        'input_tokens': 0,
+        'output_tokens': 0,
+        'expected_latency_ms': 0,
+        'telemetry_versions': 0,
+        'prompt_overrun_tokens': 0,
+    }
+    
+    # The same prompt build_prompt or build_section_prompt would return, with its token count
+    compiled = None
+    if settings.PLAN_PROMPT_COMPACT:
+        compiled = prompt_compiler.compile(sections, preferred_language=preferred_language, **inputs)
+        prompt = compiled.text
+    elif daily_tasks:
+        prompt = build_prompt(preferred_language=preferred_language, **inputs)
+    else:
+        prompt = build_section_prompt(sections, {}, preferred_language=preferred_language, **inputs)
+    
+    if not get_llm_backend().is_available():
+        return estimate
+    
+    chain = routing.route(prompt, deadline, daily_tasks, dry_run=True)
+    estimate['tier'] = chain.tier
+    cache_key = plan_cache_key(
+        chain.primary if daily_tasks else f'{chain.primary}:outline',
+        preferred_language=preferred_language,
+        **inputs
+    )
+    if settings.PLAN_CACHE_ENABLED and plan_cache.contains(cache_key):
+        return dict(estimate, source=telemetry.SOURCE_CACHE, model=chain.primary)
+    if not chain.models or not openai_breaker.would_allow():
+        return estimate
+    
+    model = chain.models[0]
+    scheduled = schedule_plan(**inputs)
+    output_tokens = estimate_json_tokens({name: scheduled[name] for name in sections})
+    speed = telemetry.completion_speed(model, timezone.now() - timedelta(seconds=settings.PLAN_ESTIMATE_WINDOW))
+    
+    return dict(
+        estimate,
+        source=telemetry.SOURCE_LLM,
+        model=model,
+        input_tokens=compiled.tokens if compiled else count_message_tokens(build_messages(prompt)),
+        output_tokens=output_tokens,
+        expected_latency_ms=round(speed['ms_per_token'] * output_tokens) if speed['ms_per_token'] else None,
+        telemetry_versions=speed['versions'],
+        prompt_overrun_tokens=compiled.overrun if compiled else 0
+    )
+
+
+def regenerate_study_plan(previous_version=None, **inputs) -> Dict[str, Any]:
+    """
+    Regenerate a plan, recomputing only the sections affected by changed inputs
+    
+    When only daily_minutes or deadline differ from the inputs of
+    ``previous_version``, its topics and resources are reused and just the
+    schedule is rebuilt locally. Anything else is a full, uncached
+    generation.
+    """
+    if previous_version is not None:
+        plan = regenerate_incrementally(
+            previous_version.content_json,
+            previous_version.generation_params,
+            inputs
         )
+        if plan is not None:
+            metrics.increment('regenerate.incremental')
+            plan['telemetry'] = telemetry.telemetry_for(telemetry.SOURCE_INCREMENTAL)
+            return plan
+    
+    metrics.increment('regenerate.full')
+    return generate_study_plan(**inputs, use_cache=False)
 
 
-def build_prompt(
+def plan_request_headers(sections=PLAN_SECTIONS, weeks: Optional[Tuple[int, int]] = None) -> Dict[str, str]:
+    """
+    Headers naming the sections (and inclusive weeks of daily tasks) a
+    completion asks for, so stub servers need not parse the prompt
+    """
+    headers = {SECTIONS_HEADER: ','.join(sections)}
+    if weeks:
+        headers[WEEKS_HEADER] = f'{weeks[0]}-{weeks[1]}'
+    return headers
+
+
+def send_completion(
+    backend: LLMBackend,
+    model: str,
+    prompt: str,
+    sections=PLAN_SECTIONS,
+    weeks: Optional[Tuple[int, int]] = None
+):
+    """Send a JSON-mode chat completion; safe to call from worker threads"""
+    return backend.create_completion(
+        model=model,
+        messages=build_messages(prompt),
+        temperature=0.7,
+        response_format={"type": "json_object"},
+        extra_headers=plan_request_headers(sections, weeks)
+    )
+
+
+def request_completion(
+    model: str,
+    prompt: str,
+    backend: Optional[LLMBackend] = None,
+    sections=PLAN_SECTIONS,
+    weeks: Optional[Tuple[int, int]] = None
+):
+    """Send a JSON-mode chat completion, recording the outcome on the circuit breaker"""
+    backend = backend or get_llm_backend()
+    
+    attempts = telemetry.attempts()
+    started = time.monotonic()
+    try:
+        response = send_completion(backend, model, prompt, sections, weeks)
+    except Exception:
+        openai_breaker.record_failure()
+        routing.record_failure(model)
+        telemetry.record_completion(None, max(0, telemetry.attempts() - attempts - 1), time.monotonic() - started)
+        raise
+    latency = time.monotonic() - started
+    openai_breaker.record_success(latency)
+    routing.record_success(model, latency)
+    telemetry.record_completion(response, max(0, telemetry.attempts() - attempts - 1), latency)
+    return response
+
+
+def _timed_completion(
+    backend: LLMBackend,
+    model: str,
+    prompt: str,
+    sections,
+    weeks: Optional[Tuple[int, int]] = None
+) -> Tuple[Any, float, int]:
+    attempts = telemetry.attempts()
+    started = time.monotonic()
+    response = send_completion(backend, model, prompt, sections, weeks)
+    return response, time.monotonic() - started, max(0, telemetry.attempts() - attempts - 1)
+
+
+def _decode_sections(content: str) -> Dict[str, Any]:
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return recover_sections(content)
+
+
+def generate_sections_parallel(
+    model: str,
+    daily_tasks: bool = True,
+    backend: Optional[LLMBackend] = None,
+    **inputs
+) -> Dict[str, Any]:
+    """
+    Generate a plan as a roadmap call followed by concurrent section calls
+    
+    Daily tasks are requested in blocks of PLAN_PARALLEL_WEEKS_PER_REQUEST
+    weeks; topics, resources and checkpoints get one request each. All of
+    them see the roadmap and run on a pool of at most
+    PLAN_PARALLEL_MAX_WORKERS threads, so the wall-clock time is roughly
+    the roadmap plus the slowest section instead of the whole plan.
+    Sections whose request fails are left out for repair_plan to fill.
+    With ``daily_tasks=False`` only the outline sections are requested.
+    """
+    backend = backend or get_llm_backend()
+    response = request_completion(
+        model, build_section_prompt(['weekly_roadmap'], {}, **inputs), backend, sections=['weekly_roadmap']
+    )
+    roadmap = _decode_sections(response.choices[0].message.content).get('weekly_roadmap') or []
+    if not roadmap:
+        raise ValueError('Model returned no weekly roadmap')
+    
+    size = max(1, settings.PLAN_PARALLEL_WEEKS_PER_REQUEST)
+    requests = []
+    for start in range(0, len(roadmap) if daily_tasks else 0, size):
+        block = roadmap[start:start + size]
+        weeks = (block[0].get('week', start + 1), block[-1].get('week', start + len(block)))
+        requests.append((['daily_tasks'], weeks, build_section_prompt(
+            ['daily_tasks'], {'weekly_roadmap': block}, weeks=weeks, **inputs
+        )))
+    requests += [
+        ([name], None, build_section_prompt([name], {'weekly_roadmap': roadmap}, **inputs))
+        for name in ('topics', 'resources', 'checkpoints')
+    ]
+    
+    # Worker threads only do HTTP; the breaker is updated from this thread
+    plan_data = {'weekly_roadmap': roadmap, 'daily_tasks': []}
+    with ThreadPoolExecutor(max_workers=max(1, min(settings.PLAN_PARALLEL_MAX_WORKERS, len(requests)))) as executor:
+        futures = [
+            executor.submit(_timed_completion, backend, model, prompt, sections, weeks)
+            for sections, weeks, prompt in requests
+        ]
+        for (sections, _, _), future in zip(requests, futures):
+            try:
+                response, latency, retries = future.result()
+            except Exception as e:
+                openai_breaker.record_failure()
+                routing.record_failure(model)
+                logger.error(f"OpenAI section call for {', '.join(sections)} failed: {str(e)}")
+                continue
+            openai_breaker.record_success(latency)
+            routing.record_success(model, latency)
+            telemetry.record_completion(response, retries, latency)
+            data = _decode_sections(response.choices[0].message.content)
+            for name in sections:
+                if name == 'daily_tasks':
+                    plan_data['daily_tasks'].extend(data.get(name) or [])
+                elif data.get(name):
+                    plan_data[name] = data[name]
+    
+    logger.info(f"OpenAI parallel generation successful. Model: {model}, Requests: {len(requests) + 1}")
+    return plan_data
+
+
+def recover_plan(content: str, sections=PLAN_SECTIONS, **inputs) -> Dict[str, Any]:
+    """
+    Keep the complete ``sections`` of an undecodable completion and ask
+    the model only for the ones that are missing
+    
+    Raises json.JSONDecodeError when nothing could be salvaged.
+    """
+    recovered = {name: value for name, value in recover_sections(content).items() if name in sections}
+    if not recovered:
+        raise json.JSONDecodeError('No complete plan section in response', content, 0)
+    
+    missing = [name for name in sections if name not in recovered]
+    logger.warning(f"Recovered {', '.join(recovered)} from a malformed response; requesting {', '.join(missing) or 'nothing'}")
+    metrics.increment('plan_parse.recovered')
+    if missing:
+        # The schedule sections can be large; the others are enough context
+        context = {name: recovered[name] for name in ('weekly_roadmap', 'topics', 'resources') if name in recovered}
+        recovered.update(generate_plan_sections(missing, context, **inputs))
+    return recovered
+
+
+def generate_plan_sections(
+    sections,
+    context: Dict[str, Any],
+    goal_text: str,
+    current_level: str,
+    daily_minutes: int,
+    deadline: Optional[str] = None,
+    focus_areas: list = None,
+    preferred_resources: list = None,
+    preferred_language: str = 'en',
+    weeks: Optional[Tuple[int, int]] = None
+) -> Dict[str, Any]:
+    """
+    Generate only ``sections`` of a plan, keeping them consistent with the
+    already known sections in ``context``
+    
+    Falls back to the matching mock sections when OpenAI is unavailable.
+    """
+    inputs = plan_inputs(goal_text, current_level, daily_minutes, deadline, focus_areas, preferred_resources)
+    
+    if get_llm_backend().is_available() and openai_breaker.allow():
+        prompt = build_section_prompt(sections, context, preferred_language=preferred_language, weeks=weeks, **inputs)
+        try:
+            chain = routing.route(prompt, deadline, 'daily_tasks' in sections and weeks is None)
+            response, model = routing.call_with_fallback(chain, lambda model: request_completion(
+                model, prompt, sections=sections, weeks=weeks
+            ))
+            content = response.choices[0].message.content
+            try:
+                plan_data = json.loads(content)
+            except json.JSONDecodeError:
+                plan_data = recover_sections(content)
+            logger.info(f"OpenAI section call successful. Model: {model}, Sections: {', '.join(sections)}")
+            return {name: plan_data.get(name, []) for name in sections}
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            logger.info("Falling back to mock mode due to API error.")
+    
+    mock = generate_mock_plan(**inputs)
+    return {name: mock[name] for name in sections}
+
+
+def stream_study_plan(
     goal_text: str,
     current_level: str,
     daily_minutes: int,
@@ -123,84 +508,319 @@ def build_prompt(
     focus_areas: list = None,
     preferred_resources: list = None,
     preferred_language: str = 'en'
-) -> str:
-    """Build the prompt for OpenAI"""
+) -> Iterator[Tuple[str, Any]]:
+    """
+    Generate a study plan, yielding each section as soon as it is available
+    
+    Yields ``('section', (name, content))`` for every top-level section
+    parsed from the streamed completion, then ``('done', plan)`` with the
+    same dict generate_study_plan would have returned.
+    """
     focus_areas = focus_areas or []
     preferred_resources = preferred_resources or []
+    inputs = plan_inputs(goal_text, current_level, daily_minutes, deadline, focus_areas, preferred_resources)
+    prompt = build_prompt(preferred_language=preferred_language, **inputs)
     
-    prompt = f"""Create a comprehensive, structured study plan in JSON format for the following learning goal:
-
-Goal: {goal_text}
-Current Level: {current_level}
-Daily Available Time: {daily_minutes} minutes per day"""
+    backend = get_llm_backend()
+    primary = routing.primary_model(prompt, deadline)
     
-    if deadline:
-        prompt += f"\nDeadline: {deadline}"
+    plan = None
+    if not backend.is_available():
+        logger.info(f"LLM backend '{backend.name}' not available. Using mock mode.")
+        plan = dict(generate_mock_plan(**inputs), telemetry=telemetry.telemetry_for(telemetry.SOURCE_FALLBACK))
+    else:
+        cache_key = plan_cache_key(primary, preferred_language=preferred_language, **inputs)
+        if settings.PLAN_CACHE_ENABLED:
+            cached = plan_cache.get(cache_key)
+            if cached is not None:
+                plan = {
+                    **cached, 'model_used': primary, 'prompt_used': prompt,
+                    'telemetry': telemetry.telemetry_for(telemetry.SOURCE_CACHE),
+                }
     
-    if focus_areas:
-        prompt += f"\nFocus Areas: {', '.join(focus_areas)}"
+    if plan is None and not openai_breaker.allow():
+        logger.info("OpenAI circuit breaker is open. Using mock mode.")
+        metrics.increment('circuit_breaker.short_circuited')
+        plan = dict(generate_mock_plan(**inputs), telemetry=telemetry.telemetry_for(telemetry.SOURCE_FALLBACK))
     
-    if preferred_resources:
-        prompt += f"\nPreferred Resource Types: {', '.join(preferred_resources)}"
+    if plan is None:
+        # A stream cannot fall back mid-response, so it only uses the tier's healthiest model
+        chain = routing.route(prompt, deadline)
+        model = next((candidate for candidate in chain.models if routing.claim(candidate)), None)
+        if model is None:
+            logger.info(f"No model of the {chain.tier} tier is available. Using mock mode.")
+            plan = dict(generate_mock_plan(**inputs), telemetry=telemetry.telemetry_for(telemetry.SOURCE_FALLBACK))
     
-    prompt += f"""
-Preferred UI Language: {preferred_language}
+    if plan is not None:
+        for name in PLAN_SECTIONS:
+            yield 'section', (name, plan[name])
+        yield 'done', plan
+        return
+    
+    parser = SectionParser()
+    # Not collected: this generator is suspended between sections
+    usage = telemetry.GenerationTelemetry()
+    try:
+        started = time.monotonic()
+        try:
+            attempts = telemetry.attempts()
+            stream = backend.create_completion(
+                model=model,
+                messages=build_messages(prompt),
+                temperature=0.7,
+                response_format={"type": "json_object"},
+                extra_headers=plan_request_headers(),
+                stream=True
+            )
+            usage.add(None, max(0, telemetry.attempts() - attempts - 1))
+            
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                for name, content in parser.feed(delta):
+                    if name in PLAN_SECTIONS:
+                        yield 'section', (name, content)
+        except Exception:
+            usage.add_latency(time.monotonic() - started)
+            openai_breaker.record_failure()
+            routing.record_failure(model)
+            raise
+        latency = time.monotonic() - started
+        usage.add_latency(latency)
+        openai_breaker.record_success(latency)
+        routing.record_success(model, latency)
+        
+        logger.info(f"OpenAI streaming call successful. Model: {model}")
+        
+        plan = {name: parser.sections.get(name, []) for name in PLAN_SECTIONS}
+        plan.update({'model_used': model, 'prompt_used': prompt})
+        if settings.PLAN_CACHE_ENABLED:
+            plan_cache.set(cache_key, model, plan)
+        plan['telemetry'] = usage.as_dict(telemetry.SOURCE_LLM)
+    
+    except Exception as e:
+        logger.error(f"OpenAI API error: {str(e)}")
+        # Fill whatever the stream did not deliver from the mock plan
+        logger.info("Falling back to mock mode due to API error.")
+        fallback = generate_mock_plan(**inputs)
+        plan = {name: parser.sections.get(name, fallback[name]) for name in PLAN_SECTIONS}
+        if parser.sections:
+            plan.update({'model_used': model, 'prompt_used': prompt})
+        else:
+            plan.update({'model_used': fallback['model_used'], 'prompt_used': fallback['prompt_used']})
+        plan['telemetry'] = usage.as_dict(telemetry.SOURCE_LLM if parser.sections else telemetry.SOURCE_FALLBACK)
+        for name in PLAN_SECTIONS:
+            if name not in parser.sections:
+                yield 'section', (name, plan[name])
+    
+    yield 'done', plan
 
-Please provide a JSON response with the following structure:
-{{
-    "weekly_roadmap": [
-        {{
+
+def build_messages(prompt: str) -> list:
+    """Chat messages for a plan generation request"""
+    return [
+        {
+            "role": "system",
+            "content": SYSTEM_MESSAGE
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+
+SECTION_SCHEMAS = {
+    'weekly_roadmap': """    "weekly_roadmap": [
+        {
             "week": 1,
             "focus": "Week focus description",
             "topics": ["topic1", "topic2"],
             "estimated_hours": 10
-        }}
-    ],
-    "daily_tasks": [
-        {{
+        }
+    ]""",
+    'daily_tasks': """    "daily_tasks": [
+        {
             "day": 1,
             "week": 1,
             "tasks": [
-                {{
+                {
                     "title": "Task title",
                     "description": "Task description",
                     "estimated_minutes": 30,
                     "type": "reading|listening|speaking|writing|grammar|vocabulary"
-                }}
+                }
             ]
-        }}
-    ],
-    "topics": [
-        {{
+        }
+    ]""",
+    'topics': """    "topics": [
+        {
             "name": "Topic name",
             "priority": "high|medium|low",
             "estimated_hours": 5,
             "description": "Topic description"
-        }}
-    ],
-    "resources": [
-        {{
+        }
+    ]""",
+    'resources': """    "resources": [
+        {
             "title": "Resource title",
             "type": "video|book|app|podcast|website",
             "description": "Resource description",
             "url": "optional-url-if-applicable"
-        }}
-    ],
-    "checkpoints": [
-        {{
+        }
+    ]""",
+    'checkpoints': """    "checkpoints": [
+        {
             "week": 2,
             "type": "quiz|assessment|review",
             "description": "Checkpoint description",
             "topics_covered": ["topic1", "topic2"]
-        }}
-    ]
-}}
+        }
+    ]""",
+}
+
+
+# Compact prompts, compiled once from the examples above
+prompt_compiler = PromptCompiler(SECTION_SCHEMAS, SYSTEM_MESSAGE)
+
+
+def _compiled_prompt(sections, **inputs) -> str:
+    compiled = prompt_compiler.compile(sections, **inputs)
+    logger.debug(
+        f"Compiled prompt for {', '.join(sections)}: {compiled.tokens} tokens, "
+        f"trimmed {compiled.trimmed}, {compiled.overrun} over budget"
+    )
+    return compiled.text
+
+
+def _prompt_header(
+    intro: str,
+    goal_text: str,
+    current_level: str,
+    daily_minutes: int,
+    deadline: Optional[str],
+    focus_areas: list,
+    preferred_resources: list,
+    preferred_language: str
+) -> str:
+    prompt = f"""{intro}
+
+Goal: {goal_text}
+Current Level: {current_level}
+Daily Available Time: {daily_minutes} minutes per day"""
+    
+    if deadline:
+        prompt += f"\nDeadline: {deadline}"
+    
+    if focus_areas:
+        prompt += f"\nFocus Areas: {', '.join(focus_areas)}"
+    
+    if preferred_resources:
+        prompt += f"\nPreferred Resource Types: {', '.join(preferred_resources)}"
+    
+    prompt += f"\nPreferred UI Language: {preferred_language}"
+    return prompt
+
+
+def _schema(sections) -> str:
+    return '{\n' + ',\n'.join(SECTION_SCHEMAS[name] for name in sections) + '\n}'
+
+
+def build_prompt(
+    goal_text: str,
+    current_level: str,
+    daily_minutes: int,
+    deadline: Optional[str] = None,
+    focus_areas: list = None,
+    preferred_resources: list = None,
+    preferred_language: str = 'en'
+) -> str:
+    """Build the prompt for OpenAI"""
+    focus_areas = focus_areas or []
+    preferred_resources = preferred_resources or []
+    
+    if settings.PLAN_PROMPT_COMPACT:
+        return _compiled_prompt(
+            PLAN_SECTIONS, goal_text=goal_text, current_level=current_level, daily_minutes=daily_minutes,
+            deadline=deadline, focus_areas=focus_areas, preferred_resources=preferred_resources,
+            preferred_language=preferred_language
+        )
+    
+    prompt = _prompt_header(
+        "Create a comprehensive, structured study plan in JSON format for the following learning goal:",
+        goal_text, current_level, daily_minutes, deadline, focus_areas, preferred_resources, preferred_language
+    )
+    
+    prompt += f"""
+
+Please provide a JSON response with the following structure:
+{_schema(PLAN_SECTIONS)}
 
 Make the plan realistic, progressive, and tailored to the user's level and available time. Ensure daily tasks fit within the {daily_minutes} minutes per day constraint."""
     
     return prompt
 
 
+def build_section_prompt(
+    sections,
+    context: Dict[str, Any],
+    goal_text: str,
+    current_level: str,
+    daily_minutes: int,
+    deadline: Optional[str] = None,
+    focus_areas: list = None,
+    preferred_resources: list = None,
+    preferred_language: str = 'en',
+    weeks: Optional[Tuple[int, int]] = None
+) -> str:
+    """
+    Build a prompt asking only for ``sections`` of a plan whose other sections are in ``context``
+    
+    ``weeks`` limits daily tasks to an inclusive range of weeks.
+    """
+    focus_areas = focus_areas or []
+    preferred_resources = preferred_resources or []
+    
+    if settings.PLAN_PROMPT_COMPACT:
+        return _compiled_prompt(
+            sections, goal_text=goal_text, current_level=current_level, daily_minutes=daily_minutes,
+            deadline=deadline, focus_areas=focus_areas, preferred_resources=preferred_resources,
+            preferred_language=preferred_language, context=context, weeks=weeks
+        )
+    
+    if context:
+        intro = "Update part of an existing structured study plan in JSON format for the following learning goal:"
+    else:
+        intro = "Create part of a structured study plan in JSON format for the following learning goal:"
+    prompt = _prompt_header(
+        intro,
+        goal_text, current_level, daily_minutes, deadline, focus_areas, preferred_resources, preferred_language
+    )
+    
+    if context:
+        prompt += f"""
+
+These sections of the plan are final and must stay consistent with your answer:
+{json.dumps(context, ensure_ascii=False, separators=(',', ':'))}"""
+    
+    prompt += f"""
+
+Please provide a JSON response containing only these sections:
+{_schema(sections)}
+
+Ensure daily tasks fit within the {daily_minutes} minutes per day constraint."""
+    
+    if weeks:
+        first, last = weeks
+        prompt += f"""
+Only include daily tasks for weeks {first} to {last}, numbering days from the start of the plan (week {first} starts on day {(first - 1) * 7 + 1})."""
+    
+    return prompt
+
+
 def generate_mock_plan(
     goal_text: str,
     current_level: str,
@@ -209,92 +829,15 @@ def generate_mock_plan(
     focus_areas: list = None,
     preferred_resources: list = None
 ) -> Dict[str, Any]:
-    """Generate a mock study plan when OpenAI is not available"""
-    focus_areas = focus_areas or ['reading', 'writing', 'listening', 'speaking']
-    preferred_resources = preferred_resources or ['videos', 'books']
-    
-    # Calculate number of weeks (default 12 weeks if no deadline)
-    weeks = 12
-    
-    weekly_roadmap = []
-    daily_tasks = []
-    topics = []
-    resources = []
-    checkpoints = []
-    
-    # Generate weekly roadmap
-    for week in range(1, weeks + 1):
-        weekly_roadmap.append({
-            'week': week,
-            'focus': f'Week {week} focus: Building foundation in {", ".join(focus_areas[:2])}',
-            'topics': [f'Topic {week}.1', f'Topic {week}.2'],
-            'estimated_hours': daily_minutes * 7 / 60  # Convert minutes to hours
-        })
-    
-    # Generate daily tasks for first 2 weeks as example
-    task_id = 1
-    for week in range(1, 3):
-        for day in range(1, 8):
-            tasks_for_day = []
-            remaining_minutes = daily_minutes
-            
-            # Add 2-3 tasks per day
-            for i in range(2):
-                task_minutes = min(remaining_minutes // 2, 30)
-                if task_minutes < 10:
-                    break
-                
-                task_type = focus_areas[i % len(focus_areas)]
-                tasks_for_day.append({
-                    'title': f'{task_type.capitalize()} Practice {task_id}',
-                    'description': f'Practice {task_type} skills with recommended resources',
-                    'estimated_minutes': task_minutes,
-                    'type': task_type
-                })
-                remaining_minutes -= task_minutes
-                task_id += 1
-            
-            if tasks_for_day:
-                daily_tasks.append({
-                    'day': (week - 1) * 7 + day,
-                    'week': week,
-                    'tasks': tasks_for_day
-                })
-    
-    # Generate topics
-    for i in range(1, 21):
-        topics.append({
-            'name': f'Topic {i}: Core Concept',
-            'priority': 'high' if i <= 7 else 'medium' if i <= 14 else 'low',
-            'estimated_hours': 2,
-            'description': f'Important topic for achieving your goal: {goal_text[:50]}...'
-        })
-    
-    # Generate resources
-    resource_types = preferred_resources or ['videos', 'books']
-    for i, res_type in enumerate(resource_types[:5]):
-        resources.append({
-            'title': f'Recommended {res_type.capitalize()} Resource {i+1}',
-            'type': res_type,
-            'description': f'A high-quality {res_type} resource for {current_level} level learners',
-            'url': None
-        })
-    
-    # Generate checkpoints
-    for week in [2, 4, 8, 12]:
-        checkpoints.append({
-            'week': week,
-            'type': 'assessment',
-            'description': f'Week {week} progress assessment and review',
-            'topics_covered': [f'Topic {week-1}.1', f'Topic {week-1}.2']
-        })
-    
-    return {
-        'weekly_roadmap': weekly_roadmap,
-        'daily_tasks': daily_tasks,
-        'topics': topics,
-        'resources': resources,
-        'checkpoints': checkpoints,
-        'model_used': 'mock-mode',
-        'prompt_used': f'Mock plan for: {goal_text}'
-    }
+    """Generate a plan with the local scheduler when OpenAI is not available"""
+    plan = schedule_plan(
+        goal_text=goal_text,
+        current_level=current_level,
+        daily_minutes=daily_minutes,
+        deadline=deadline,
+        focus_areas=focus_areas,
+        preferred_resources=preferred_resources
+    )
+    plan['model_used'] = 'mock-mode'
+    plan['prompt_used'] = f'Mock plan for: {goal_text}'
+    return plan
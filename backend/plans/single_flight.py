@@ -0,0 +1,138 @@
+"""
+Single-flight coalescing of identical upstream generations
+
+The first request for a key becomes the leader and calls the model;
+identical requests that arrive while it is running wait for its result
+instead of making their own call. Coordination goes through the
+GenerationFlight table so it works across worker processes. While the
+leader works, a heartbeat keeps its flight fresh so a slow generation
+is not taken over as abandoned.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import metrics
+from .models import GenerationFlight
+
+logger = logging.getLogger(__name__)
+
+# Finished flights are kept this long so slow followers can still read them
+FINISHED_RETENTION = timedelta(minutes=10)
+
+
+class SingleFlight:
+    """Database-coordinated single-flight group"""
+
+    def __init__(self, timeout: Optional[float] = None, poll_interval: Optional[float] = None):
+        self._timeout = timeout
+        self._poll_interval = poll_interval
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout if self._timeout is not None else settings.PLAN_SINGLE_FLIGHT_TIMEOUT
+
+    @property
+    def poll_interval(self) -> float:
+        return self._poll_interval if self._poll_interval is not None else settings.PLAN_SINGLE_FLIGHT_POLL_INTERVAL
+
+    @staticmethod
+    def _owner() -> str:
+        return f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+
+    def acquire(self, key: str) -> bool:
+        """Try to become the leader for ``key``"""
+        now = timezone.now()
+        try:
+            with transaction.atomic():
+                GenerationFlight.objects.create(key=key, owner=self._owner())
+            GenerationFlight.objects.filter(
+                status__in=['done', 'failed'],
+                updated_at__lt=now - FINISHED_RETENTION
+            ).delete()
+            return True
+        except IntegrityError:
+            pass
+
+        # Take over a finished flight, or one whose leader stopped updating it
+        stale = now - timedelta(seconds=self.timeout)
+        return bool(
+            GenerationFlight.objects.filter(key=key)
+            .filter(Q(status__in=['done', 'failed']) | Q(updated_at__lt=stale))
+            .update(status='running', owner=self._owner(), result_json=None, updated_at=now)
+        )
+
+    def heartbeat(self, key: str) -> threading.Event:
+        """Refresh the leader's flight every third of the timeout until the returned event is set"""
+        owner = self._owner()
+        stopped = threading.Event()
+
+        def beat():
+            try:
+                while not stopped.wait(self.timeout / 3):
+                    GenerationFlight.objects.filter(key=key, owner=owner, status='running').update(
+                        updated_at=timezone.now()
+                    )
+            except DatabaseError as e:
+                logger.warning(f"Single-flight heartbeat for {key[:12]} stopped: {str(e)}")
+            finally:
+                # The heartbeat thread owns its connection
+                connection.close()
+
+        threading.Thread(target=beat, name=f'single-flight-{key[:12]}', daemon=True).start()
+        return stopped
+
+    def release(self, key: str, result: Optional[Dict[str, Any]]):
+        """Publish the leader's result (None when it failed), unless another leader took the flight over"""
+        GenerationFlight.objects.filter(key=key, owner=self._owner(), status='running').update(
+            status='done' if result is not None else 'failed',
+            result_json=result,
+            updated_at=timezone.now()
+        )
+
+    def wait(self, key: str) -> Optional[Dict[str, Any]]:
+        """Wait for the leader of ``key`` and return its result, or None if it failed or timed out"""
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            flight = GenerationFlight.objects.filter(key=key).values('status', 'result_json').first()
+            if flight is None or flight['status'] == 'failed':
+                return None
+            if flight['status'] == 'done':
+                return flight['result_json']
+        return None
+
+    def run(self, key: str, fn: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        """Call ``fn`` once for all concurrent callers with the same ``key``"""
+        if self.acquire(key):
+            metrics.increment('single_flight.leader')
+            result = None
+            stopped = self.heartbeat(key)
+            try:
+                result = fn()
+                return result
+            finally:
+                stopped.set()
+                self.release(key, result)
+
+        result = self.wait(key)
+        if result is not None:
+            metrics.increment('single_flight.coalesced')
+            logger.info(f"Coalesced generation {key[:12]} with an in-flight request")
+            return result
+
+        # The leader failed or took too long; make our own call
+        metrics.increment('single_flight.fallthrough')
+        return fn()
+
+
+single_flight = SingleFlight()
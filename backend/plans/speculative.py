@@ -0,0 +1,116 @@
+"""
+Speculative plan regeneration
+
+A profile update is usually followed by a regenerate with exactly the
+new profile values. With PLAN_SPECULATIVE_ENABLED, the update queues a
+``speculative`` job for the user's active plan; the worker generates it
+like a regenerate but keeps the content on the job. A regenerate request
+with matching parameters adopts it: a finished result becomes the new
+version immediately, and a queued or running job simply becomes the
+regenerate job.
+"""
+import logging
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .incremental import changed_params
+from .jobs import complete_job, enqueue_plan_job, regenerate_plan_params
+from .models import Plan, PlanGenerationJob
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_speculative_regeneration(user) -> Optional[PlanGenerationJob]:
+    """
+    Queue a speculative regenerate of the user's active plan with their
+    current profile, unless it would not change anything or the user is
+    over their speculation limits
+    """
+    plan = Plan.objects.filter(user=user, is_active=True).first()
+    profile = getattr(user, 'study_profile', None)
+    if profile is None or plan is None:
+        return None
+    # The profile may have been saved through another instance
+    profile.refresh_from_db()
+
+    params = regenerate_plan_params(plan, {}, profile)
+    latest = plan.versions.first()
+    if latest is not None and latest.generation_params and not changed_params(latest.generation_params, params):
+        return None
+
+    # Only the newest profile matters: queued speculation for older ones is dropped
+    now = timezone.now()
+    jobs = PlanGenerationJob.objects.filter(user=user, kind='speculative')
+    superseded = jobs.filter(status='pending').update(
+        status='failed',
+        error='Superseded by a newer profile update',
+        finished_at=now
+    )
+    if superseded:
+        metrics.increment('speculative.superseded', superseded)
+
+    in_flight = jobs.filter(status__in=['pending', 'running']).count()
+    today = jobs.filter(created_at__gte=now - timedelta(days=1)).count()
+    if in_flight >= settings.PLAN_SPECULATIVE_MAX_IN_FLIGHT or today >= settings.PLAN_SPECULATIVE_MAX_PER_DAY:
+        metrics.increment('speculative.limited')
+        return None
+
+    metrics.increment('speculative.enqueued')
+    return enqueue_plan_job(user, 'speculative', params, plan=plan)
+
+
+def adopt_speculative_job(plan: Plan, params: Dict[str, Any]) -> Optional[PlanGenerationJob]:
+    """
+    Turn a speculative job generated for ``params`` into the regenerate job
+
+    Only jobs started after the plan's latest version and within
+    PLAN_SPECULATIVE_TTL qualify. Returns None when nothing matches.
+    """
+    if not settings.PLAN_SPECULATIVE_ENABLED:
+        return None
+
+    candidates = PlanGenerationJob.objects.filter(
+        plan=plan,
+        kind='speculative',
+        status__in=['pending', 'running', 'done'],
+        created_at__gte=timezone.now() - timedelta(seconds=settings.PLAN_SPECULATIVE_TTL)
+    ).order_by('-created_at')
+    latest = plan.versions.first()
+    if latest is not None:
+        candidates = candidates.filter(created_at__gte=latest.created_at)
+
+    for job in candidates:
+        if changed_params(job.params, params):
+            continue
+
+        # The kind flip is conditional so concurrent requests cannot both adopt a job
+        speculative = PlanGenerationJob.objects.filter(pk=job.pk, kind='speculative')
+        if speculative.filter(status__in=['pending', 'running']).update(kind='regenerate'):
+            # The worker finishes it as a regenerate
+            job.refresh_from_db()
+        else:
+            with transaction.atomic():
+                if not speculative.filter(status='done').update(kind='regenerate'):
+                    continue
+                job.refresh_from_db()
+                complete_job(job, job.result_json)
+
+        metrics.increment('speculative.hit')
+        logger.info(f"Regenerate of plan {plan.id} adopted speculative job {job.id} ({job.status})")
+        return job
+
+    metrics.increment('speculative.miss')
+    return None
+
+
+def speculative_stats() -> Dict[str, Any]:
+    """Speculation counters and the share of regenerates served by a speculative job"""
+    counters = {name.split('.', 1)[1]: value for name, value in metrics.get_counters('speculative.').items()}
+    lookups = counters.get('hit', 0) + counters.get('miss', 0)
+    counters['hit_rate'] = counters.get('hit', 0) / lookups if lookups else None
+    return counters
@@ -0,0 +1,267 @@
+"""
+Local OpenAI-compatible chat completions server for benchmarks and tests
+
+Serves ``POST /v1/chat/completions`` with a canned plan so the real
+client code path (HTTP, JSON, connection pooling) can be exercised
+without network access or token costs. Latency follows a configurable
+distribution, ``token_delay`` adds a per completion-token delay to model
+generation speed and ``prompt_token_delay`` a per prompt-token delay to
+model reading the prompt, a share of requests can fail like an
+overloaded API, and ``stream: true`` requests get server-sent event
+chunks. Latency can be set per requested model to compare model tiers.
+
+Plan generations name the sections (and weeks of daily tasks) they ask
+for in request headers (see services.plan_request_headers), so
+responders do not depend on the prompt format.
+"""
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple, Union
+
+# Characters of completion text per streamed chunk (roughly one token)
+STREAM_CHUNK_SIZE = 4
+
+# Latency distributions: name -> (number of parameters, sampler)
+LATENCY_DISTRIBUTIONS = {
+    'fixed': (1, lambda rng, seconds: seconds),
+    'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+    'normal': (2, lambda rng, mean, sd: rng.gauss(mean, sd)),
+    'lognormal': (2, lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0),
+    'exponential': (1, lambda rng, mean: rng.expovariate(1 / mean) if mean > 0 else 0.0),
+}
+
+
+def parse_latency(spec: Union[float, str]) -> Callable[[random.Random], float]:
+    """
+    Latency sampler from a number of seconds or a ``name:params`` spec
+
+    ``fixed:0.2``, ``uniform:0.1,0.5``, ``normal:0.3,0.05``,
+    ``lognormal:0.8,0.5`` (median and sigma) or ``exponential:0.3``
+    (mean). Samples are never negative.
+    """
+    if isinstance(spec, (int, float)):
+        return lambda rng: spec
+    name, _, params = str(spec).partition(':')
+    if not params:
+        name, params = 'fixed', name
+    if name not in LATENCY_DISTRIBUTIONS:
+        raise ValueError(f"Unknown latency distribution '{name}'")
+    arity, sample = LATENCY_DISTRIBUTIONS[name]
+    values = [float(value) for value in params.split(',')]
+    if len(values) != arity:
+        raise ValueError(f"Latency distribution '{name}' takes {arity} parameter(s)")
+    return lambda rng: max(0.0, sample(rng, *values))
+
+
+def default_stub_content() -> Dict[str, Any]:
+    """Plan sections returned by the stub unless others are configured"""
+    from .services import generate_mock_plan, PLAN_SECTIONS
+    plan = generate_mock_plan(goal_text='Stub goal', current_level='beginner', daily_minutes=60)
+    return {name: plan[name] for name in PLAN_SECTIONS}
+
+
+def requested_sections(headers: Mapping[str, str]) -> Tuple[Optional[Tuple[str, ...]], Optional[Tuple[int, int]]]:
+    """Sections and weeks named by plan_request_headers; None when a request does not say"""
+    from .services import SECTIONS_HEADER, WEEKS_HEADER
+
+    sections = headers.get(SECTIONS_HEADER)
+    weeks = headers.get(WEEKS_HEADER)
+    if weeks:
+        first, _, last = weeks.partition('-')
+        weeks = (int(first), int(last or first))
+    return (tuple(name for name in sections.split(',') if name) if sections else None), weeks or None
+
+
+def section_stub_content(plan: Dict[str, Any]) -> Callable[[Mapping[str, str]], Dict[str, Any]]:
+    """
+    Stub responder returning only the sections (and weeks of daily tasks)
+    a request's headers ask for, so full and per-section requests get
+    realistic sizes; requests that do not say get the whole plan
+    """
+    from .services import PLAN_SECTIONS
+
+    def respond(headers: Mapping[str, str]) -> Dict[str, Any]:
+        sections, weeks = requested_sections(headers)
+        content = {name: plan[name] for name in sections or PLAN_SECTIONS if name in plan}
+        if weeks and 'daily_tasks' in content:
+            first, last = weeks
+            content['daily_tasks'] = [day for day in content['daily_tasks'] if first <= day['week'] <= last]
+        return content
+    return respond
+
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    """Request handler speaking a minimal subset of the chat completions API"""
+    protocol_version = 'HTTP/1.1'  # Keep connections alive like the real API
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        request = json.loads(body or b'{}')
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            failed = server.error_rate and server.random.random() < server.error_rate
+            latency = server.model_latency.get(request.get('model'), server.latency)(server.random)
+
+        if failed:
+            with server.lock:
+                server.errors += 1
+            time.sleep(latency)
+            self._send_json(server.error_status, {
+                'error': {'message': 'Stub server error', 'type': 'server_error', 'code': None},
+            })
+            return
+
+        content = server.content
+        if callable(content):
+            content = content(self.headers)
+        content = json.dumps(content)
+        usage = {
+            'prompt_tokens': len(body) // 4,
+            'completion_tokens': len(content) // 4,
+            'total_tokens': (len(body) + len(content)) // 4,
+        }
+        # Reading the prompt delays the first token
+        latency += server.prompt_token_delay * usage['prompt_tokens']
+        completion = {
+            'id': f'chatcmpl-{uuid.uuid4().hex}',
+            'created': int(time.time()),
+            'model': request.get('model', 'stub'),
+        }
+
+        if request.get('stream'):
+            self._stream(completion, content, latency)
+            return
+
+        delay = latency + server.token_delay * (len(content) // 4)
+        if delay:
+            time.sleep(delay)
+        self._send_json(200, {
+            **completion,
+            'object': 'chat.completion',
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': usage,
+        })
+
+    def _stream(self, completion: Dict[str, Any], content: str, latency: float):
+        """Send ``content`` as server-sent chat.completion.chunk events after ``latency`` (time to first token)"""
+        time.sleep(latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None):
+            event = {
+                **completion,
+                'object': 'chat.completion.chunk',
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+            }
+            self._write_chunk(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+
+        chunk({'role': 'assistant', 'content': ''})
+        for start in range(0, len(content), STREAM_CHUNK_SIZE):
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+            chunk({'content': content[start:start + STREAM_CHUNK_SIZE]})
+        chunk({}, 'stop')
+        self._write_chunk(b'data: [DONE]\n\n')
+        self._write_chunk(b'')
+
+    def _write_chunk(self, data: bytes):
+        """Write one HTTP/1.1 chunk; an empty one ends the response"""
+        self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: Dict[str, Any]):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """
+    Threaded stub server bound to localhost.
+
+    Use as a context manager to run it on a background thread::
+
+        with StubLLMServer(latency=0.2) as server:
+            ... OPENAI_BASE_URL = server.url ...
+
+    ``content`` is the JSON object to return, or a callable building it
+    from the request headers (see requested_sections). ``latency`` is seconds
+    or a distribution spec (see parse_latency); ``error_rate`` of the
+    requests fail with ``error_status``. ``model_latency`` maps model
+    names to their own latency specs. Pass ``seed`` for repeatable
+    latencies and failures.
+    """
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        latency: Union[float, str] = 0.0,
+        content: Optional[Union[Dict[str, Any], Callable[[Mapping[str, str]], Dict[str, Any]]]] = None,
+        token_delay: float = 0.0,
+        prompt_token_delay: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: Optional[int] = None,
+        model_latency: Optional[Dict[str, Union[float, str]]] = None
+    ):
+        super().__init__((host, port), StubLLMHandler)
+        self.latency = parse_latency(latency)
+        self.model_latency = {model: parse_latency(spec) for model, spec in (model_latency or {}).items()}
+        self.token_delay = token_delay
+        self.prompt_token_delay = prompt_token_delay
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.content = content if content is not None else default_stub_content()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
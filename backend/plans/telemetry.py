@@ -0,0 +1,189 @@
+"""
+Per-generation model telemetry
+
+Every upstream completion made while a generation is being collected
+adds its token usage, duration and retries to that generation's
+telemetry, which ends up on the PlanVersion (source, prompt/completion
+tokens, upstream latency and retries). The latency is the sum of the
+measured upstream calls, not the time spent around them (repair,
+caching, bookkeeping). Retries are counted with an HTTP request hook on
+the OpenAI client: each attempt is one request.
+
+The aggregates behind the admin dashboard are computed in the database.
+"""
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+from django.db import connection
+from django.db.models import Aggregate, Count, FloatField, Sum
+from django.db.models.functions import TruncDate
+
+from .models import PlanVersion
+
+# Where a version's content came from
+SOURCE_LLM = 'llm'
+SOURCE_CACHE = 'cache'
+SOURCE_FALLBACK = 'fallback'
+SOURCE_INCREMENTAL = 'incremental'
+
+PERCENTILES = (0.5, 0.95, 0.99)
+
+_local = threading.local()
+
+
+class GenerationTelemetry:
+    """Upstream usage accumulated over one plan generation"""
+
+    def __init__(self):
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.retries = 0
+        self.calls = 0
+        self.upstream_seconds = 0.0
+
+    def add(self, response: Any, retries: int = 0, latency: Optional[float] = None):
+        usage = getattr(response, 'usage', None)
+        if usage is not None:
+            self.prompt_tokens = (self.prompt_tokens or 0) + (getattr(usage, 'prompt_tokens', 0) or 0)
+            self.completion_tokens = (self.completion_tokens or 0) + (getattr(usage, 'completion_tokens', 0) or 0)
+        self.retries += retries
+        self.calls += 1
+        if latency is not None:
+            self.add_latency(latency)
+
+    def add_latency(self, seconds: float):
+        """Add the measured duration of an upstream call"""
+        self.upstream_seconds += seconds
+
+    def as_dict(self, source: str) -> Dict[str, Any]:
+        """Telemetry for a plan; latency is the summed duration of its upstream calls"""
+        return {
+            'source': source,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'latency_ms': round(self.upstream_seconds * 1000) if self.calls else None,
+            'retries': self.retries,
+        }
+
+
+def telemetry_for(source: str) -> Dict[str, Any]:
+    """Telemetry of a plan made without any upstream call"""
+    return {'source': source, 'prompt_tokens': None, 'completion_tokens': None, 'latency_ms': None, 'retries': 0}
+
+
+@contextmanager
+def collect() -> Iterator[GenerationTelemetry]:
+    """Collect the completions made by this thread until the block exits"""
+    telemetry = GenerationTelemetry()
+    previous = getattr(_local, 'telemetry', None)
+    _local.telemetry = telemetry
+    try:
+        yield telemetry
+    finally:
+        _local.telemetry = previous
+
+
+def record_completion(response: Any, retries: int = 0, latency: Optional[float] = None):
+    """Add a completion (and how long it took, in seconds) to the generation being collected by this thread, if any"""
+    telemetry = getattr(_local, 'telemetry', None)
+    if telemetry is not None:
+        telemetry.add(response, retries, latency)
+
+
+def count_attempt(request=None):
+    """HTTP request hook: one upstream attempt by this thread"""
+    _local.attempts = getattr(_local, 'attempts', 0) + 1
+
+
+def attempts() -> int:
+    """Upstream attempts made by this thread so far"""
+    return getattr(_local, 'attempts', 0)
+
+
+class Percentile(Aggregate):
+    """Continuous percentile (PostgreSQL ``percentile_cont``)"""
+    function = 'PERCENTILE_CONT'
+    name = 'Percentile'
+    template = '%(function)s(%(percentile)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, percentile: float, **extra):
+        super().__init__(expression, percentile=percentile, **extra)
+
+
+def _percentile_key(percentile: float) -> str:
+    return f'p{round(percentile * 100)}_ms'
+
+
+def latency_by_model(since: datetime) -> List[Dict[str, Any]]:
+    """
+    Upstream latency percentiles, retries and version counts per model
+    for versions generated by the model since ``since``
+
+    PostgreSQL computes the percentiles in the grouping query; other
+    databases get one ordered OFFSET query per model and percentile
+    (nearest rank).
+    """
+    versions = PlanVersion.objects.filter(created_at__gte=since, source=SOURCE_LLM, latency_ms__isnull=False)
+    rows = list(
+        versions.values('model_used')
+        .annotate(
+            versions=Count('id'),
+            total_retries=Sum('retries'),
+            **(
+                {_percentile_key(p): Percentile('latency_ms', p) for p in PERCENTILES}
+                if connection.vendor == 'postgresql' else {}
+            )
+        )
+        .order_by('model_used')
+    )
+
+    if connection.vendor != 'postgresql':
+        for row in rows:
+            latencies = versions.filter(model_used=row['model_used']).order_by('latency_ms').values_list('latency_ms', flat=True)
+            for p in PERCENTILES:
+                row[_percentile_key(p)] = float(latencies[min(row['versions'] - 1, int(row['versions'] * p))])
+    return rows
+
+
+def completion_speed(model: str, since: datetime) -> Dict[str, Any]:
+    """
+    Upstream milliseconds per completion token of ``model`` over its
+    versions since ``since`` (None without any), for latency estimates
+    """
+    totals = PlanVersion.objects.filter(
+        created_at__gte=since, model_used=model, source=SOURCE_LLM,
+        latency_ms__isnull=False, completion_tokens__gt=0
+    ).aggregate(versions=Count('id'), total_latency_ms=Sum('latency_ms'), total_completion_tokens=Sum('completion_tokens'))
+    return {
+        'versions': totals['versions'],
+        'ms_per_token': totals['total_latency_ms'] / totals['total_completion_tokens'] if totals['versions'] else None,
+    }
+
+
+def tokens_by_day(since: datetime) -> List[Dict[str, Any]]:
+    """Prompt and completion tokens per day and model since ``since``"""
+    return list(
+        PlanVersion.objects.filter(created_at__gte=since, prompt_tokens__isnull=False)
+        .annotate(date=TruncDate('created_at'))
+        .values('date', 'model_used')
+        .annotate(
+            versions=Count('id'),
+            total_prompt_tokens=Sum('prompt_tokens'),
+            total_completion_tokens=Sum('completion_tokens')
+        )
+        .order_by('date', 'model_used')
+    )
+
+
+def versions_by_source(since: datetime) -> Dict[str, int]:
+    """Number of versions per source since ``since``"""
+    return dict(
+        PlanVersion.objects.filter(created_at__gte=since)
+        .values('source')
+        .annotate(count=Count('id'))
+        .order_by()
+        .values_list('source', 'count')
+    )
@@ -1,11 +1,74 @@
-from django.test import TestCase
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Plan, PlanVersion
+from .models import Plan, PlanVersion, PlanWeek, PlanGenerationJob
+from .jobs import (
+    PlanWorker, claim_jobs, complete_job, create_plan, enqueue_plan_job, fail_job, requeue_stale_jobs, run_pending_jobs
+)
+from .views import PlanGenerationThrottle
+from .models import PlanCacheEntry, GenerationCounter, GenerationFlight
+from .metrics import counter_buffer, get_counters, increment
+from .single_flight import SingleFlight
+from .circuit_breaker import openai_breaker
+from . import routing
+from .models import CircuitBreakerState, IdempotencyKey
+from .telemetry import Percentile, latency_by_model
+from .projection import Projection
+from .pagination import estimated_count
+from .cache import PlanCache, plan_cache, plan_cache_key
+from .rendered import RenderedVersionCache, rendered_versions
+from .parsing import SectionParser, recover_sections
+from .prompts import compact_schema, count_tokens
+from .cassette import Cassette, CassetteMiss
+from .llm import LLMBackend, get_llm_backend, get_openai_client, reset_llm_backends, reset_openai_client
+from .stub_server import StubLLMServer, parse_latency, section_stub_content
+from .validation import repair_plan
+from .speculative import speculative_stats
+from accounts.models import StudyProfile
+from .scheduling import DEFAULT_PLAN_WEEKS, MAX_PLAN_WEEKS, fit_day_to_budget, schedule_plan
+from .services import (
+    OUTLINE_SECTIONS, PLAN_SECTIONS, build_prompt, build_section_prompt, generate_mock_plan, generate_study_plan,
+    prompt_compiler, stream_study_plan
+)
 
 User = get_user_model()
 
+# Counters are written through so each test's counts roll back with it
+write_counters_through = override_settings(PLAN_METRICS_FLUSH_INTERVAL=0)
+
+
+def setUpModule():
+    write_counters_through.enable()
+
+
+def tearDownModule():
+    write_counters_through.disable()
+
+
+def postgresql_sql(queryset, backend=None):
+    """SQL and parameters of ``queryset`` as PostgreSQL would run it; compiling needs no server"""
+    return queryset.query.get_compiler(connection=backend or postgresql_backend()).as_sql()
+
+
+def postgresql_backend():
+    from django.db.backends.postgresql.base import DatabaseWrapper
+    return DatabaseWrapper(dict(connection.settings_dict, ENGINE='django.db.backends.postgresql'), alias='postgresql')
+
 
 class PlanTests(TestCase):
     """Tests for plan endpoints"""
@@ -39,8 +102,17 @@ class PlanTests(TestCase):
         }
         
         response = self.client.post('/api/plans/', plan_data, format='json')
-        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
-        self.assertEqual(response.data['title'], 'Learn English')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertFalse(Plan.objects.exists())
+        
+        run_pending_jobs()
+        
+        # Job status returns the finished version
+        response = self.client.get(f"/api/plans/jobs/{response.data['id']}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertIn('weekly_roadmap', response.data['version']['content_json'])
         
         # Verify plan was created
         plan = Plan.objects.get(title='Learn English')
@@ -103,6 +175,1857 @@ class PlanTests(TestCase):
             format='json'
         )
         
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['plan'], plan.id)
+        
+        run_pending_jobs()
+        
         # Verify new version was created
         self.assertEqual(plan.versions.count(), 2)
+    
+    def test_list_summarizes_versions_without_content(self):
+        """Test that the list returns version counts and latest summaries in constant queries"""
+        for index in range(3):
+            plan = Plan.objects.create(user=self.user, title=f'Plan {index}', goal_text='Goal', is_active=False)
+            for number in range(1, index + 1):
+                PlanVersion.objects.create(
+                    plan=plan, version_number=number, content_json={'weekly_roadmap': [{'week': 1}]},
+                    prompt_used='', model_used=f'model-{number}'
+                )
+        
+        # Authentication, the ETag aggregate and the page
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/plans/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        plans = {plan['title']: plan for plan in response.data['results']}
+        self.assertEqual(plans['Plan 2']['versions_count'], 2)
+        self.assertEqual(plans['Plan 2']['latest_version']['version_number'], 2)
+        self.assertEqual(plans['Plan 2']['latest_version']['model_used'], 'model-2')
+        self.assertEqual(plans['Plan 0']['versions_count'], 0)
+        self.assertIsNone(plans['Plan 0']['latest_version'])
+        self.assertNotIn('content_json', response.content.decode())
+        
+        detail = self.client.get(f"/api/plans/{plans['Plan 2']['id']}")
+        self.assertEqual(detail.data['latest_version']['content_json'], {'weekly_roadmap': [{'week': 1}]})
+        self.assertEqual(len(detail.data['versions']), 2)
+    
+    def test_detail_projects_fields_sections_and_week(self):
+        """Test that plan detail returns only the requested fields, sections and week"""
+        plan = Plan.objects.create(user=self.user, title='Plan', goal_text='Goal')
+        content = {
+            'weekly_roadmap': [{'week': 1, 'focus': 'a'}, {'week': 3, 'focus': 'c'}],
+            'daily_tasks': [{'day': 1, 'week': 1, 'tasks': []}, {'day': 15, 'week': 3, 'tasks': []}],
+            'topics': [{'name': 'Verbs'}],
+        }
+        PlanVersion.objects.create(plan=plan, version_number=1, content_json=content, prompt_used='', model_used='m')
+        
+        response = self.client.get(f'/api/plans/{plan.id}?fields=id,latest_version&sections=weekly_roadmap,daily_tasks&week=3')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data), {'id', 'latest_version'})
+        self.assertEqual(response.data['latest_version']['content_json'], {
+            'weekly_roadmap': [{'week': 3, 'focus': 'c'}],
+            'daily_tasks': [{'day': 15, 'week': 3, 'tasks': []}],
+        })
+        
+        response = self.client.get(f'/api/plans/{plan.id}?fields=versions&sections=topics')
+        self.assertEqual(response.data['versions'][0]['content_json'], {'topics': [{'name': 'Verbs'}]})
+        
+        response = self.client.get(f'/api/plans/{plan.id}')
+        self.assertEqual(response.data['latest_version']['content_json'], content)
+        
+        for query in ('fields=id,secret', 'sections=notes', 'week=third'):
+            response = self.client.get(f'/api/plans/{plan.id}?{query}')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+    
+    def test_projection_compiles_for_postgresql(self):
+        """Test the JSONB extraction PostgreSQL uses for sections and weeks"""
+        backend = postgresql_backend()
+        with mock.patch('plans.projection.connection', backend):
+            versions = Projection(sections=('weekly_roadmap', 'topics'), week=3).versions(PlanVersion.objects.all())
+        
+        sql, params = postgresql_sql(versions, backend)
+        
+        self.assertIn(
+            'jsonb_path_query_array(("plan_versions"."content_json" -> %s), (%s)::jsonpath, (%s)::jsonb) AS "section_weekly_roadmap"',
+            sql
+        )
+        self.assertIn('("plan_versions"."content_json" -> %s) AS "section_topics"', sql)
+        self.assertNotIn('"plan_versions"."content_json",', sql)
+        self.assertEqual(params, ('weekly_roadmap', '$[*] ? (@.week == $week)', '{"week": 3}', 'topics'))
+    
+    @skipUnless(connection.vendor == 'postgresql', 'JSONB paths are PostgreSQL only')
+    def test_projection_on_postgresql(self):
+        """Test that PostgreSQL extracts and filters sections without loading the content"""
+        plan = Plan.objects.create(user=self.user, title='Plan', goal_text='Goal')
+        content = {'weekly_roadmap': [{'week': 1}, {'week': 3, 'focus': 'c'}], 'topics': [{'name': 'Verbs'}]}
+        PlanVersion.objects.create(plan=plan, version_number=1, content_json=content, prompt_used='', model_used='m')
+        projection = Projection(sections=('weekly_roadmap', 'topics'), week=3)
+        
+        version = projection.versions(plan.versions.all()).get()
+        
+        self.assertNotIn('content_json', version.__dict__)
+        self.assertEqual(projection.content(version), {
+            'weekly_roadmap': [{'week': 3, 'focus': 'c'}],
+            'topics': [{'name': 'Verbs'}],
+        })
+    
+    def test_conditional_get_of_list_and_detail(self):
+        """Test that unchanged plan lists and details are answered with 304"""
+        plan = Plan.objects.create(user=self.user, title='Plan', goal_text='Goal')
+        PlanVersion.objects.create(plan=plan, version_number=1, content_json={}, prompt_used='', model_used='m')
+        
+        for url in ('/api/plans/', f'/api/plans/{plan.id}', f'/api/plans/{plan.id}?fields=id'):
+            response = self.client.get(url)
+            etag = response['ETag']
+            self.assertIn('no-cache', response['Cache-Control'])
+            
+            # Authentication and the aggregate over the plans, which does not join their versions
+            with self.assertNumQueries(2) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertNotIn('JOIN', queries.captured_queries[-1]['sql'])
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response['ETag'], etag)
+        
+        list_etag = self.client.get('/api/plans/')['ETag']
+        detail_etag = self.client.get(f'/api/plans/{plan.id}')['ETag']
+        self.assertNotEqual(self.client.get('/api/plans/?fields=id')['ETag'], list_etag)
+        
+        PlanVersion.objects.create(plan=plan, version_number=2, content_json={}, prompt_used='', model_used='m')
+        self.assertEqual(self.client.get('/api/plans/', HTTP_IF_NONE_MATCH=list_etag).status_code, status.HTTP_200_OK)
+        response = self.client.get(f'/api/plans/{plan.id}', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['latest_version']['version_number'], 2)
+        
+        # Creating an active plan deactivates this one
+        detail_etag = response['ETag']
+        Plan.objects.create(user=self.user, title='Other', goal_text='Goal')
+        response = self.client.get(f'/api/plans/{plan.id}', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.data['is_active'])
+    
+    def test_list_pages_by_cursor(self):
+        """Test that plan pages follow cursors without counting or offsets"""
+        for index in range(25):
+            Plan.objects.create(user=self.user, title=f'Plan {index}', goal_text='Goal', is_active=False)
+        
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/plans/')
+        self.assertNotIn('count', response.data)
+        self.assertFalse(any('OFFSET' in query['sql'] or 'COUNT(*)' in query['sql'] for query in queries))
+        self.assertEqual(len(response.data['results']), 20)
+        titles = [plan['title'] for plan in response.data['results']]
+        
+        response = self.client.get(response.data['next'])
+        titles += [plan['title'] for plan in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(titles, [f'Plan {index}' for index in reversed(range(25))])
+        
+        # Off PostgreSQL the estimate is an exact count
+        response = self.client.get('/api/plans/?count=estimated')
+        self.assertEqual(response.data['count'], 25)
+    
+    def test_estimated_count_reads_the_postgresql_plan(self):
+        """Test that the estimate comes from EXPLAIN (FORMAT JSON) row estimates on PostgreSQL"""
+        self.assertEqual(postgresql_backend().ops.explain_query_prefix(format='json').upper(), 'EXPLAIN (FORMAT JSON)')
+        plans = Plan.objects.filter(user=self.user).order_by('-created_at')
+        explained = json.dumps([{'Plan': {'Node Type': 'Index Scan', 'Plan Rows': 1234}}])
+        
+        with mock.patch('plans.pagination.connection', postgresql_backend()):
+            with mock.patch.object(type(plans), 'explain', return_value=explained) as explain:
+                self.assertEqual(estimated_count(plans), 1234)
+            explain.assert_called_once_with(format='json')
+            
+            with mock.patch.object(type(plans), 'explain', side_effect=DatabaseError('no planner')):
+                self.assertIsNone(estimated_count(plans))
+    
+    @skipUnless(connection.vendor == 'postgresql', 'planner estimates are PostgreSQL only')
+    def test_estimated_count_on_postgresql(self):
+        """Test that PostgreSQL returns a planner estimate without counting"""
+        with CaptureQueriesContext(connection) as queries:
+            estimate = estimated_count(Plan.objects.filter(user=self.user))
+        
+        self.assertIsInstance(estimate, int)
+        self.assertEqual(len(queries), 1)
+        self.assertTrue(queries[0]['sql'].upper().startswith('EXPLAIN (FORMAT JSON)'))
+    
+    def test_job_status_is_private(self):
+        """Test that users cannot see other users' generation jobs"""
+        other = User.objects.create_user(username='other', password='testpass123')
+        job = enqueue_plan_job(other, 'create', {'title': 'Other', 'goal_text': 'Other goal'})
+        
+        response = self.client.get(f'/api/plans/jobs/{job.id}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RenderedVersionCacheTests(TestCase):
+    """Tests for the rendered plan version cache"""
+    
+    def setUp(self):
+        rendered_versions.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='testuser', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.plan = Plan.objects.create(user=self.user, title='Plan', goal_text='Goal')
+        for number in (1, 2):
+            PlanVersion.objects.create(
+                plan=self.plan, version_number=number, prompt_used='', model_used='m',
+                content_json={'weekly_roadmap': [{'week': 1, 'focus': f'Versión {number}'}], 'topics': []}
+            )
+    
+    def tearDown(self):
+        rendered_versions.clear()
+    
+    def test_spliced_detail_matches_serialized_detail(self):
+        """Test that spliced responses are byte-identical and skip loading cached versions"""
+        for query in ('', '?fields=id,title,latest_version', '?fields=versions', '?fields=id'):
+            expected = self.client.get(f'/api/plans/{self.plan.id}{query}')
+            with override_settings(PLAN_RENDERED_CACHE_ENABLED=True):
+                response = self.client.get(f'/api/plans/{self.plan.id}{query}')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(response.content, expected.content)
+        
+        # The ETag aggregate, the plan and the version keys; no version content
+        with override_settings(PLAN_RENDERED_CACHE_ENABLED=True), self.assertNumQueries(3):
+            response = self.client.get(f'/api/plans/{self.plan.id}')
+        self.assertEqual(json.loads(response.content)['latest_version']['version_number'], 2)
+    
+    def test_directory_cache_is_shared_between_processes(self):
+        """Test that renderings stored in the directory cache are used by a process without them"""
+        with tempfile.TemporaryDirectory() as directory, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'plan_versions': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+        }):
+            versions = self.plan.versions.all()
+            rendered = rendered_versions.render(versions)
+            rendered_versions.clear()
+            with self.assertNumQueries(1):
+                self.assertEqual(rendered_versions.render(versions), rendered)
+    
+    def test_lru_eviction_is_bounded_by_size(self):
+        """Test that the least recently used renderings are evicted past the byte limit"""
+        cache = RenderedVersionCache(max_bytes=10)
+        cache.set_many({'a': b'1234', 'b': b'1234'})
+        cache.get_many(['a'])
+        cache.set_many({'c': b'1234', 'huge': b'x' * 11})
+        self.assertEqual(set(cache.get_many(['a', 'b', 'c', 'huge'])), {'a', 'c'})
+        self.assertLessEqual(cache.size, 10)
+
+
+class IdempotencyTests(TestCase):
+    """Tests for Idempotency-Key on plan create and regenerate"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='idempotent', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.data = {'title': 'Learn English', 'goal_text': 'IELTS 7.0', 'daily_minutes': 60}
+    
+    def _create(self, key, data=None):
+        return self.client.post('/api/plans/', data or self.data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+    
+    def test_retry_returns_the_first_job(self):
+        """Test that a retry gets the same job, in its current state, without a second generation"""
+        first = self._create('retry-1')
+        self.assertEqual(first.status_code, status.HTTP_202_ACCEPTED)
+        self.assertNotIn('Idempotent-Replayed', first)
+        
+        retry = self._create('retry-1')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        
+        run_pending_jobs()
+        done = self._create('retry-1')
+        self.assertEqual(done.data['status'], 'done')
+        self.assertIsNotNone(done.data['version'])
+        self.assertEqual(PlanGenerationJob.objects.count(), 1)
+        self.assertEqual(Plan.objects.filter(user=self.user).count(), 1)
+        
+        self.assertNotEqual(self._create('retry-2').data['id'], first.data['id'])
+        self.assertNotEqual(self.client.post('/api/plans/', self.data, format='json').data['id'], first.data['id'])
+    
+    def test_key_reused_for_another_request(self):
+        """Test that a key cannot be replayed with a different body or endpoint"""
+        self._create('reused')
+        response = self._create('reused', dict(self.data, daily_minutes=30))
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        
+        plan = Plan.objects.create(user=self.user, title='Plan', goal_text='Goal')
+        response = self.client.post(f'/api/plans/{plan.id}/regenerate', self.data, format='json', HTTP_IDEMPOTENCY_KEY='reused')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(PlanGenerationJob.objects.count(), 1)
+    
+    def test_regenerate_and_expiry(self):
+        """Test that regenerate retries are deduplicated and keys expire after the TTL"""
+        plan = Plan.objects.create(user=self.user, title='Plan', goal_text='Goal')
+        url = f'/api/plans/{plan.id}/regenerate'
+        first = self.client.post(url, {'daily_minutes': 90}, format='json', HTTP_IDEMPOTENCY_KEY='regen')
+        retry = self.client.post(url, {'daily_minutes': 90}, format='json', HTTP_IDEMPOTENCY_KEY='regen')
+        self.assertEqual(retry.data['id'], first.data['id'])
+        
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        later = self.client.post(url, {'daily_minutes': 90}, format='json', HTTP_IDEMPOTENCY_KEY='regen')
+        self.assertNotEqual(later.data['id'], first.data['id'])
+        self.assertEqual(IdempotencyKey.objects.get().job_id, later.data['id'])
+        
+        other = User.objects.create_user(username='other', password='testpass123')
+        self.client.force_authenticate(other)
+        self.assertEqual(self._create('regen').status_code, status.HTTP_202_ACCEPTED)
+
+
+class FakeLLMBackend:
+    """Slow stand-in for the LLM that records how many calls overlap"""
+    
+    def __init__(self, delay=0.05, fail_for=None):
+        self.delay = delay
+        self.fail_for = fail_for
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+    
+    def __call__(self, goal_text, **kwargs):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            if goal_text == self.fail_for:
+                raise RuntimeError('upstream error')
+            kwargs.pop('preferred_language', None)
+            kwargs.pop('use_cache', None)
+            plan = generate_mock_plan(goal_text=goal_text, **kwargs)
+            plan['model_used'] = 'fake-llm'
+            return plan
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+@override_settings(OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test', PLAN_CACHE_ENABLED=True)
+class PlanEstimateTests(TestCase):
+    """Tests for the dry-run estimate endpoint"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='estimate', password='testpass123')
+        self.client.force_authenticate(self.user)
+        client_patch = mock.patch('plans.llm.get_openai_client')
+        self.openai = client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self.data = {key: value for key, value in PLAN_INPUTS.items() if key not in ('deadline', 'preferred_language')}
+        self.data['title'] = 'Estimate'
+    
+    def test_estimate_from_recent_telemetry(self):
+        """Test tokens and latency scaled by the model's recent milliseconds per token, with no upstream call"""
+        response = self.client.post('/api/plans/estimate', self.data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['source'], 'llm')
+        self.assertEqual(response.data['model'], 'gpt-test')
+        self.assertGreater(response.data['input_tokens'], 100)
+        self.assertGreater(response.data['output_tokens'], response.data['input_tokens'])
+        self.assertIsNone(response.data['expected_latency_ms'])
+        
+        plan = Plan.objects.create(user=self.user, title='Old', goal_text='Goal')
+        PlanVersion.objects.create(
+            plan=plan, version_number=1, content_json={}, prompt_used='', model_used='gpt-test',
+            source='llm', latency_ms=20000, completion_tokens=1000
+        )
+        response = self.client.post('/api/plans/estimate', self.data, format='json')
+        self.assertEqual(response.data['expected_latency_ms'], 20 * response.data['output_tokens'])
+        self.assertEqual(response.data['telemetry_versions'], 1)
+        
+        self.openai.assert_not_called()
+        self.assertFalse(PlanGenerationJob.objects.exists())
+    
+    def test_cached_and_fallback_estimates(self):
+        """Test that a cached plan or mock mode costs no tokens and reads no cache counters"""
+        inputs = dict(PLAN_INPUTS, focus_areas=self.data['focus_areas'])
+        self.openai.return_value.chat.completions.create.return_value = fake_completion({'weekly_roadmap': [{'week': 1}]})
+        generate_study_plan(**dict(inputs, current_level='beginner'))
+        counters = get_counters('plan_cache.')
+        
+        response = self.client.post('/api/plans/estimate', dict(self.data, current_level='beginner'), format='json')
+        self.assertEqual(response.data['source'], 'cache')
+        self.assertEqual(response.data['output_tokens'], 0)
+        self.assertEqual(get_counters('plan_cache.'), counters)
+        
+        with override_settings(OPENAI_API_KEY=''):
+            response = self.client.post('/api/plans/estimate', self.data, format='json')
+        self.assertEqual(response.data['source'], 'fallback')
+        self.assertEqual(response.data['model'], 'mock-mode')
+        self.assertEqual(response.data['expected_latency_ms'], 0)
+    
+    @override_settings(PLAN_PROMPT_COMPACT=True, PLAN_PROMPT_TOKEN_BUDGET=50)
+    def test_compiled_prompt_overrun(self):
+        """Test that the estimate counts the compiled prompt and reports how far it is over budget"""
+        response = self.client.post('/api/plans/estimate', self.data, format='json')
+        
+        compiled = prompt_compiler.compile(PLAN_SECTIONS, **{key: value for key, value in self.data.items() if key != 'title'})
+        self.assertEqual(response.data['input_tokens'], compiled.tokens)
+        self.assertEqual(response.data['prompt_overrun_tokens'], compiled.tokens - 50)
+        self.assertGreater(response.data['prompt_overrun_tokens'], 0)
+
+
+class PlanWorkerTests(TransactionTestCase):
+    """Tests for the background plan generation worker"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='worker', password='testpass123')
+    
+    def _params(self, goal_text):
+        return {
+            'title': goal_text,
+            'goal_text': goal_text,
+            'current_level': 'beginner',
+            'daily_minutes': 30,
+            'focus_areas': ['reading'],
+            'preferred_resources': ['books'],
+            'preferred_language': 'en',
+        }
+    
+    def test_worker_respects_concurrency_limit(self):
+        """Test that a worker never runs more generations than its concurrency"""
+        for i in range(6):
+            enqueue_plan_job(self.user, 'create', self._params(f'Goal {i}'))
+        
+        backend = FakeLLMBackend()
+        processed = PlanWorker(concurrency=2, poll_interval=0.01, generate=backend).run(burst=True)
+        
+        self.assertEqual(processed, 6)
+        self.assertEqual(backend.calls, 6)
+        self.assertEqual(backend.max_in_flight, 2)
+        self.assertEqual(PlanGenerationJob.objects.filter(status='done').count(), 6)
+        self.assertEqual(PlanVersion.objects.filter(model_used='fake-llm').count(), 6)
+    
+    def test_failed_job_records_error(self):
+        """Test that a generation error marks the job failed without creating a plan"""
+        job = enqueue_plan_job(self.user, 'create', self._params('Broken goal'))
+        
+        PlanWorker(concurrency=1, poll_interval=0.01, generate=FakeLLMBackend(delay=0, fail_for='Broken goal')).run(burst=True)
+        
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('upstream error', job.error)
+        self.assertFalse(Plan.objects.exists())
+    
+    def test_requeued_job_is_completed_once(self):
+        """Test that a worker whose job was requeued mid-run drops its result"""
+        job = enqueue_plan_job(self.user, 'create', self._params('Slow goal'))
+        first = claim_jobs('first', 1)[0]
+        self.assertEqual(requeue_stale_jobs(-1), 1)
+        second = claim_jobs('second', 1)[0]
+        content = generate_mock_plan(goal_text='Slow goal', current_level='beginner', daily_minutes=30)
+        
+        dropped = complete_job(first, dict(content))
+        self.assertEqual(dropped.status, 'running')
+        self.assertFalse(Plan.objects.exists())
+        self.assertEqual(fail_job(first, RuntimeError('late timeout')).status, 'running')
+        
+        done = complete_job(second, dict(content))
+        self.assertEqual(done.status, 'done')
+        self.assertEqual(Plan.objects.count(), 1)
+        self.assertEqual(PlanVersion.objects.count(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id, job.error), ('done', 'second', ''))
+    
+    @override_settings(PLAN_JOB_STALE_AFTER=60)
+    def test_stale_jobs_are_requeued_while_running(self):
+        """Test that a job abandoned after the worker started is picked up again"""
+        enqueue_plan_job(self.user, 'create', self._params('First goal'))
+        abandoned = enqueue_plan_job(self.user, 'create', self._params('Abandoned goal'))
+        backend = FakeLLMBackend(delay=0)
+        
+        def generate(goal_text, **kwargs):
+            if goal_text == 'First goal':
+                # Meanwhile another worker claimed the second job and crashed
+                PlanGenerationJob.objects.filter(pk=abandoned.pk).update(
+                    status='running', worker_id='crashed', started_at=timezone.now() - timedelta(minutes=5)
+                )
+            return backend(goal_text, **kwargs)
+        
+        processed = PlanWorker(concurrency=1, poll_interval=0.01, generate=generate, requeue_interval=0).run(burst=True)
+        
+        self.assertEqual(processed, 2)
+        self.assertEqual(backend.calls, 2)
+        abandoned.refresh_from_db()
+        self.assertEqual(abandoned.status, 'done')
+
+
+def fake_completion(content):
+    """Minimal object shaped like an OpenAI chat completion"""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content)))],
+        usage=SimpleNamespace(total_tokens=100)
+    )
+
+
+PLAN_INPUTS = {
+    'goal_text': 'Pass IELTS with 7.0',
+    'current_level': 'intermediate',
+    'daily_minutes': 60,
+    'deadline': None,
+    'focus_areas': ['reading', 'writing'],
+    'preferred_resources': ['books'],
+    'preferred_language': 'en',
+}
+
+
+@override_settings(OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test')
+class PlanCacheTests(TestCase):
+    """Tests for the content-addressed plan cache"""
+    
+    def setUp(self):
+        self.content = {'weekly_roadmap': [{'week': 1}], 'daily_tasks': [], 'topics': [], 'resources': [], 'checkpoints': []}
+        client_patch = mock.patch('plans.llm.get_openai_client')
+        self.openai = client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self.openai.return_value.chat.completions.create.return_value = fake_completion(self.content)
+    
+    def test_key_ignores_whitespace_case_and_order(self):
+        """Test that near-identical inputs share a cache key"""
+        variant = dict(PLAN_INPUTS, goal_text='  pass   ielts WITH 7.0 ', focus_areas=['writing', 'reading'])
+        self.assertEqual(plan_cache_key('gpt-test', **PLAN_INPUTS), plan_cache_key('gpt-test', **variant))
+        self.assertNotEqual(
+            plan_cache_key('gpt-test', **PLAN_INPUTS),
+            plan_cache_key('gpt-test', **dict(PLAN_INPUTS, daily_minutes=90))
+        )
+    
+    def test_repeated_generation_is_served_from_cache(self):
+        """Test that the second identical request skips the model call"""
+        create = self.openai.return_value.chat.completions.create
+        
+        first = generate_study_plan(**PLAN_INPUTS)
+        second = generate_study_plan(**dict(PLAN_INPUTS, goal_text='PASS IELTS with 7.0'))
+        
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(first['weekly_roadmap'], second['weekly_roadmap'])
+        self.assertEqual(plan_cache.stats()['hits'], 1)
+        self.assertEqual(plan_cache.stats()['misses'], 1)
+    
+    def test_bypass_cache_refreshes_entry(self):
+        """Test that use_cache=False calls the model and stores the new result"""
+        create = self.openai.return_value.chat.completions.create
+        generate_study_plan(**PLAN_INPUTS)
+        
+        create.return_value = fake_completion(dict(self.content, weekly_roadmap=[{'week': 2}]))
+        generate_study_plan(**PLAN_INPUTS, use_cache=False)
+        cached = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(create.call_count, 2)
+        self.assertEqual(cached['weekly_roadmap'], [{'week': 2}])
+    
+    def test_expired_entries_miss(self):
+        """Test that entries older than the TTL are not served"""
+        cache = PlanCache(ttl=60)
+        cache.set('key', 'gpt-test', self.content)
+        PlanCacheEntry.objects.update(created_at=timezone.now() - timedelta(seconds=120))
+        
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(PlanCacheEntry.objects.exists())
+    
+    def test_least_recently_used_entries_are_evicted(self):
+        """Test LRU eviction beyond max_entries"""
+        cache = PlanCache(max_entries=2)
+        cache.set('a', 'gpt-test', self.content)
+        cache.set('b', 'gpt-test', self.content)
+        PlanCacheEntry.objects.filter(key='a').update(last_used_at=timezone.now() - timedelta(minutes=5))
+        PlanCacheEntry.objects.filter(key='b').update(last_used_at=timezone.now() - timedelta(minutes=10))
+        cache.get('b')
+        cache.set('c', 'gpt-test', self.content)
+        
+        self.assertEqual(set(PlanCacheEntry.objects.values_list('key', flat=True)), {'b', 'c'})
+
+
+def fake_stream(text, chunk_size=7):
+    """Chunks shaped like a streamed OpenAI chat completion"""
+    for i in range(0, len(text), chunk_size):
+        yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + chunk_size]))])
+
+
+def parse_sse(body):
+    """Split a Server-Sent Events body into (event, data) pairs"""
+    events = []
+    for block in body.strip().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class PlanStreamingTests(TestCase):
+    """Tests for incremental section parsing and the SSE endpoint"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='streamer', password='testpass123')
+        self.client.force_authenticate(self.user)
+        self.content = {
+            'weekly_roadmap': [{'week': 1, 'focus': 'Basics {with} "braces"', 'topics': ['a', 'b']}],
+            'daily_tasks': [{'day': 1, 'week': 1, 'tasks': []}],
+            'topics': [{'name': 'Grammar', 'priority': 'high'}],
+            'resources': [],
+            'checkpoints': [{'week': 2, 'type': 'quiz'}],
+        }
+    
+    def test_parser_emits_sections_as_they_complete(self):
+        """Test that each section is returned by the chunk that completes it"""
+        text = json.dumps(dict(self.content, note='done', count=3))
+        parser = SectionParser()
+        seen = []
+        for i in range(0, len(text), 5):
+            for name, _ in parser.feed(text[i:i + 5]):
+                seen.append((name, i + 5 >= len(text)))
+        
+        self.assertEqual([name for name, _ in seen], list(self.content) + ['note', 'count'])
+        # Only the trailing scalar waits for the closing brace
+        self.assertEqual([last for _, last in seen].count(True), 1)
+        self.assertEqual(parser.sections['weekly_roadmap'], self.content['weekly_roadmap'])
+        self.assertEqual(parser.sections['count'], 3)
+    
+    def test_stream_endpoint_mock_mode(self):
+        """Test that the stream sends every section and then the saved plan"""
+        response = self.client.post('/api/plans/stream', {
+            'title': 'Streamed',
+            'goal_text': 'Learn Spanish'
+        }, format='json', HTTP_ACCEPT='text/event-stream')
+        
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = parse_sse(b''.join(response.streaming_content).decode())
+        
+        self.assertEqual(
+            [data['name'] for event, data in events if event == 'section'],
+            ['weekly_roadmap', 'daily_tasks', 'topics', 'resources', 'checkpoints']
+        )
+        self.assertEqual(events[-1][0], 'done')
+        plan = Plan.objects.get(id=events[-1][1]['id'])
+        self.assertEqual(plan.versions.count(), 1)
+    
+    @override_settings(OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test')
+    @mock.patch('plans.llm.get_openai_client')
+    def test_stream_forwards_completion_sections(self, openai):
+        """Test that sections parsed from the completion stream are forwarded and persisted"""
+        openai.return_value.chat.completions.create.return_value = fake_stream(json.dumps(self.content))
+        
+        response = self.client.post('/api/plans/stream', {
+            'title': 'Streamed',
+            'goal_text': 'Learn Spanish'
+        }, format='json', HTTP_ACCEPT='text/event-stream')
+        events = parse_sse(b''.join(response.streaming_content).decode())
+        
+        self.assertTrue(openai.return_value.chat.completions.create.call_args.kwargs['stream'])
+        self.assertEqual(events[0], ('section', {'name': 'weekly_roadmap', 'content': self.content['weekly_roadmap']}))
+        version = Plan.objects.get().versions.first()
+        self.assertEqual(version.model_used, 'gpt-test')
+        self.assertEqual(version.content_json['checkpoints'], self.content['checkpoints'])
+
+
+class OpenAIClientTests(TestCase):
+    """Tests for the process-wide OpenAI client"""
+    
+    def tearDown(self):
+        reset_openai_client()
+    
+    @override_settings(OPENAI_API_KEY='sk-test', OPENAI_CONNECT_TIMEOUT=2.5, OPENAI_READ_TIMEOUT=30.0, OPENAI_MAX_RETRIES=1)
+    def test_client_is_reused_with_configured_timeouts(self):
+        """Test that the client is built once and configured from settings"""
+        reset_openai_client()
+        client = get_openai_client()
+        
+        self.assertIs(get_openai_client(), client)
+        self.assertEqual(client.max_retries, 1)
+        self.assertEqual(client.timeout.connect, 2.5)
+        self.assertEqual(client.timeout.read, 30.0)
+    
+    def test_generation_against_local_stub(self):
+        """Test the full OpenAI code path against the local stub server"""
+        with StubLLMServer() as server, override_settings(OPENAI_API_KEY='stub', OPENAI_BASE_URL=server.url, OPENAI_MODEL='stub-model'):
+            reset_openai_client()
+            first = generate_study_plan(**PLAN_INPUTS, use_cache=False)
+            generate_study_plan(**PLAN_INPUTS, use_cache=False)
+        
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(first['model_used'], 'stub-model')
+        self.assertEqual(first['weekly_roadmap'], server.content['weekly_roadmap'])
+
+
+@override_settings(OPENAI_MODEL='stub-model', PLAN_CACHE_ENABLED=False, PLAN_BREAKER_ENABLED=False)
+class LLMBackendTests(TestCase):
+    """Tests for the pluggable model backends and the bundled stub"""
+    
+    def tearDown(self):
+        reset_llm_backends()
+    
+    @override_settings(PLAN_LLM_BACKEND='mock', OPENAI_API_KEY='sk-test')
+    @mock.patch('plans.llm.get_openai_client')
+    def test_mock_backend_never_calls_the_api(self, openai):
+        """Test that the mock backend uses the local scheduler even with an API key"""
+        plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(plan['model_used'], 'mock-mode')
+        openai.assert_not_called()
+    
+    def test_incomplete_backend_cannot_be_created(self):
+        """Test that a backend missing part of the interface fails when it is instantiated"""
+        class AvailableOnly(LLMBackend):
+            name = 'available-only'
+            
+            def is_available(self):
+                return True
+        
+        with self.assertRaisesRegex(TypeError, 'create_completion'):
+            AvailableOnly()
+    
+    @override_settings(PLAN_LLM_BACKEND='stub', OPENAI_API_KEY='')
+    def test_stub_backend_serves_completions_and_streams(self):
+        """Test that the stub backend answers plain and streamed requests over HTTP"""
+        plan = generate_study_plan(**PLAN_INPUTS)
+        events = list(stream_study_plan(**PLAN_INPUTS))
+        server = get_llm_backend().start()
+        
+        self.assertEqual(server.requests, 2)
+        self.assertEqual(plan['model_used'], 'stub-model')
+        self.assertEqual(plan['weekly_roadmap'], server.content['weekly_roadmap'])
+        self.assertEqual([data[0] for event, data in events if event == 'section'], list(PLAN_SECTIONS))
+        self.assertEqual(events[-1][1]['model_used'], 'stub-model')
+        self.assertEqual(events[-1][1]['checkpoints'], server.content['checkpoints'])
+    
+    @override_settings(PLAN_LLM_BACKEND='stub', PLAN_STUB_ERROR_RATE=1.0, OPENAI_MAX_RETRIES=0)
+    def test_stub_errors_fall_back_to_mock(self):
+        """Test that injected upstream errors reach the client and trigger the fallback"""
+        plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(plan['model_used'], 'mock-mode')
+        self.assertEqual(get_llm_backend().start().errors, 1)
+    
+    @override_settings(PLAN_LLM_BACKEND='nope')
+    def test_unknown_backend(self):
+        """Test that a misconfigured backend name is reported"""
+        with self.assertRaises(ImproperlyConfigured):
+            get_llm_backend()
+    
+    def test_latency_distributions(self):
+        """Test latency specs: repeatable with a seed, never negative, validated"""
+        for spec in ('0.2', 'fixed:0.2', 'uniform:0.1,0.5', 'normal:0.1,1', 'lognormal:0.2,0.5', 'exponential:0.3'):
+            sample = parse_latency(spec)
+            first = [sample(random.Random(1)) for _ in range(3)]
+            self.assertEqual(first, [sample(random.Random(1)) for _ in range(3)])
+            self.assertTrue(all(value >= 0 for value in first))
+        self.assertEqual(parse_latency('fixed:0.2')(random.Random()), 0.2)
+        with self.assertRaises(ValueError):
+            parse_latency('pareto:1')
+        with self.assertRaises(ValueError):
+            parse_latency('uniform:1')
+
+
+@override_settings(
+    OPENAI_MODEL='stub-model', PLAN_LLM_BACKEND='stub', PLAN_CACHE_ENABLED=False,
+    PLAN_BREAKER_ENABLED=False, PLAN_LLM_CASSETTE_REPLAY_LATENCY=False
+)
+class CassetteTests(TestCase):
+    """Tests for recording and replaying model responses"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'llm.jsonl')
+        self.settings_patch = override_settings(PLAN_LLM_CASSETTE_PATH=self.path)
+        self.settings_patch.enable()
+        self.addCleanup(self.settings_patch.disable)
+    
+    def tearDown(self):
+        reset_llm_backends()
+    
+    def test_replay_returns_recorded_plan_without_backend(self):
+        """Test that a recorded plan is replayed identically with no upstream request"""
+        with override_settings(PLAN_LLM_CASSETTE_MODE='record'):
+            recorded = generate_study_plan(**PLAN_INPUTS)
+            server = get_llm_backend().backend.start()
+        
+        with override_settings(PLAN_LLM_CASSETTE_MODE='replay'):
+            replayed = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(server.requests, 1)
+        # Only the measured latency differs
+        self.assertEqual(replayed.pop('telemetry')['completion_tokens'], recorded.pop('telemetry')['completion_tokens'])
+        self.assertEqual(replayed, recorded)
+        with open(self.path) as cassette:
+            entry = json.loads(cassette.readline())
+        self.assertGreater(entry['latency'], 0)
+    
+    def test_streams_are_recorded_and_replayed(self):
+        """Test that a recorded stream replays the same sections"""
+        with override_settings(PLAN_LLM_CASSETTE_MODE='record'):
+            recorded = list(stream_study_plan(**PLAN_INPUTS))
+        with override_settings(PLAN_LLM_CASSETTE_MODE='replay'):
+            replayed = list(stream_study_plan(**PLAN_INPUTS))
+        
+        for events in (recorded, replayed):
+            events[-1][1].pop('telemetry')
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(replayed[-1][1]['model_used'], 'stub-model')
+    
+    @override_settings(PLAN_LLM_CASSETTE_MODE='replay')
+    def test_unrecorded_request_falls_back_to_mock(self):
+        """Test that a cassette miss is handled like an upstream error"""
+        plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(plan['model_used'], 'mock-mode')
+    
+    def test_recordings_cycle_and_torn_lines_are_skipped(self):
+        """Test replay order of repeated requests and a partially written last line"""
+        cassette = Cassette(self.path)
+        cassette.append('key', {'n': 1}, 0.1)
+        cassette.append('key', {'n': 2}, 0.2)
+        with open(self.path, 'a') as torn:
+            torn.write('{"key": "key", "respo')
+        
+        replay = Cassette(self.path)
+        self.assertEqual([replay.next_entry('key')['response']['n'] for _ in range(3)], [1, 2, 1])
+        with self.assertRaises(CassetteMiss):
+            replay.next_entry('other')
+
+
+@override_settings(OPENAI_MODEL='stub-model', PLAN_LLM_BACKEND='stub', PLAN_CACHE_ENABLED=False, PLAN_BREAKER_ENABLED=False)
+class TelemetryTests(TestCase):
+    """Tests for per-version generation telemetry and its admin aggregates"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='telemetry', password='testpass123')
+    
+    def tearDown(self):
+        reset_llm_backends()
+    
+    def test_model_generation_is_recorded_on_the_version(self):
+        """Test that tokens, latency and source reach the version but not its content"""
+        job = enqueue_plan_job(self.user, 'create', dict(PLAN_INPUTS, title='Telemetry'))
+        run_pending_jobs()
+        
+        version = PlanVersion.objects.get(plan__user=self.user)
+        self.assertEqual(version.source, 'llm')
+        self.assertEqual(version.model_used, 'stub-model')
+        self.assertGreater(version.prompt_tokens, 0)
+        self.assertGreater(version.completion_tokens, 0)
+        self.assertIsNotNone(version.latency_ms)
+        self.assertEqual(version.retries, 0)
+        self.assertNotIn('telemetry', version.content_json)
+        
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+    
+    @override_settings(PLAN_STUB_LATENCY='fixed:0.05')
+    def test_latency_covers_only_upstream_calls(self):
+        """Test that repair and caching after the upstream call are not counted as latency"""
+        from .validation import repair_plan as repair
+        
+        def slow_repair(*args, **kwargs):
+            time.sleep(0.3)
+            return repair(*args, **kwargs)
+        
+        with mock.patch('plans.services.repair_plan', side_effect=slow_repair):
+            plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(plan['telemetry']['source'], 'llm')
+        self.assertGreaterEqual(plan['telemetry']['latency_ms'], 50)
+        self.assertLess(plan['telemetry']['latency_ms'], 300)
+    
+    @override_settings(PLAN_STUB_ERROR_RATE=1.0, OPENAI_MAX_RETRIES=1)
+    def test_retries_and_fallback_are_recorded(self):
+        """Test that client retries are counted and a failed generation is marked as fallback"""
+        plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(get_llm_backend().start().errors, 2)
+        self.assertEqual(plan['telemetry']['source'], 'fallback')
+        self.assertEqual(plan['telemetry']['retries'], 1)
+        self.assertIsNotNone(plan['telemetry']['latency_ms'])
+    
+    @override_settings(PLAN_CACHE_ENABLED=True)
+    def test_cache_hits_and_incremental_regenerations(self):
+        """Test the source of plans that made no upstream call"""
+        generate_study_plan(**PLAN_INPUTS)
+        cached = generate_study_plan(**PLAN_INPUTS)
+        self.assertEqual(cached['telemetry'], {
+            'source': 'cache', 'prompt_tokens': None, 'completion_tokens': None, 'latency_ms': None, 'retries': 0,
+        })
+        
+        plan = create_plan(self.user, dict(PLAN_INPUTS, title='Telemetry'), cached)
+        job = enqueue_plan_job(self.user, 'regenerate', dict(PLAN_INPUTS, daily_minutes=30), plan=plan)
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.version.source, 'incremental')
+    
+    def test_admin_aggregates(self):
+        """Test latency percentiles and daily token totals per model"""
+        plan = Plan.objects.create(user=self.user, title='Telemetry', goal_text='Goal')
+        for number, latency in enumerate(range(100, 1100, 10), 1):
+            PlanVersion.objects.create(
+                plan=plan, version_number=number, content_json={}, prompt_used='', model_used='gpt-a',
+                source='llm', latency_ms=latency, prompt_tokens=10, completion_tokens=100, retries=number % 2
+            )
+        PlanVersion.objects.create(
+            plan=plan, version_number=101, content_json={}, prompt_used='', model_used='mock-mode', source='fallback'
+        )
+        admin = User.objects.create_user(username='root', password='testpass123', role='SUPERADMIN')
+        client = APIClient()
+        client.force_authenticate(admin)
+        
+        response = client.get('/api/admin/metrics/latency?days=7')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # PostgreSQL interpolates percentiles, other databases take the nearest rank
+        if connection.vendor == 'postgresql':
+            percentiles = {'p50_ms': 595.0, 'p95_ms': 1040.5, 'p99_ms': 1080.1}
+        else:
+            percentiles = {'p50_ms': 600.0, 'p95_ms': 1050.0, 'p99_ms': 1090.0}
+        self.assertEqual(
+            [dict(row, **{key: round(row[key], 1) for key in percentiles}) for row in response.data['models']],
+            [{'model': 'gpt-a', 'versions': 100, 'retries': 50, **percentiles}]
+        )
+        self.assertEqual(response.data['sources'], {'llm': 100, 'fallback': 1})
+        
+        response = client.get('/api/admin/metrics/tokens')
+        self.assertEqual(response.data['days'], 30)
+        self.assertEqual(len(response.data['tokens_by_day']), 1)
+        self.assertEqual(response.data['tokens_by_day'][0]['model'], 'gpt-a')
+        self.assertEqual(response.data['tokens_by_day'][0]['prompt_tokens'], 1000)
+        self.assertEqual(response.data['tokens_by_day'][0]['completion_tokens'], 10000)
+        
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/admin/metrics/tokens').status_code, status.HTTP_403_FORBIDDEN)
+    
+    def test_percentiles_compile_for_postgresql(self):
+        """Test the percentile_cont aggregate PostgreSQL computes latency percentiles with"""
+        versions = PlanVersion.objects.values('model_used').annotate(p95_ms=Percentile('latency_ms', 0.95))
+        
+        sql, params = postgresql_sql(versions)
+        
+        self.assertIn('PERCENTILE_CONT(0.95) WITHIN GROUP (ORDER BY "plan_versions"."latency_ms") AS "p95_ms"', sql)
+        self.assertIn('GROUP BY "plan_versions"."model_used"', sql)
+        self.assertEqual(params, ())
+    
+    @skipUnless(connection.vendor == 'postgresql', 'percentile_cont is PostgreSQL only')
+    def test_percentiles_on_postgresql(self):
+        """Test that PostgreSQL interpolates latency percentiles in the grouping query"""
+        plan = Plan.objects.create(user=self.user, title='Telemetry', goal_text='Goal')
+        for number, latency in enumerate(range(100, 1100, 10), 1):
+            PlanVersion.objects.create(
+                plan=plan, version_number=number, content_json={}, prompt_used='', model_used='gpt-a',
+                source='llm', latency_ms=latency
+            )
+        
+        with self.assertNumQueries(1):
+            rows = latency_by_model(timezone.now() - timedelta(days=1))
+        
+        self.assertEqual(len(rows), 1)
+        self.assertAlmostEqual(rows[0]['p50_ms'], 595.0)
+        self.assertAlmostEqual(rows[0]['p95_ms'], 1040.5)
+        self.assertAlmostEqual(rows[0]['p99_ms'], 1080.1)
+    
+    def test_admin_users_page_by_cursor(self):
+        """Test that admin user pages follow cursors, newest members first"""
+        now = timezone.now()
+        for index in range(22):
+            User.objects.create_user(username=f'member{index}', password='x', date_joined=now - timedelta(days=index))
+        admin = User.objects.create_user(username='root', password='testpass123', role='SUPERADMIN')
+        client = APIClient()
+        client.force_authenticate(admin)
+        
+        response = client.get('/api/admin/users?count=estimated')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 24)
+        usernames = [user['username'] for user in response.data['results']]
+        self.assertEqual(usernames[:2], ['root', 'member0'])
+        
+        # The next link keeps asking for the estimate
+        response = client.get(response.data['next'])
+        self.assertEqual(response.data['count'], 24)
+        usernames += [user['username'] for user in response.data['results']]
+        self.assertEqual(len(set(usernames)), 24)
+        
+        response = client.get('/api/admin/users?search=member1')
+        self.assertEqual(len(response.data['results']), 11)
+
+
+@override_settings(OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test', PLAN_SINGLE_FLIGHT_POLL_INTERVAL=0)
+class SingleFlightTests(TestCase):
+    """Tests for coalescing identical concurrent generations"""
+    
+    def setUp(self):
+        self.content = {'weekly_roadmap': [{'week': 1}], 'daily_tasks': [], 'topics': [], 'resources': [], 'checkpoints': []}
+        client_patch = mock.patch('plans.llm.get_openai_client')
+        self.openai = client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self.create = self.openai.return_value.chat.completions.create
+        self.create.return_value = fake_completion(self.content)
+        self.key = plan_cache_key('gpt-test', **PLAN_INPUTS) + ':regenerate'
+    
+    def _leader_finishes(self, status_value, result=None):
+        """Simulate another worker finishing its flight while we wait"""
+        def finish(_seconds):
+            GenerationFlight.objects.filter(key=self.key).update(status=status_value, result_json=result)
+        return mock.patch('plans.single_flight.time.sleep', side_effect=finish)
+    
+    def test_leader_publishes_result(self):
+        """Test that the first caller makes the upstream call and records the result"""
+        generate_study_plan(**PLAN_INPUTS, use_cache=False)
+        
+        self.assertEqual(self.create.call_count, 1)
+        flight = GenerationFlight.objects.get(key=self.key)
+        self.assertEqual(flight.status, 'done')
+        self.assertEqual(flight.result_json['weekly_roadmap'], [{'week': 1}])
+    
+    def test_follower_shares_in_flight_result(self):
+        """Test that a request identical to a running one waits instead of calling upstream"""
+        self.assertTrue(SingleFlight().acquire(self.key))
+        shared = dict(self.content, model_used='gpt-test', prompt_used='leader prompt')
+        
+        with self._leader_finishes('done', shared):
+            result = generate_study_plan(**dict(PLAN_INPUTS, goal_text='pass ielts with 7.0'), use_cache=False)
+        
+        self.assertEqual(self.create.call_count, 0)
+        self.assertEqual(result['prompt_used'], 'leader prompt')
+        self.assertEqual(get_counters('single_flight.'), {'single_flight.coalesced': 1})
+    
+    def test_regenerate_does_not_join_a_create(self):
+        """Test that a cache-bypassing regenerate makes its own call while a create is in flight"""
+        create_key = plan_cache_key('gpt-test', **PLAN_INPUTS)
+        self.assertTrue(SingleFlight().acquire(create_key))
+        
+        result = generate_study_plan(**PLAN_INPUTS, use_cache=False)
+        
+        self.assertEqual(self.create.call_count, 1)
+        self.assertEqual(result['telemetry']['source'], 'llm')
+        self.assertEqual(get_counters('single_flight.'), {'single_flight.leader': 1})
+        self.assertEqual(GenerationFlight.objects.get(key=create_key).status, 'running')
+    
+    def test_follower_calls_upstream_when_leader_fails(self):
+        """Test that a failed leader does not fail its followers"""
+        self.assertTrue(SingleFlight().acquire(self.key))
+        
+        with self._leader_finishes('failed'):
+            result = generate_study_plan(**PLAN_INPUTS, use_cache=False)
+        
+        self.assertEqual(self.create.call_count, 1)
+        self.assertEqual(result['weekly_roadmap'], [{'week': 1}])
+        self.assertEqual(get_counters('single_flight.')['single_flight.fallthrough'], 1)
+    
+    def test_stale_flight_is_taken_over(self):
+        """Test that a flight abandoned by a crashed leader can be re-acquired"""
+        flight = SingleFlight(timeout=60)
+        self.assertTrue(flight.acquire(self.key))
+        self.assertFalse(flight.acquire(self.key))
+        
+        GenerationFlight.objects.filter(key=self.key).update(updated_at=timezone.now() - timedelta(seconds=120))
+        self.assertTrue(flight.acquire(self.key))
+
+
+class SingleFlightHeartbeatTests(TransactionTestCase):
+    """Tests for keeping a slow leader's flight from being taken over"""
+    
+    def test_slow_leader_keeps_its_flight(self):
+        """Test that a leader running past the timeout is not treated as abandoned"""
+        flight = SingleFlight(timeout=0.3)
+        taken_over = []
+        
+        def slow_generation():
+            time.sleep(0.5)
+            taken_over.append(SingleFlight(timeout=0.3).acquire('slow'))
+            return {'weekly_roadmap': []}
+        
+        flight.run('slow', slow_generation)
+        
+        self.assertEqual(taken_over, [False])
+        self.assertEqual(GenerationFlight.objects.get(key='slow').status, 'done')
+    
+    def test_release_leaves_a_taken_over_flight_alone(self):
+        """Test that a leader whose flight was taken over does not overwrite the new leader's row"""
+        flight = SingleFlight(timeout=60)
+        self.assertTrue(flight.acquire('taken'))
+        GenerationFlight.objects.filter(key='taken').update(owner='other-leader')
+        
+        flight.release('taken', {'weekly_roadmap': []})
+        
+        row = GenerationFlight.objects.get(key='taken')
+        self.assertEqual((row.owner, row.status, row.result_json), ('other-leader', 'running', None))
+
+
+@override_settings(PLAN_METRICS_FLUSH_INTERVAL=60)
+class CounterBufferTests(TestCase):
+    """Tests for batching counter increments in process"""
+    
+    def setUp(self):
+        counter_buffer.discard()
+        self.addCleanup(counter_buffer.discard)
+    
+    def test_increments_are_batched(self):
+        """Test that increments are summed in process and written in one update per counter"""
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                increment('batched.hits')
+            increment('batched.misses', 2)
+        
+        self.assertEqual(get_counters('batched.'), {'batched.hits': 3, 'batched.misses': 2})
+        
+        counter_buffer.flush()
+        increment('batched.hits')
+        
+        written = GenerationCounter.objects.filter(name__startswith='batched.').values_list('name', 'value')
+        self.assertEqual(dict(written), {'batched.hits': 3, 'batched.misses': 2})
+        self.assertEqual(get_counters('batched.'), {'batched.hits': 4, 'batched.misses': 2})
+    
+    def test_due_flush_waits_for_the_transaction(self):
+        """Test that a flush that falls due inside a transaction is left for later"""
+        with override_settings(PLAN_METRICS_FLUSH_INTERVAL=0.001):
+            time.sleep(0.01)
+            increment('batched.hits')
+        
+        self.assertFalse(GenerationCounter.objects.filter(name='batched.hits').exists())
+        self.assertEqual(counter_buffer.pending(), {'batched.hits': 1})
+
+
+@override_settings(
+    OPENAI_API_KEY='sk-test',
+    OPENAI_MODEL='gpt-test',
+    PLAN_ROUTING_ENABLED=True,
+    PLAN_MODEL_TIERS={'fast': ['fast-a', 'standard-a'], 'standard': ['standard-a', 'fast-a']},
+    PLAN_CACHE_ENABLED=False,
+    PLAN_SINGLE_FLIGHT_ENABLED=False
+)
+class RoutingTests(TestCase):
+    """Tests for latency-aware model routing"""
+    
+    def setUp(self):
+        routing.reset_routing()
+        self.addCleanup(routing.reset_routing)
+        openai_breaker.forget()
+        self.addCleanup(openai_breaker.forget)
+        client_patch = mock.patch('plans.llm.get_openai_client')
+        self.openai = client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self.create = self.openai.return_value.chat.completions.create
+        self.create.return_value = fake_completion({'weekly_roadmap': [{'week': 1}]})
+        self.short_deadline = (date.today() + timedelta(days=14)).isoformat()
+    
+    def test_tier_follows_prompt_and_plan_size(self):
+        """Test that small prompts for short plans or outlines go to the fast tier"""
+        self.assertEqual(routing.route('Short prompt', self.short_deadline).models, ['fast-a', 'standard-a'])
+        self.assertEqual(routing.route('Short prompt', None).tier, 'standard')
+        self.assertEqual(routing.route('Short prompt', None, daily_tasks=False).tier, 'fast')
+        self.assertEqual(routing.route('Long prompt ' * 2000, self.short_deadline).tier, 'standard')
+        self.assertEqual(get_counters('routing.'), {'routing.fast': 2, 'routing.standard': 2})
+    
+    def test_falls_back_along_the_chain(self):
+        """Test that a failing model is followed by the next one and the model used is recorded"""
+        def create(**request):
+            if request['model'] == 'fast-a':
+                raise TimeoutError('upstream timeout')
+            return fake_completion({'weekly_roadmap': [{'week': 1}]})
+        self.create.side_effect = create
+        
+        plan = generate_study_plan(**dict(PLAN_INPUTS, deadline=self.short_deadline))
+        
+        self.assertEqual([call.kwargs['model'] for call in self.create.call_args_list], ['fast-a', 'standard-a'])
+        self.assertEqual(plan['model_used'], 'standard-a')
+        self.assertEqual(get_counters('routing.')['routing.fallback'], 1)
+    
+    def test_unhealthy_models_are_skipped_or_tried_last(self):
+        """Test that an open model breaker skips the model and a high error rate or p50 demotes it"""
+        for _ in range(5):
+            routing.record_failure('fast-a')
+        routing.reset_routing()
+        self.assertEqual(routing.route('Short prompt', self.short_deadline).models, ['standard-a'])
+        
+        CircuitBreakerState.objects.filter(name='model:fast-a').delete()
+        for failed in (False, False, False, False, True):
+            routing.record_failure('fast-a') if failed else routing.record_success('fast-a', 0.1)
+        routing.reset_routing()
+        self.assertEqual(routing.route('Short prompt', self.short_deadline).models, ['standard-a', 'fast-a'])
+        
+        CircuitBreakerState.objects.filter(name='model:fast-a').delete()
+        plan = Plan.objects.create(user=User.objects.create_user(username='routing'), title='Routing', goal_text='Goal')
+        PlanVersion.objects.create(
+            plan=plan, version_number=1, content_json={}, prompt_used='', model_used='standard-a',
+            source='llm', latency_ms=90000
+        )
+        routing.reset_routing()
+        self.assertEqual(routing.route('Short prompt', None).models, ['fast-a', 'standard-a'])
+    
+    def test_only_the_called_model_claims_its_trial(self):
+        """Test that routing leaves the half-open trial of fallback models that are not called"""
+        CircuitBreakerState.objects.create(
+            name='model:standard-a', state='open', changed_at=timezone.now() - timedelta(hours=1)
+        )
+        
+        plan = generate_study_plan(**dict(PLAN_INPUTS, deadline=self.short_deadline))
+        
+        self.assertEqual(plan['model_used'], 'fast-a')
+        self.assertEqual(CircuitBreakerState.objects.get(name='model:standard-a').state, 'open')
+        
+        # Once called, the fallback model gets the trial
+        self.create.side_effect = [TimeoutError('upstream timeout'), fake_completion({'weekly_roadmap': [{'week': 1}]})]
+        routing.reset_routing()
+        plan = generate_study_plan(**dict(PLAN_INPUTS, deadline=self.short_deadline))
+        self.assertEqual(plan['model_used'], 'standard-a')
+        self.assertEqual(CircuitBreakerState.objects.get(name='model:standard-a').state, 'closed')
+    
+    @override_settings(PLAN_CACHE_ENABLED=True)
+    def test_cache_hits_are_not_routed(self):
+        """Test that plans served from the cache pay for no routing"""
+        generate_study_plan(**dict(PLAN_INPUTS, deadline=self.short_deadline))
+        self.assertEqual(get_counters('routing.'), {'routing.fast': 1})
+        
+        with mock.patch('plans.routing.route') as route:
+            plan = generate_study_plan(**dict(PLAN_INPUTS, deadline=self.short_deadline))
+        route.assert_not_called()
+        self.assertEqual(plan['telemetry']['source'], 'cache')
+        self.assertEqual(plan['model_used'], 'fast-a')
+    
+    @override_settings(PLAN_ROUTING_ENABLED=False)
+    def test_disabled_routing_uses_the_configured_model(self):
+        """Test that without routing every generation uses OPENAI_MODEL"""
+        plan = generate_study_plan(**dict(PLAN_INPUTS, deadline=self.short_deadline))
+        
+        self.assertEqual(self.create.call_args.kwargs['model'], 'gpt-test')
+        self.assertEqual(plan['model_used'], 'gpt-test')
+        self.assertFalse(CircuitBreakerState.objects.filter(name__startswith='model:').exists())
+
+
+@override_settings(
+    OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test', PLAN_CACHE_ENABLED=False,
+    PLAN_BREAKER_MIN_CALLS=2, PLAN_BREAKER_ERROR_RATE=0.5, PLAN_BREAKER_COOLDOWN=30,
+    PLAN_BREAKER_SLOW_CALL_SECONDS=10, PLAN_BREAKER_REFRESH_INTERVAL=0
+)
+class CircuitBreakerTests(TestCase):
+    """Tests for the OpenAI circuit breaker"""
+    
+    def setUp(self):
+        openai_breaker.forget()
+        self.addCleanup(openai_breaker.forget)
+        client_patch = mock.patch('plans.llm.get_openai_client')
+        self.openai = client_patch.start()
+        self.addCleanup(client_patch.stop)
+        self.create = self.openai.return_value.chat.completions.create
+        self.create.side_effect = TimeoutError('upstream timeout')
+    
+    def _generate(self, minutes):
+        return generate_study_plan(**dict(PLAN_INPUTS, daily_minutes=minutes))
+    
+    def test_opens_after_error_rate_and_short_circuits(self):
+        """Test that repeated failures open the breaker and skip the upstream call"""
+        self._generate(30)
+        self._generate(31)
+        self.assertEqual(CircuitBreakerState.objects.get(name='openai').state, 'open')
+        
+        result = self._generate(32)
+        
+        self.assertEqual(self.create.call_count, 2)
+        self.assertEqual(result['model_used'], 'mock-mode')
+        self.assertEqual(get_counters('circuit_breaker.')['circuit_breaker.short_circuited'], 1)
+    
+    def test_half_open_trial_closes_breaker(self):
+        """Test that a successful trial after the cooldown closes the breaker"""
+        self._generate(30)
+        self._generate(31)
+        CircuitBreakerState.objects.update(changed_at=timezone.now() - timedelta(seconds=60))
+        self.create.side_effect = None
+        self.create.return_value = fake_completion({'weekly_roadmap': [{'week': 1}]})
+        
+        result = self._generate(32)
+        
+        self.assertEqual(result['model_used'], 'gpt-test')
+        self.assertEqual(CircuitBreakerState.objects.get(name='openai').state, 'closed')
+    
+    def test_failed_trial_reopens_breaker(self):
+        """Test that a failing trial call opens the breaker again"""
+        self._generate(30)
+        self._generate(31)
+        CircuitBreakerState.objects.update(changed_at=timezone.now() - timedelta(seconds=60))
+        
+        self._generate(32)
+        
+        state = CircuitBreakerState.objects.get(name='openai')
+        self.assertEqual(state.state, 'open')
+        self.assertGreater(state.changed_at, timezone.now() - timedelta(seconds=5))
+    
+    def test_slow_calls_open_breaker(self):
+        """Test that the latency threshold counts slow successes"""
+        openai_breaker.record_success(latency=20)
+        openai_breaker.record_success(latency=25)
+        
+        self.assertFalse(openai_breaker.allow())
+        self.assertEqual(openai_breaker.status()['state'], 'open')
+    
+    @override_settings(PLAN_BREAKER_MIN_CALLS=5)
+    def test_recording_a_call_costs_two_queries(self):
+        """Test that counting a call updates the window and counters in one statement"""
+        openai_breaker.record_failure()
+        CircuitBreakerState.objects.update(window_started_at=timezone.now() - timedelta(seconds=600))
+        
+        with self.assertNumQueries(2):
+            openai_breaker.record_failure()
+        
+        state = CircuitBreakerState.objects.get(name='openai')
+        self.assertEqual((state.calls, state.failures, state.slow_calls), (1, 1, 0))
+        self.assertGreater(state.window_started_at, timezone.now() - timedelta(seconds=5))
+        
+        with self.assertNumQueries(2):
+            openai_breaker.record_success(latency=20)
+        
+        state.refresh_from_db()
+        self.assertEqual((state.calls, state.failures, state.slow_calls), (2, 1, 1))
+
+
+class IncrementalRegenerationTests(TestCase):
+    """Tests for regenerating only the sections affected by changed inputs"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(username='regen', password='testpass123')
+        self.params = dict(PLAN_INPUTS, title='Regen')
+        inputs = {key: value for key, value in PLAN_INPUTS.items() if key != 'preferred_language'}
+        self.plan = create_plan(self.user, self.params, generate_mock_plan(**inputs))
+    
+    def _regenerate(self, **changes):
+        job = enqueue_plan_job(self.user, 'regenerate', dict(self.params, **changes), plan=self.plan)
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        return job.version.content_json
+    
+    @mock.patch('plans.services.generate_study_plan')
+    def test_daily_minutes_change_is_rescheduled_locally(self, full):
+        """Test that a new daily budget rescales tasks without calling the model"""
+        previous = self.plan.versions.first().content_json
+        
+        content = self._regenerate(daily_minutes=30)
+        
+        full.assert_not_called()
+        for name in ('topics', 'resources', 'checkpoints'):
+            self.assertEqual(content[name], previous[name])
+        for day in content['daily_tasks']:
+            self.assertLessEqual(sum(task['estimated_minutes'] for task in day['tasks']), 30)
+        self.assertEqual(self.plan.versions.first().generation_params['daily_minutes'], 30)
+    
+    def _author_weeks(self):
+        """Give the current version a roadmap and checkpoints no scheduler would produce"""
+        version = self.plan.versions.first()
+        content = version.content_json
+        for entry in content['weekly_roadmap']:
+            entry.update(focus=f"Authored focus {entry['week']}", topics=[f"Authored topic {entry['week']}"])
+        for checkpoint in content['checkpoints']:
+            checkpoint['description'] = f"Authored checkpoint {checkpoint['week']}"
+        version.content_json = content
+        version.save(update_fields=['content_json'])
+        return content
+    
+    @mock.patch('plans.services.generate_study_plan')
+    def test_deadline_change_reschedules_same_topics(self, full):
+        """Test that a later deadline stretches the authored weeks over the new schedule"""
+        previous = self._author_weeks()
+        deadline = (timezone.localdate() + timedelta(weeks=20)).isoformat()
+        
+        content = self._regenerate(deadline=deadline)
+        
+        full.assert_not_called()
+        roadmap = content['weekly_roadmap']
+        self.assertEqual([entry['week'] for entry in roadmap], list(range(1, 21)))
+        self.assertEqual(roadmap[0]['focus'], 'Authored focus 1')
+        self.assertEqual(roadmap[-1]['topics'], ['Authored topic 12'])
+        self.assertEqual({entry['focus'] for entry in roadmap}, {entry['focus'] for entry in previous['weekly_roadmap']})
+        self.assertEqual(content['topics'], previous['topics'])
+        self.assertEqual(content['resources'], previous['resources'])
+        self.assertEqual(content['checkpoints'][-1]['week'], 20)
+        self.assertEqual(
+            [checkpoint['description'] for checkpoint in content['checkpoints']],
+            [checkpoint['description'] for checkpoint in previous['checkpoints']]
+        )
+        self.assertEqual(len(content['daily_tasks']), 140)
+        self.assertEqual(content['daily_tasks'][-1]['tasks'], previous['daily_tasks'][-1]['tasks'])
+        self.assertIn('checkpoints', content['regenerated_sections'])
+    
+    @mock.patch('plans.services.generate_study_plan')
+    def test_earlier_deadline_merges_weeks(self, full):
+        """Test that an earlier deadline squeezes several authored weeks into each new one"""
+        self._author_weeks()
+        deadline = (timezone.localdate() + timedelta(weeks=4)).isoformat()
+        
+        content = self._regenerate(deadline=deadline, daily_minutes=30)
+        
+        full.assert_not_called()
+        self.assertEqual(len(content['weekly_roadmap']), 4)
+        self.assertEqual(content['weekly_roadmap'][0]['topics'], ['Authored topic 1', 'Authored topic 2', 'Authored topic 3'])
+        self.assertEqual(content['weekly_roadmap'][0]['estimated_hours'], 3.5)
+        self.assertEqual([checkpoint['week'] for checkpoint in content['checkpoints']], [1, 2, 3, 4])
+        self.assertEqual(len(content['daily_tasks']), 28)
+        for day in content['daily_tasks']:
+            self.assertLessEqual(sum(task['estimated_minutes'] for task in day['tasks']), 30)
+    
+    def test_goal_change_regenerates_everything(self):
+        """Test that changing what is studied falls back to a full generation"""
+        content = self._regenerate(goal_text='Learn Spanish')
+        
+        self.assertNotIn('regenerated_sections', content)
+        self.assertEqual(get_counters('regenerate.')['regenerate.full'], 1)
+
+
+class SchedulerTests(TestCase):
+    """Tests for the local deadline-aware scheduler"""
+    
+    def test_plan_runs_until_deadline(self):
+        """Test that every day until the deadline gets tasks filling the daily budget"""
+        today = date(2026, 1, 5)
+        plan = schedule_plan(
+            goal_text='Pass IELTS', current_level='beginner', daily_minutes=50,
+            deadline='2026-02-16', focus_areas=['reading', 'writing'], today=today
+        )
+        
+        self.assertEqual(len(plan['weekly_roadmap']), 6)
+        self.assertEqual(len(plan['daily_tasks']), 42)
+        for day in plan['daily_tasks']:
+            self.assertEqual(sum(task['estimated_minutes'] for task in day['tasks']), 50)
+            self.assertEqual({task['type'] for task in day['tasks']}, {'reading', 'writing'})
+        self.assertEqual([checkpoint['week'] for checkpoint in plan['checkpoints']], [2, 3, 4, 6])
+    
+    def test_tiny_budget_fits_one_task(self):
+        """Test that a budget below the minimum task length keeps one task that fits it"""
+        tasks = [{'title': 'Read', 'estimated_minutes': 20}, {'title': 'Write', 'estimated_minutes': 10}]
+        
+        for daily_minutes in range(1, 5):
+            fitted = fit_day_to_budget(tasks, daily_minutes)
+            self.assertEqual([task['estimated_minutes'] for task in fitted], [daily_minutes])
+        self.assertEqual(sum(task['estimated_minutes'] for task in fit_day_to_budget(tasks, 10)), 10)
+    
+    def test_plan_length_is_capped(self):
+        """Test that far or missing deadlines fall back to the default and maximum lengths"""
+        far = schedule_plan(goal_text='Goal', current_level='beginner', daily_minutes=30, deadline='2099-01-01')
+        default = schedule_plan(goal_text='Goal', current_level='beginner', daily_minutes=30)
+        
+        self.assertEqual(len(far['weekly_roadmap']), MAX_PLAN_WEEKS)
+        self.assertEqual(len(default['weekly_roadmap']), DEFAULT_PLAN_WEEKS)
+    
+    def test_mock_plan_matches_model_schema(self):
+        """Test that the fallback plan has every section the model returns"""
+        plan = generate_mock_plan(goal_text='Goal', current_level='beginner', daily_minutes=45)
+        
+        for name in PLAN_SECTIONS:
+            self.assertTrue(plan[name])
+        self.assertEqual(set(plan['daily_tasks'][0]['tasks'][0]), {'title', 'description', 'estimated_minutes', 'type'})
+        self.assertEqual(plan['model_used'], 'mock-mode')
+
+
+class PromptCompilerTests(TestCase):
+    """Tests for compact, token-budgeted prompts"""
+    
+    def setUp(self):
+        self.inputs = {key: value for key, value in PLAN_INPUTS.items() if key != 'preferred_language'}
+        self.roadmap = [{'week': week, 'focus': f'Focus of week {week}', 'topics': ['Reading'], 'estimated_hours': 7} for week in range(1, 21)]
+    
+    def test_compact_schema_and_token_count(self):
+        """Test that examples become one-line signatures and tokens are counted locally"""
+        self.assertEqual(
+            compact_schema({'week': 2, 'type': 'quiz|review', 'topics': ['a'], 'url': 'optional-url', 'hours': 1.5}),
+            '{"week":int,"type":"quiz|review","topics":[str],"url":str?,"hours":num}'
+        )
+        self.assertEqual(count_tokens('hello world'), 2)
+        self.assertEqual(count_tokens(''), 0)
+    
+    def test_compact_prompt_is_smaller(self):
+        """Test that PLAN_PROMPT_COMPACT builds a shorter prompt with every input and section"""
+        pretty = build_prompt(**self.inputs)
+        with override_settings(PLAN_PROMPT_COMPACT=True):
+            compact = build_prompt(**self.inputs)
+        compiled = prompt_compiler.compile(PLAN_SECTIONS, **self.inputs)
+        
+        self.assertEqual(compact, compiled.text)
+        self.assertLess(count_tokens(compact), count_tokens(pretty) * 0.8)
+        for text in ('Pass IELTS with 7.0', 'intermediate', '60', 'reading, writing', 'books', '"estimated_minutes":int'):
+            self.assertIn(text, compact)
+        self.assertEqual(compiled.trimmed, [])
+    
+    def test_budget_trims_optional_context(self):
+        """Test that roadmap weeks far from the requested ones are trimmed and the user's inputs never are"""
+        full = prompt_compiler.compile(['daily_tasks'], context={'weekly_roadmap': self.roadmap}, weeks=(10, 10), **self.inputs)
+        compiled = prompt_compiler.compile(
+            ['daily_tasks'], context={'weekly_roadmap': self.roadmap}, weeks=(10, 10), budget=full.tokens - 60, **self.inputs
+        )
+        
+        self.assertLessEqual(compiled.tokens, full.tokens - 60)
+        self.assertEqual(compiled.trimmed, ['context.weekly_roadmap'])
+        self.assertIn('Focus of week 10', compiled.text)
+        self.assertNotIn('Focus of week 20', compiled.text)
+        self.assertIn('books', compiled.text)
+        self.assertEqual(len(self.roadmap), 20)
+        
+        self.assertEqual(compiled.overrun, 0)
+        
+        bare = prompt_compiler.compile(['daily_tasks'], budget=1, **self.inputs)
+        self.assertEqual(bare.trimmed, [])
+        self.assertEqual(bare.overrun, bare.tokens - 1)
+        for text in ('Pass IELTS with 7.0', 'reading, writing', 'books'):
+            self.assertIn(text, bare.text)
+        self.assertEqual(get_counters('prompt.'), {'prompt.over_budget': 1, 'prompt.trimmed': 1})
+    
+    @override_settings(PLAN_PROMPT_COMPACT=True, PLAN_PROMPT_TOKEN_BUDGET=0)
+    def test_section_prompt_delegates(self):
+        """Test that section prompts keep their context and week range when compiled"""
+        prompt = build_section_prompt(['daily_tasks'], {'weekly_roadmap': self.roadmap}, weeks=(3, 4), **self.inputs)
+        
+        self.assertIn('Focus of week 20', prompt)
+        self.assertIn('weeks 3-4', prompt)
+        self.assertIn('day 15', prompt)
+        self.assertNotIn('"topics":[{', prompt)
+
+
+class PlanValidationTests(TestCase):
+    """Tests for repairing model plans after decoding"""
+    
+    def setUp(self):
+        self.inputs = {key: value for key, value in PLAN_INPUTS.items() if key != 'preferred_language'}
+        self.plan = {name: section for name, section in generate_mock_plan(**self.inputs).items() if name in PLAN_SECTIONS}
+    
+    def test_valid_plan_is_unchanged(self):
+        """Test that a plan within budget and schema needs no repairs"""
+        repaired, repairs = repair_plan(self.plan, **self.inputs)
+        
+        self.assertEqual(repairs, [])
+        self.assertEqual(repaired, self.plan)
+    
+    def test_over_budget_days_are_trimmed(self):
+        """Test that days longer than daily_minutes are squeezed to fit"""
+        self.plan['daily_tasks'] = [{'day': 1, 'week': 1, 'tasks': [
+            {'title': 'Read', 'estimated_minutes': 90},
+            {'title': 'Write', 'estimated_minutes': '30'},
+            {'title': 'Listen'},
+        ]}]
+        
+        repaired, repairs = repair_plan(self.plan, **self.inputs)
+        
+        tasks = repaired['daily_tasks'][0]['tasks']
+        self.assertEqual(len(tasks), 3)
+        self.assertLessEqual(sum(task['estimated_minutes'] for task in tasks), 60)
+        self.assertTrue(all(isinstance(task['estimated_minutes'], int) for task in tasks))
+        self.assertEqual(len(repairs), 2)
+    
+    def test_malformed_and_missing_sections_are_filled_locally(self):
+        """Test that unusable entries are dropped and empty sections scheduled locally"""
+        self.plan['topics'] = ['not an object', {'priority': 'high'}]
+        del self.plan['checkpoints']
+        
+        repaired, repairs = repair_plan(self.plan, **self.inputs)
+        
+        self.assertTrue(repaired['topics'])
+        self.assertTrue(all('name' in topic for topic in repaired['topics']))
+        self.assertTrue(repaired['checkpoints'])
+        self.assertEqual(repaired['weekly_roadmap'], self.plan['weekly_roadmap'])
+        self.assertIn('filled topics, checkpoints locally', repairs)
+    
+    @override_settings(OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test', PLAN_CACHE_ENABLED=False)
+    @mock.patch('plans.llm.get_openai_client')
+    def test_generation_returns_repaired_plan(self, client):
+        """Test that generate_study_plan repairs the model's response"""
+        self.plan['daily_tasks'] = [{'day': 1, 'week': 1, 'tasks': [{'title': 'Read', 'estimated_minutes': 240}]}]
+        client.return_value.chat.completions.create.return_value = fake_completion(self.plan)
+        
+        plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(plan['daily_tasks'][0]['tasks'][0]['estimated_minutes'], 60)
+        self.assertEqual(plan['model_used'], 'gpt-test')
+
+
+class PlanRecoveryTests(TestCase):
+    """Tests for salvaging truncated or malformed model output"""
+    
+    def setUp(self):
+        inputs = {key: value for key, value in PLAN_INPUTS.items() if key != 'preferred_language'}
+        self.plan = {name: section for name, section in generate_mock_plan(**inputs).items() if name in PLAN_SECTIONS}
+    
+    def test_recovers_complete_sections_of_truncated_json(self):
+        """Test that sections before the cut-off survive and trailing commas are tolerated"""
+        text = '```json\n{"weekly_roadmap": [{"week": 1,},], "topics": [{"name": "Gram'
+        
+        self.assertEqual(recover_sections(text), {'weekly_roadmap': [{'week': 1}]})
+        self.assertEqual(recover_sections('not json'), {})
+    
+    @override_settings(OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test', PLAN_CACHE_ENABLED=False)
+    @mock.patch('plans.llm.get_openai_client')
+    def test_follow_up_call_requests_only_missing_sections(self, client):
+        """Test that a truncated completion is kept and only its missing sections are requested"""
+        full = json.dumps(self.plan)
+        truncated = full[:full.index('"resources"') + 20]
+        follow_up = {name: self.plan[name] for name in ('resources', 'checkpoints')}
+        create = client.return_value.chat.completions.create
+        create.side_effect = [
+            SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=truncated))], usage=SimpleNamespace(total_tokens=100)),
+            fake_completion(follow_up),
+        ]
+        
+        plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(create.call_count, 2)
+        follow_up_prompt = create.call_args[1]['messages'][-1]['content']
+        self.assertIn('"resources"', follow_up_prompt.split('containing only these sections')[1])
+        self.assertNotIn('"daily_tasks"', follow_up_prompt.split('containing only these sections')[1])
+        self.assertEqual(plan['daily_tasks'], self.plan['daily_tasks'])
+        self.assertEqual(plan['checkpoints'], self.plan['checkpoints'])
+        self.assertEqual(plan['model_used'], 'gpt-test')
+        self.assertEqual(get_counters('plan_parse.')['plan_parse.recovered'], 1)
+    
+    @override_settings(OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test', PLAN_CACHE_ENABLED=False)
+    @mock.patch('plans.llm.get_openai_client')
+    def test_unrecoverable_response_falls_back(self, client):
+        """Test that a response without any complete section still falls back to the local plan"""
+        client.return_value.chat.completions.create.return_value = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content='{"weekly_roadmap": [{"we'))],
+            usage=SimpleNamespace(total_tokens=100)
+        )
+        
+        plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(plan['model_used'], 'mock-mode')
+
+
+@override_settings(PLAN_PARALLEL_SECTIONS=True, PLAN_PARALLEL_WEEKS_PER_REQUEST=4, PLAN_CACHE_ENABLED=False)
+class ParallelGenerationTests(TestCase):
+    """Tests for generating a plan as concurrent section requests"""
+    
+    def setUp(self):
+        inputs = {key: value for key, value in PLAN_INPUTS.items() if key != 'preferred_language'}
+        self.plan = schedule_plan(**inputs)
+    
+    def tearDown(self):
+        reset_openai_client()
+    
+    def test_sections_are_generated_concurrently_and_merged(self):
+        """Test that a roadmap call plus section calls rebuild the full plan"""
+        with StubLLMServer(content=section_stub_content(self.plan), latency=0.1) as server, \
+                override_settings(OPENAI_API_KEY='stub', OPENAI_BASE_URL=server.url, OPENAI_MODEL='stub-model'):
+            reset_openai_client()
+            started = time.monotonic()
+            plan = generate_study_plan(**PLAN_INPUTS)
+            elapsed = time.monotonic() - started
+        
+        # Roadmap, three blocks of daily tasks, topics, resources, checkpoints
+        self.assertEqual(server.requests, 7)
+        self.assertLess(elapsed, 0.5)
+        for name in PLAN_SECTIONS:
+            self.assertEqual(plan[name], self.plan[name])
+        self.assertEqual(plan['model_used'], 'stub-model')
+    
+    @override_settings(PLAN_PROMPT_COMPACT=True)
+    def test_stub_serves_requested_sections_for_compact_prompts(self):
+        """Test that the stub finds the requested sections without reading the compact prompt"""
+        with StubLLMServer(content=section_stub_content(self.plan)) as server, \
+                override_settings(OPENAI_API_KEY='stub', OPENAI_BASE_URL=server.url, OPENAI_MODEL='stub-model'):
+            reset_openai_client()
+            plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(server.requests, 7)
+        for name in PLAN_SECTIONS:
+            self.assertEqual(plan[name], self.plan[name])
+    
+    @override_settings(OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test')
+    @mock.patch('plans.llm.get_openai_client')
+    def test_failed_section_is_filled_locally(self, client):
+        """Test that one failing section request does not lose the others"""
+        respond = section_stub_content(self.plan)
+        
+        def create(extra_headers, **kwargs):
+            content = respond(extra_headers)
+            if 'checkpoints' in content:
+                raise RuntimeError('upstream error')
+            return fake_completion(content)
+        
+        client.return_value.chat.completions.create.side_effect = create
+        
+        plan = generate_study_plan(**PLAN_INPUTS)
+        
+        self.assertEqual(plan['model_used'], 'gpt-test')
+        self.assertEqual(plan['daily_tasks'], self.plan['daily_tasks'])
+        self.assertTrue(plan['checkpoints'])
+
+
+@override_settings(PLAN_LAZY_DAILY_TASKS=True)
+class LazyWeekTests(TestCase):
+    """Tests for two-phase plans whose daily tasks are generated per week"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='weeks', password='testpass123')
+        self.client.force_authenticate(self.user)
+        enqueue_plan_job(self.user, 'create', dict(PLAN_INPUTS, title='Weeks'))
+        run_pending_jobs()
+        self.plan = Plan.objects.get(title='Weeks')
+        self.version = self.plan.versions.first()
+    
+    def test_plan_is_created_without_daily_tasks(self):
+        """Test that only the outline is generated up front"""
+        content = self.version.content_json
+        
+        self.assertEqual(content['daily_tasks'], [])
+        self.assertTrue(content['daily_tasks_deferred'])
+        self.assertEqual(len(content['weekly_roadmap']), DEFAULT_PLAN_WEEKS)
+        self.assertTrue(content['topics'])
+    
+    def test_week_is_generated_once_and_next_week_prefetched(self):
+        """Test that a week is generated by the worker on first request, stored, and the next one queued"""
+        with mock.patch('plans.weeks.generate_week_days') as generate:
+            response = self.client.get(f'/api/plans/{self.plan.id}/weeks/1')
+        generate.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['kind'], 'expand_week')
+        
+        # A repeated request gets the queued job instead of another one
+        self.assertEqual(self.client.get(f'/api/plans/{self.plan.id}/weeks/1').data['id'], response.data['id'])
+        self.assertEqual(PlanGenerationJob.objects.filter(kind='expand_week').count(), 1)
+        run_pending_jobs()
+        
+        response = self.client.get(f'/api/plans/{self.plan.id}/weeks/1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([day['day'] for day in response.data['days']], list(range(1, 8)))
+        for day in response.data['days']:
+            self.assertLessEqual(sum(task['estimated_minutes'] for task in day['tasks']), 60)
+        self.assertTrue(PlanWeek.objects.filter(version=self.version, week=1).exists())
+        job = PlanGenerationJob.objects.get(kind='expand_week', status='pending')
+        self.assertEqual(job.params, {'version': self.version.id, 'week': 2})
+        
+        # Repeated requests neither regenerate nor queue the prefetch again
+        with mock.patch('plans.weeks.generate_week_days') as generate:
+            self.client.get(f'/api/plans/{self.plan.id}/weeks/1')
+        generate.assert_not_called()
+        self.assertEqual(PlanGenerationJob.objects.filter(kind='expand_week').count(), 2)
+        
+        run_pending_jobs()
+        week = PlanWeek.objects.get(version=self.version, week=2)
+        self.assertEqual(week.days_json[0]['day'], 8)
+        
+        with mock.patch('plans.weeks.generate_week_days') as generate:
+            response = self.client.get(f'/api/plans/{self.plan.id}/weeks/2')
+        generate.assert_not_called()
+        self.assertEqual(response.data['days'], week.days_json)
+    
+    def test_week_generation_is_throttled(self):
+        """Test that queuing week generations counts against the plan generation rate"""
+        cache.clear()
+        with mock.patch.object(PlanGenerationThrottle, 'rate', '2/hour'):
+            statuses = [self.client.get(f'/api/plans/{self.plan.id}/weeks/{week}').status_code for week in (1, 2, 3)]
+            self.assertEqual(statuses, [202, 202, 429])
+            
+            # Waiting for an already queued week is not counted
+            self.assertEqual(self.client.get(f'/api/plans/{self.plan.id}/weeks/1').status_code, 202)
+        cache.clear()
+    
+    def test_unknown_week_is_not_found(self):
+        """Test that weeks outside the roadmap return 404"""
+        response = self.client.get(f'/api/plans/{self.plan.id}/weeks/{DEFAULT_PLAN_WEEKS + 1}')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+    
+    @override_settings(PLAN_LAZY_DAILY_TASKS=False)
+    def test_eager_plan_weeks_come_from_content(self):
+        """Test that plans generated in full are served without generating anything"""
+        enqueue_plan_job(self.user, 'create', dict(PLAN_INPUTS, title='Eager'))
+        run_pending_jobs()
+        plan = Plan.objects.get(title='Eager')
+        
+        response = self.client.get(f'/api/plans/{plan.id}/weeks/3')
+        
+        self.assertEqual(len(response.data['days']), 7)
+        self.assertFalse(PlanWeek.objects.filter(version__plan=plan).exists())
+        self.assertFalse(PlanGenerationJob.objects.filter(kind='expand_week', plan=plan).exists())
+    
+    @override_settings(OPENAI_API_KEY='sk-test', OPENAI_MODEL='gpt-test', PLAN_CACHE_ENABLED=False)
+    @mock.patch('plans.llm.get_openai_client')
+    def test_outline_prompt_skips_daily_tasks(self, client):
+        """Test that the up-front model call does not ask for daily tasks"""
+        inputs = {key: value for key, value in PLAN_INPUTS.items() if key != 'preferred_language'}
+        outline = {name: section for name, section in generate_mock_plan(**inputs).items() if name in OUTLINE_SECTIONS}
+        create = client.return_value.chat.completions.create
+        create.return_value = fake_completion(outline)
+        
+        plan = generate_study_plan(**PLAN_INPUTS)
+        
+        requested = create.call_args[1]['messages'][-1]['content'].split('containing only these sections')[1]
+        self.assertNotIn('"daily_tasks"', requested)
+        self.assertEqual(plan['weekly_roadmap'], outline['weekly_roadmap'])
+        self.assertEqual(plan['daily_tasks'], [])
+
+
+@override_settings(PLAN_SPECULATIVE_ENABLED=True)
+class SpeculativeGenerationTests(TestCase):
+    """Tests for speculative regeneration after profile updates"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='speculative', password='testpass123')
+        StudyProfile.objects.create(user=self.user, daily_minutes=60, focus_areas=['reading'])
+        self.client.force_authenticate(self.user)
+        enqueue_plan_job(self.user, 'create', {
+            'title': 'Speculative', 'goal_text': 'Learn Spanish', 'current_level': 'beginner',
+            'daily_minutes': 60, 'focus_areas': ['reading'], 'preferred_resources': [], 'preferred_language': 'en',
+        })
+        run_pending_jobs()
+        self.plan = Plan.objects.get(title='Speculative')
+    
+    def _update_profile(self, **changes):
+        response = self.client.patch('/api/profile/', changes, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return PlanGenerationJob.objects.filter(kind='speculative').last()
+    
+    def test_finished_speculation_is_adopted_instantly(self):
+        """Test that a matching regenerate reuses the speculative result without generating again"""
+        job = self._update_profile(daily_minutes=30)
+        self.assertEqual(job.status, 'pending')
+        run_pending_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'done')
+        self.assertEqual(self.plan.versions.count(), 1)
+        
+        response = self.client.post(f'/api/plans/{self.plan.id}/regenerate', {}, format='json')
+        
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['id'], job.id)
+        self.assertEqual(response.data['status'], 'done')
+        self.assertEqual(self.plan.versions.count(), 2)
+        result = {key: value for key, value in job.result_json.items() if key != 'telemetry'}
+        self.assertEqual(self.plan.versions.first().content_json, result)
+        self.assertFalse(PlanGenerationJob.objects.filter(status='pending').exists())
+        self.assertEqual(speculative_stats()['hit_rate'], 1.0)
+    
+    def test_queued_speculation_becomes_the_regenerate_job(self):
+        """Test that a regenerate arriving before the speculation ran takes over its job"""
+        job = self._update_profile(daily_minutes=45)
+        
+        response = self.client.post(f'/api/plans/{self.plan.id}/regenerate', {}, format='json')
+        self.assertEqual(response.data['id'], job.id)
+        
+        self.assertEqual(run_pending_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.kind, 'regenerate')
+        self.assertEqual(job.version, self.plan.versions.first())
+        self.assertEqual(self.plan.versions.count(), 2)
+    
+    def test_different_inputs_miss(self):
+        """Test that a regenerate with other inputs does not use the speculation"""
+        job = self._update_profile(daily_minutes=30)
+        run_pending_jobs()
+        
+        response = self.client.post(f'/api/plans/{self.plan.id}/regenerate', {'daily_minutes': 90}, format='json')
+        
+        self.assertNotEqual(response.data['id'], job.id)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertEqual(speculative_stats()['hit_rate'], 0.0)
+    
+    def test_speculation_is_limited_per_user(self):
+        """Test that newer updates supersede queued speculation and running ones block new ones"""
+        first = self._update_profile(daily_minutes=30)
+        second = self._update_profile(daily_minutes=40)
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'failed')
+        self.assertNotEqual(first.id, second.id)
+        
+        PlanGenerationJob.objects.filter(pk=second.pk).update(status='running')
+        self.assertEqual(self._update_profile(daily_minutes=50), second)
+        self.assertEqual(get_counters('speculative.')['speculative.limited'], 1)
+    
+    def test_unchanged_profile_is_not_speculated(self):
+        """Test that profile updates that do not affect the plan enqueue nothing"""
+        self.assertIsNone(self._update_profile(study_goal='Same plan inputs'))
@@ -1,8 +1,12 @@
 from django.urls import path
-from .views import PlanListView, PlanDetailView, regenerate_plan
+from .views import PlanListView, PlanDetailView, estimate_plan, regenerate_plan, plan_week, plan_job_status, stream_plan
 
 urlpatterns = [
     path('', PlanListView.as_view(), name='plan-list'),
+    path('stream', stream_plan, name='plan-stream'),
+    path('estimate', estimate_plan, name='plan-estimate'),
     path('<int:pk>', PlanDetailView.as_view(), name='plan-detail'),
     path('<int:plan_id>/regenerate', regenerate_plan, name='plan-regenerate'),
+    path('<int:plan_id>/weeks/<int:week>', plan_week, name='plan-week'),
+    path('jobs/<int:job_id>', plan_job_status, name='plan-job-status'),
 ]
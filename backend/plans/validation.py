@@ -0,0 +1,116 @@
+"""
+Validation and repair of model-generated plans
+
+The model is asked to keep every day within daily_minutes and to follow
+the plan schema, but nothing guarantees it. ``repair_plan`` checks the
+decoded response and fixes what it can locally: malformed entries are
+dropped, days over budget are squeezed to fit, and missing sections are
+filled by the local scheduler. That is much cheaper than the user
+regenerating the whole plan.
+"""
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from . import metrics
+from .scheduling import MIN_TASK_MINUTES, fit_day_to_budget, schedule_plan
+
+logger = logging.getLogger(__name__)
+
+# Keys an entry of each section must have to be usable
+REQUIRED_KEYS = {
+    'weekly_roadmap': ('week',),
+    'daily_tasks': ('day', 'tasks'),
+    'topics': ('name',),
+    'resources': ('title',),
+    'checkpoints': ('week',),
+}
+
+
+def _as_number(value: Any) -> Optional[float]:
+    """Numeric value of an int, float or numeric string; None otherwise"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _valid_entries(name: str, items: Any, repairs: List[str]) -> List[Dict[str, Any]]:
+    if not isinstance(items, list):
+        return []
+    entries = [
+        item for item in items
+        if isinstance(item, dict) and all(item.get(key) is not None for key in REQUIRED_KEYS[name])
+    ]
+    if len(entries) < len(items):
+        repairs.append(f'dropped {len(items) - len(entries)} malformed {name} entries')
+    return entries
+
+
+def repair_day(day: Dict[str, Any], daily_minutes: int, repairs: List[str]) -> Dict[str, Any]:
+    """Give every task a duration and fit the day into ``daily_minutes``"""
+    raw = day['tasks'] if isinstance(day['tasks'], list) else [day['tasks']]
+    tasks = [task for task in raw if isinstance(task, dict)]
+    if len(tasks) < len(raw):
+        repairs.append(f"dropped malformed tasks on day {day['day']}")
+
+    minutes = [_as_number(task.get('estimated_minutes')) for task in tasks]
+    known = sum(value for value in minutes if value is not None)
+    unknown = sum(1 for value in minutes if value is None)
+    if unknown:
+        # Share what is left of the budget between tasks without a duration
+        share = max(MIN_TASK_MINUTES, int((daily_minutes - known) // unknown))
+        repairs.append(f"estimated {unknown} task durations on day {day['day']}")
+    tasks = [
+        dict(task, estimated_minutes=int(round(value)) if value is not None else share)
+        for task, value in zip(tasks, minutes)
+    ]
+
+    total = sum(task['estimated_minutes'] for task in tasks)
+    if total > daily_minutes:
+        repairs.append(f"day {day['day']} was {total} of {daily_minutes} minutes")
+        tasks = fit_day_to_budget(tasks, daily_minutes)
+    return dict(day, tasks=tasks)
+
+
+def repair_plan(plan_data: Any, sections: Iterable[str] = tuple(REQUIRED_KEYS), **inputs) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Validate the ``sections`` of a decoded model response against the plan schema.
+
+    ``inputs`` are the generation inputs (goal_text, daily_minutes, ...).
+    Returns the repaired sections and a description of each repair; an
+    empty list means the response was used as is.
+    """
+    repairs = []
+    if not isinstance(plan_data, dict):
+        repairs.append('response was not a JSON object')
+        plan_data = {}
+
+    plan = {name: _valid_entries(name, plan_data.get(name), repairs) for name in sections}
+
+    daily_minutes = inputs['daily_minutes']
+    if 'daily_tasks' in plan:
+        plan['daily_tasks'] = [repair_day(day, daily_minutes, repairs) for day in plan['daily_tasks']]
+    if 'weekly_roadmap' in plan:
+        plan['weekly_roadmap'] = [
+            dict(week, estimated_hours=round(daily_minutes * 7 / 60, 1))
+            if 'estimated_hours' in week and _as_number(week['estimated_hours']) is None else week
+            for week in plan['weekly_roadmap']
+        ]
+
+    missing = [name for name, entries in plan.items() if not entries]
+    if missing:
+        repairs.append(f"filled {', '.join(missing)} locally")
+        metrics.increment('plan_validation.filled_sections', len(missing))
+        scheduled = schedule_plan(topics=plan.get('topics'), **inputs)
+        plan.update({name: scheduled[name] for name in missing})
+
+    if repairs:
+        metrics.increment('plan_validation.repaired')
+        logger.warning(f"Repaired model plan: {'; '.join(repairs[:5])}{' ...' if len(repairs) > 5 else ''}")
+    return plan, repairs
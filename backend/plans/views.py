@@ -1,35 +1,81 @@
+import json
+from dataclasses import replace
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import generics, status, permissions
-from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes, throttle_classes
+from rest_framework.exceptions import Throttled
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework.throttling import UserRateThrottle
-from django.db import transaction
-from .models import Plan, PlanVersion
+from .models import Plan, PlanGenerationJob, PlanVersion
 from .serializers import (
     PlanSerializer,
+    PlanListSerializer,
     PlanCreateSerializer,
-    PlanRegenerateSerializer
+    PlanRegenerateSerializer,
+    PlanGenerationJobSerializer
 )
-from .services import generate_study_plan
-from accounts.models import StudyProfile
+from .conditional import not_modified, plans_etag, with_etag
+from .idempotency import REPLAYED_HEADER, idempotent_job
+from .pagination import PlanPagination
+from .projection import Projection
+from .rendered import rendered_versions, splice
+from .jobs import enqueue_plan_job, create_plan, create_plan_params, regenerate_plan_params
+from .services import estimate_study_plan, stream_study_plan
+from .speculative import adopt_speculative_job
+from .weeks import get_week_days, queue_week, queued_week_job, week_numbers
 
 
 class PlanGenerationThrottle(UserRateThrottle):
     """Custom throttle for plan generation"""
+    scope = 'plan_generation'  # Count generations only, not every request by the user
     rate = '10/hour'
 
 
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients negotiate text/event-stream; the body is streamed by the view"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+def job_response(job, replayed=False):
+    """202 with the generation job; replays of an idempotent request are marked"""
+    response = Response(PlanGenerationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+    if replayed:
+        response[REPLAYED_HEADER] = 'true'
+    return response
+
+
 class PlanListView(generics.ListCreateAPIView):
     """List user's plans or create a new plan"""
-    serializer_class = PlanSerializer
+    serializer_class = PlanListSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = PlanPagination
     
     def get_queryset(self):
-        return Plan.objects.filter(user=self.request.user)
+        # Version content is only served by the detail view
+        return Plan.objects.filter(user=self.request.user).with_version_summary()
     
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return PlanCreateSerializer
-        return PlanSerializer
+        return PlanListSerializer
+    
+    def list(self, request, *args, **kwargs):
+        # 304 without serializing when the client's ETag still matches
+        etag = plans_etag(request, Plan.objects.filter(user=request.user))
+        return not_modified(request, etag) or with_etag(super().list(request, *args, **kwargs), etag)
     
     @throttle_classes([PlanGenerationThrottle])
     def create(self, request, *args, **kwargs):
@@ -39,61 +85,70 @@ class PlanListView(generics.ListCreateAPIView):
         user = request.user
         profile = getattr(user, 'study_profile', None)
         
-        # Get plan parameters
-        title = serializer.validated_data['title']
-        goal_text = serializer.validated_data['goal_text']
-        deadline = serializer.validated_data.get('deadline')
-        
-        # Get profile data or use provided values
-        current_level = serializer.validated_data.get('current_level') or (profile.current_level if profile else 'beginner')
-        daily_minutes = serializer.validated_data.get('daily_minutes') or (profile.daily_minutes if profile else 30)
-        focus_areas = serializer.validated_data.get('focus_areas') or (profile.focus_areas if profile else [])
-        preferred_resources = serializer.validated_data.get('preferred_resources') or (profile.preferred_resources if profile else [])
-        preferred_language = profile.preferred_language if profile else 'en'
-        
-        # Generate plan using AI service
-        plan_content = generate_study_plan(
-            goal_text=goal_text,
-            current_level=current_level,
-            daily_minutes=daily_minutes,
-            deadline=str(deadline) if deadline else None,
-            focus_areas=focus_areas,
-            preferred_resources=preferred_resources,
-            preferred_language=preferred_language
+        # Generation runs in the plan worker; the client polls the job.
+        # Retries with the same Idempotency-Key get the same job back.
+        job, replayed = idempotent_job(
+            request, 'plans.create',
+            lambda: enqueue_plan_job(user, 'create', create_plan_params(serializer.validated_data, profile))
         )
         
-        # Create plan and version
-        with transaction.atomic():
-            plan = Plan.objects.create(
-                user=user,
-                title=title,
-                goal_text=goal_text,
-                deadline=deadline,
-                is_active=True  # New plan is active by default
-            )
-            
-            # Get next version number
-            latest_version = plan.versions.order_by('-version_number').first()
-            next_version = (latest_version.version_number + 1) if latest_version else 1
-            
-            PlanVersion.objects.create(
-                plan=plan,
-                version_number=next_version,
-                content_json=plan_content,
-                prompt_used=plan_content.get('prompt_used', ''),
-                model_used=plan_content.get('model_used', 'mock-mode')
-            )
-        
-        return Response(PlanSerializer(plan).data, status=status.HTTP_201_CREATED)
+        return job_response(job, replayed)
 
 
 class PlanDetailView(generics.RetrieveAPIView):
-    """Get plan details"""
+    """Get plan details, optionally only some ?fields=, ?sections= and ?week="""
     serializer_class = PlanSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    def get_projection(self):
+        if not hasattr(self, '_projection'):
+            self._projection = Projection.from_request(self.request, PlanSerializer.Meta.fields)
+        return self._projection
+    
+    def splices_versions(self):
+        """Whether versions come as JSON from the rendered cache instead of the serializer"""
+        return settings.PLAN_RENDERED_CACHE_ENABLED and not self.get_projection().projects_content \
+            and isinstance(self.request.accepted_renderer, JSONRenderer)
+    
     def get_queryset(self):
-        return Plan.objects.filter(user=self.request.user)
+        projection = self.get_projection()
+        queryset = Plan.objects.filter(user=self.request.user)
+        if not projection.includes('versions') or self.splices_versions():
+            return queryset
+        # latest_version reads the prefetched versions too
+        return queryset.prefetch_related(Prefetch('versions', queryset=projection.versions(PlanVersion.objects.all())))
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['projection'] = self.get_projection()
+        return context
+    
+    def retrieve(self, request, *args, **kwargs):
+        etag = plans_etag(request, Plan.objects.filter(user=request.user, pk=kwargs['pk']))
+        return not_modified(request, etag) or with_etag(self.render_plan(request, *args, **kwargs), etag)
+    
+    def render_plan(self, request, *args, **kwargs):
+        if not self.splices_versions():
+            return super().retrieve(request, *args, **kwargs)
+        
+        plan = self.get_object()
+        projection = self.get_projection()
+        serializer = self.get_serializer(plan, context={
+            **self.get_serializer_context(),
+            'projection': replace(projection, fields=tuple(
+                name for name in projection.fields or PlanSerializer.Meta.fields
+                if name not in ('versions', 'latest_version')
+            )),
+        })
+        
+        versions = plan.versions.all()
+        rendered = rendered_versions.render(versions if projection.includes('versions') else versions[:1])
+        members = {}
+        if projection.includes('versions'):
+            members['versions'] = b'[' + b','.join(rendered) + b']'
+        if projection.includes('latest_version'):
+            members['latest_version'] = rendered[0] if rendered else b'null'
+        return HttpResponse(splice(JSONRenderer().render(serializer.data), members), content_type='application/json')
 
 
 @api_view(['POST'])
@@ -112,40 +167,98 @@ def regenerate_plan(request, plan_id):
     user = request.user
     profile = getattr(user, 'study_profile', None)
     
-    # Get updated parameters or use existing
-    current_level = serializer.validated_data.get('current_level') or (profile.current_level if profile else plan.versions.first().content_json.get('current_level', 'beginner'))
-    daily_minutes = serializer.validated_data.get('daily_minutes') or (profile.daily_minutes if profile else 30)
-    deadline = serializer.validated_data.get('deadline') or plan.deadline
-    focus_areas = serializer.validated_data.get('focus_areas') or (profile.focus_areas if profile else [])
-    preferred_resources = serializer.validated_data.get('preferred_resources') or (profile.preferred_resources if profile else [])
-    preferred_language = profile.preferred_language if profile else 'en'
-    
-    # Generate new plan version
-    plan_content = generate_study_plan(
-        goal_text=plan.goal_text,
-        current_level=current_level,
-        daily_minutes=daily_minutes,
-        deadline=str(deadline) if deadline else None,
-        focus_areas=focus_areas,
-        preferred_resources=preferred_resources,
-        preferred_language=preferred_language
+    # Generate new plan version in the plan worker, unless a profile
+    # update already started the same generation speculatively
+    params = regenerate_plan_params(plan, serializer.validated_data, profile)
+    job, replayed = idempotent_job(
+        request, f'plans.regenerate:{plan.id}',
+        lambda: adopt_speculative_job(plan, params) or enqueue_plan_job(user, 'regenerate', params, plan=plan)
     )
     
-    # Create new version
-    latest_version = plan.versions.order_by('-version_number').first()
-    next_version = (latest_version.version_number + 1) if latest_version else 1
+    return job_response(job, replayed)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def estimate_plan(request):
+    """Dry run of plan creation: expected source, tokens and latency, without calling the model"""
+    serializer = PlanCreateSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
     
-    PlanVersion.objects.create(
-        plan=plan,
-        version_number=next_version,
-        content_json=plan_content,
-        prompt_used=plan_content.get('prompt_used', ''),
-        model_used=plan_content.get('model_used', 'mock-mode')
-    )
+    profile = getattr(request.user, 'study_profile', None)
+    params = create_plan_params(serializer.validated_data, profile)
+    
+    return Response(estimate_study_plan(**{key: value for key, value in params.items() if key != 'title'}))
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def plan_week(request, plan_id, week):
+    """Daily tasks of one week of the latest plan version; 202 with the generation job until they exist"""
+    try:
+        plan = Plan.objects.get(id=plan_id, user=request.user)
+    except Plan.DoesNotExist:
+        return Response({'error': 'Plan not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    version = plan.versions.first()
+    if version is None or week not in week_numbers(version):
+        return Response({'error': 'Week not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    days = get_week_days(version, week)
+    if days is None:
+        # Generation runs in the plan worker; only requests that queue one count against the generation rate
+        job = queued_week_job(version, week)
+        if job is None:
+            throttle = PlanGenerationThrottle()
+            if not throttle.allow_request(request, None):
+                raise Throttled(wait=throttle.wait())
+            job, _ = queue_week(version, week)
+        return job_response(job)
+    
+    return Response({
+        'plan': plan.id,
+        'version': version.version_number,
+        'week': week,
+        'days': days,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def plan_job_status(request, job_id):
+    """Get the status of a plan generation job, including the version once done"""
+    try:
+        job = PlanGenerationJob.objects.select_related('version').get(id=job_id, user=request.user)
+    except PlanGenerationJob.DoesNotExist:
+        return Response({'error': 'Job not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(PlanGenerationJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+@throttle_classes([PlanGenerationThrottle])
+def stream_plan(request):
+    """Create a plan, streaming each section as Server-Sent Events while it is generated"""
+    serializer = PlanCreateSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    
+    user = request.user
+    profile = getattr(user, 'study_profile', None)
+    params = create_plan_params(serializer.validated_data, profile)
+    generation_kwargs = {key: value for key, value in params.items() if key != 'title'}
     
-    # Update plan if deadline changed
-    if deadline:
-        plan.deadline = deadline
-        plan.save()
+    def events():
+        for kind, payload in stream_study_plan(**generation_kwargs):
+            if kind == 'section':
+                name, content = payload
+                yield sse_event('section', {'name': name, 'content': content})
+            else:
+                plan = create_plan(user, params, payload)
+                yield sse_event('done', PlanSerializer(plan).data)
     
-    return Response(PlanSerializer(plan).data, status=status.HTTP_200_OK)
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable nginx proxy buffering
+    return response
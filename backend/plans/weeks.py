@@ -0,0 +1,128 @@
+"""
+Lazily expanded daily tasks
+
+Plans generated with PLAN_LAZY_DAILY_TASKS only contain the outline
+(roadmap, topics, resources, checkpoints). The first request for a week
+queues an ``expand_week`` job for the plan worker, which generates the
+daily tasks and stores them as a PlanWeek; once a week is served the
+following one is queued too, so it is usually ready before the user
+gets there.
+"""
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.db import transaction
+
+from . import metrics
+from .jobs import GENERATION_PARAMS, enqueue_plan_job
+from .models import Plan, PlanGenerationJob, PlanVersion, PlanWeek
+from .scheduling import schedule_plan
+from .validation import repair_day
+
+logger = logging.getLogger(__name__)
+
+
+def is_deferred(version: PlanVersion) -> bool:
+    """Whether the version's daily tasks are generated week by week"""
+    return bool(version.content_json.get('daily_tasks_deferred'))
+
+
+def week_numbers(version: PlanVersion) -> List[int]:
+    """Weeks of the version's roadmap"""
+    return [entry.get('week') for entry in version.content_json.get('weekly_roadmap', []) if isinstance(entry, dict)]
+
+
+def generate_week_days(version: PlanVersion, week: int) -> List[Dict[str, Any]]:
+    """
+    Generate the daily tasks of one week, consistent with the version's roadmap
+
+    Uses the model when it is configured and the local scheduler otherwise
+    (or when the model returns nothing usable for the week).
+    """
+    from .services import generate_plan_sections
+
+    content = version.content_json
+    params = {key: version.generation_params.get(key) for key in GENERATION_PARAMS}
+    roadmap = [entry for entry in content.get('weekly_roadmap', []) if entry.get('week') == week]
+
+    sections = generate_plan_sections(['daily_tasks'], {'weekly_roadmap': roadmap}, weeks=(week, week), **params)
+    days = [
+        day for day in sections['daily_tasks']
+        if isinstance(day, dict) and day.get('day') is not None and day.get('week', week) == week
+    ]
+    if not days:
+        local = {key: value for key, value in params.items() if key != 'preferred_language'}
+        scheduled = schedule_plan(topics=content.get('topics'), today=version.created_at.date(), **local)
+        days = [day for day in scheduled['daily_tasks'] if day['week'] == week]
+
+    repairs = []
+    days = [repair_day(dict(day, tasks=day.get('tasks', [])), params['daily_minutes'], repairs) for day in days]
+    if repairs:
+        logger.warning(f"Repaired week {week} of version {version.id}: {'; '.join(repairs[:5])}")
+    return days
+
+
+def save_week(version: PlanVersion, week: int, days: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Store a generated week; if another request stored it first, keep theirs"""
+    row, _ = PlanWeek.objects.get_or_create(version=version, week=week, defaults={'days_json': days})
+    return row.days_json
+
+
+def stored_week(version: PlanVersion, week: int) -> Optional[List[Dict[str, Any]]]:
+    """Daily tasks of ``week`` if they have been generated"""
+    return PlanWeek.objects.filter(version=version, week=week).values_list('days_json', flat=True).first()
+
+
+def queued_week_job(version: PlanVersion, week: int) -> Optional[PlanGenerationJob]:
+    """The pending or running job generating ``week``, if any"""
+    return PlanGenerationJob.objects.filter(
+        plan_id=version.plan_id,
+        kind='expand_week',
+        status__in=['pending', 'running'],
+        params__version=version.id,
+        params__week=week
+    ).order_by('created_at').first()
+
+
+def queue_week(version: PlanVersion, week: int) -> Tuple[PlanGenerationJob, bool]:
+    """
+    The job generating ``week``: the one already queued, or a new one.
+    Returns the job and whether it was created.
+    """
+    with transaction.atomic():
+        # Concurrent requests for the plan's weeks queue one job at a time
+        Plan.objects.select_for_update().filter(pk=version.plan_id).exists()
+        job = queued_week_job(version, week)
+        if job is not None:
+            return job, False
+        return enqueue_plan_job(version.plan.user, 'expand_week', {'version': version.id, 'week': week}, plan=version.plan), True
+
+
+def prefetch_week(version: PlanVersion, week: int) -> Optional[PlanGenerationJob]:
+    """Queue generation of ``week`` for the plan worker unless it exists or is already queued"""
+    if not is_deferred(version) or week not in week_numbers(version):
+        return None
+    if PlanWeek.objects.filter(version=version, week=week).exists():
+        return None
+    job, created = queue_week(version, week)
+    if not created:
+        return None
+
+    metrics.increment('plan_weeks.prefetched')
+    return job
+
+
+def get_week_days(version: PlanVersion, week: int, prefetch: bool = True) -> Optional[List[Dict[str, Any]]]:
+    """
+    Daily tasks of ``week``, or None while they are not generated yet
+    (queue_week() starts the generation)
+
+    Plans generated with all their daily tasks are served from content_json.
+    """
+    if not is_deferred(version):
+        return [day for day in version.content_json.get('daily_tasks', []) if day.get('week') == week]
+
+    days = stored_week(version, week)
+    if days is not None and prefetch:
+        prefetch_week(version, week + 1)
+    return days
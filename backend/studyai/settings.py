@@ -3,6 +3,7 @@ Django settings for studyai project.
 """
 
 from pathlib import Path
+from corsheaders.defaults import default_headers
 from decouple import config
 import dj_database_url
 import os
@@ -176,6 +177,8 @@ CORS_ALLOWED_ORIGINS = config(
 ).split(',')
 
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key', 'if-none-match')
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed', 'ETag']
 
 # API Documentation
 SPECTACULAR_SETTINGS = {
@@ -196,6 +199,116 @@ EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
 # OpenAI Settings
 OPENAI_API_KEY = config('OPENAI_API_KEY', default='')
 OPENAI_MODEL = config('OPENAI_MODEL', default='gpt-4-turbo-preview')
+OPENAI_BASE_URL = config('OPENAI_BASE_URL', default='')  # OpenAI-compatible endpoint, e.g. a local stub
+OPENAI_MAX_RETRIES = config('OPENAI_MAX_RETRIES', default=2, cast=int)
+# HTTP timeouts in seconds; read bounds the wait between bytes of a response
+OPENAI_CONNECT_TIMEOUT = config('OPENAI_CONNECT_TIMEOUT', default=5.0, cast=float)
+OPENAI_READ_TIMEOUT = config('OPENAI_READ_TIMEOUT', default=90.0, cast=float)
+OPENAI_WRITE_TIMEOUT = config('OPENAI_WRITE_TIMEOUT', default=10.0, cast=float)
+OPENAI_POOL_TIMEOUT = config('OPENAI_POOL_TIMEOUT', default=5.0, cast=float)
+# Keep-alive connection pool shared by all generations in a process
+OPENAI_MAX_CONNECTIONS = config('OPENAI_MAX_CONNECTIONS', default=20, cast=int)
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = config('OPENAI_MAX_KEEPALIVE_CONNECTIONS', default=10, cast=int)
+OPENAI_KEEPALIVE_EXPIRY = config('OPENAI_KEEPALIVE_EXPIRY', default=60.0, cast=float)
+
+# Plan generation worker
+PLAN_WORKER_CONCURRENCY = config('PLAN_WORKER_CONCURRENCY', default=4, cast=int)
+PLAN_WORKER_POLL_INTERVAL = config('PLAN_WORKER_POLL_INTERVAL', default=1.0, cast=float)
+PLAN_JOB_STALE_AFTER = config('PLAN_JOB_STALE_AFTER', default=600, cast=int)  # seconds
+PLAN_WORKER_REQUEUE_INTERVAL = config('PLAN_WORKER_REQUEUE_INTERVAL', default=60.0, cast=float)  # seconds between stale job sweeps
+
+# Generation counters are summed in process and written at most this often; 0 writes every increment
+PLAN_METRICS_FLUSH_INTERVAL = config('PLAN_METRICS_FLUSH_INTERVAL', default=5.0, cast=float)  # seconds
+
+# Plan cache
+PLAN_CACHE_ENABLED = config('PLAN_CACHE_ENABLED', default=True, cast=bool)
+PLAN_CACHE_TTL = config('PLAN_CACHE_TTL', default=7 * 24 * 3600, cast=int)  # seconds
+PLAN_CACHE_MAX_ENTRIES = config('PLAN_CACHE_MAX_ENTRIES', default=1000, cast=int)
+
+# Coalescing of identical concurrent generations
+PLAN_SINGLE_FLIGHT_ENABLED = config('PLAN_SINGLE_FLIGHT_ENABLED', default=True, cast=bool)
+PLAN_SINGLE_FLIGHT_TIMEOUT = config('PLAN_SINGLE_FLIGHT_TIMEOUT', default=120, cast=int)  # seconds
+PLAN_SINGLE_FLIGHT_POLL_INTERVAL = config('PLAN_SINGLE_FLIGHT_POLL_INTERVAL', default=0.25, cast=float)
+
+# Circuit breaker around OpenAI calls
+PLAN_BREAKER_ENABLED = config('PLAN_BREAKER_ENABLED', default=True, cast=bool)
+PLAN_BREAKER_WINDOW = config('PLAN_BREAKER_WINDOW', default=60, cast=int)  # seconds of outcomes considered
+PLAN_BREAKER_MIN_CALLS = config('PLAN_BREAKER_MIN_CALLS', default=5, cast=int)
+PLAN_BREAKER_ERROR_RATE = config('PLAN_BREAKER_ERROR_RATE', default=0.5, cast=float)
+PLAN_BREAKER_SLOW_CALL_SECONDS = config('PLAN_BREAKER_SLOW_CALL_SECONDS', default=60.0, cast=float)
+PLAN_BREAKER_SLOW_CALL_RATE = config('PLAN_BREAKER_SLOW_CALL_RATE', default=0.8, cast=float)
+PLAN_BREAKER_COOLDOWN = config('PLAN_BREAKER_COOLDOWN', default=30, cast=int)  # seconds open before a trial call
+PLAN_BREAKER_REFRESH_INTERVAL = config('PLAN_BREAKER_REFRESH_INTERVAL', default=1.0, cast=float)  # seconds
+
+# Parallel per-section generation: a roadmap call, then concurrent section calls
+PLAN_PARALLEL_SECTIONS = config('PLAN_PARALLEL_SECTIONS', default=False, cast=bool)
+PLAN_PARALLEL_MAX_WORKERS = config('PLAN_PARALLEL_MAX_WORKERS', default=6, cast=int)
+PLAN_PARALLEL_WEEKS_PER_REQUEST = config('PLAN_PARALLEL_WEEKS_PER_REQUEST', default=4, cast=int)
+
+# Two-phase plans: generate the outline up front, daily tasks per week on first request
+PLAN_LAZY_DAILY_TASKS = config('PLAN_LAZY_DAILY_TASKS', default=False, cast=bool)
+
+# Speculative regeneration of the active plan after a profile update
+PLAN_SPECULATIVE_ENABLED = config('PLAN_SPECULATIVE_ENABLED', default=False, cast=bool)
+PLAN_SPECULATIVE_MAX_IN_FLIGHT = config('PLAN_SPECULATIVE_MAX_IN_FLIGHT', default=1, cast=int)  # per user
+PLAN_SPECULATIVE_MAX_PER_DAY = config('PLAN_SPECULATIVE_MAX_PER_DAY', default=10, cast=int)  # per user
+PLAN_SPECULATIVE_TTL = config('PLAN_SPECULATIVE_TTL', default=3600, cast=int)  # seconds a result can be adopted
+
+# Model backend for plan generation: 'openai', 'stub' (bundled local server) or 'mock' (local scheduler)
+PLAN_LLM_BACKEND = config('PLAN_LLM_BACKEND', default='openai')
+PLAN_STUB_LATENCY = config('PLAN_STUB_LATENCY', default='fixed:0')  # seconds, e.g. uniform:0.1,0.5 or lognormal:0.8,0.5
+PLAN_STUB_TOKEN_DELAY = config('PLAN_STUB_TOKEN_DELAY', default=0.0, cast=float)  # seconds per completion token
+PLAN_STUB_PROMPT_TOKEN_DELAY = config('PLAN_STUB_PROMPT_TOKEN_DELAY', default=0.0, cast=float)  # seconds per prompt token
+PLAN_STUB_ERROR_RATE = config('PLAN_STUB_ERROR_RATE', default=0.0, cast=float)  # share of requests failing with a 500
+# Per-model latency, e.g. gpt-3.5-turbo=lognormal:0.2,0.3;gpt-4-turbo-preview=lognormal:0.8,0.3
+PLAN_STUB_MODEL_LATENCY = dict(
+    spec.split('=', 1) for spec in config('PLAN_STUB_MODEL_LATENCY', default='').split(';') if '=' in spec
+)
+
+# Record model responses to a cassette, or replay them instead of calling the backend
+PLAN_LLM_CASSETTE_MODE = config('PLAN_LLM_CASSETTE_MODE', default='')  # '', 'record' or 'replay'
+PLAN_LLM_CASSETTE_PATH = config('PLAN_LLM_CASSETTE_PATH', default=os.path.join(BASE_DIR, 'cassettes', 'llm.jsonl'))
+PLAN_LLM_CASSETTE_REPLAY_LATENCY = config('PLAN_LLM_CASSETTE_REPLAY_LATENCY', default=True, cast=bool)  # sleep the recorded time
+
+# Compact prompts compiled from the section examples, trimmed to a token budget
+PLAN_PROMPT_COMPACT = config('PLAN_PROMPT_COMPACT', default=False, cast=bool)
+PLAN_PROMPT_TOKEN_BUDGET = config('PLAN_PROMPT_TOKEN_BUDGET', default=1500, cast=int)  # input tokens, 0 for no limit
+
+# Retries of create/regenerate with the same Idempotency-Key get the first request's job
+PLAN_IDEMPOTENCY_TTL = config('PLAN_IDEMPOTENCY_TTL', default=24 * 3600, cast=int)  # seconds
+
+# Window of version telemetry behind dry-run latency estimates
+PLAN_ESTIMATE_WINDOW = config('PLAN_ESTIMATE_WINDOW', default=24 * 3600, cast=int)  # seconds
+
+# Latency-aware routing of generations to model tiers (fallback chains, first choice first)
+PLAN_ROUTING_ENABLED = config('PLAN_ROUTING_ENABLED', default=False, cast=bool)
+PLAN_MODEL_TIERS = {
+    'fast': config('PLAN_MODELS_FAST', default='gpt-3.5-turbo,gpt-4-turbo-preview').split(','),
+    'standard': config('PLAN_MODELS_STANDARD', default='gpt-4-turbo-preview,gpt-3.5-turbo').split(','),
+}
+PLAN_ROUTING_FAST_MAX_PROMPT_TOKENS = config('PLAN_ROUTING_FAST_MAX_PROMPT_TOKENS', default=1500, cast=int)
+PLAN_ROUTING_FAST_MAX_DAYS = config('PLAN_ROUTING_FAST_MAX_DAYS', default=28, cast=int)  # longest plan on the fast tier
+PLAN_ROUTING_MAX_P50_MS = config('PLAN_ROUTING_MAX_P50_MS', default=60000, cast=int)  # slower models are tried last
+PLAN_ROUTING_MAX_ERROR_RATE = config('PLAN_ROUTING_MAX_ERROR_RATE', default=0.2, cast=float)
+PLAN_ROUTING_WINDOW = config('PLAN_ROUTING_WINDOW', default=900, cast=int)  # seconds of versions for latency
+PLAN_ROUTING_REFRESH_INTERVAL = config('PLAN_ROUTING_REFRESH_INTERVAL', default=5.0, cast=float)  # seconds
+
+# Rendered JSON of plan versions, spliced into plan detail: a per-process LRU, optionally backed by a directory
+PLAN_RENDERED_CACHE_ENABLED = config('PLAN_RENDERED_CACHE_ENABLED', default=False, cast=bool)
+PLAN_RENDERED_CACHE_MAX_BYTES = config('PLAN_RENDERED_CACHE_MAX_BYTES', default=64 * 1024 * 1024, cast=int)
+PLAN_RENDERED_CACHE_DIR = config('PLAN_RENDERED_CACHE_DIR', default='')
+
+# A shared backend (e.g. Redis) can serve as the 'plan_versions' cache instead of a directory
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+if PLAN_RENDERED_CACHE_DIR:
+    CACHES['plan_versions'] = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': PLAN_RENDERED_CACHE_DIR,
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': config('PLAN_RENDERED_CACHE_DIR_MAX_ENTRIES', default=10000, cast=int)},
+    }
 
 # Logging
 LOGGING = {
@@ -228,5 +341,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': False,
         },
+        # The OpenAI client's HTTP library logs every request at INFO
+        'httpx': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
@@ -61,8 +61,9 @@ const Onboarding = () => {
         deadline: formData.deadline || null,
       }
       const response = await plansAPI.create(planData)
+      const job = await plansAPI.waitForJob(response.data.id)
       toast.success('Plan created successfully!')
-      navigate(`/plans/${response.data.id}`)
+      navigate(`/plans/${job.plan}`)
     } catch (error) {
       toast.error(error.response?.data?.detail || 'Failed to create plan')
     } finally {
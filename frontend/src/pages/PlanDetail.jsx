@@ -9,11 +9,37 @@ const PlanDetail = () => {
   const [plan, setPlan] = useState(null)
   const [loading, setLoading] = useState(true)
   const [regenerating, setRegenerating] = useState(false)
+  const [selectedWeek, setSelectedWeek] = useState(1)
+  const [weekDays, setWeekDays] = useState(null)
+
+  const deferred = Boolean(plan?.latest_version?.content_json?.daily_tasks_deferred)
 
   useEffect(() => {
     fetchPlan()
   }, [id])
 
+  useEffect(() => {
+    if (deferred) {
+      fetchWeek(selectedWeek)
+    }
+  }, [deferred, selectedWeek, plan?.latest_version?.id])
+
+  const fetchWeek = async (week) => {
+    setWeekDays(null)
+    try {
+      let response = await plansAPI.week(id, week)
+      if (response.status === 202) {
+        // The week is being generated; wait for the job, then read it
+        await plansAPI.waitForJob(response.data.id)
+        response = await plansAPI.week(id, week)
+      }
+      setWeekDays(response.data.days)
+    } catch (error) {
+      toast.error('Failed to load daily tasks')
+      setWeekDays([])
+    }
+  }
+
   const fetchPlan = async () => {
     try {
       const response = await plansAPI.get(id)
@@ -32,7 +58,8 @@ const PlanDetail = () => {
 
     setRegenerating(true)
     try {
-      await plansAPI.regenerate(id, {})
+      const response = await plansAPI.regenerate(id, {})
+      await plansAPI.waitForJob(response.data.id)
       toast.success('Plan regenerated successfully!')
       fetchPlan()
     } catch (error) {
@@ -65,6 +92,7 @@ const PlanDetail = () => {
   }
 
   const content = plan.latest_version?.content_json || {}
+  const days = deferred ? weekDays || [] : (content.daily_tasks || []).slice(0, 14)
 
   return (
     <div className="min-h-screen bg-gray-50">
@@ -125,8 +153,26 @@ const PlanDetail = () => {
         {content.daily_tasks && (
           <div className="bg-white rounded-lg shadow-md p-6 mb-6">
             <h2 className="text-2xl font-semibold text-gray-900 mb-4">Daily Tasks</h2>
+            {deferred && (
+              <div className="flex flex-wrap gap-2 mb-4">
+                {(content.weekly_roadmap || []).map((week) => (
+                  <button
+                    key={week.week}
+                    onClick={() => setSelectedWeek(week.week)}
+                    className={`px-3 py-1 rounded text-sm ${
+                      week.week === selectedWeek ? 'bg-blue-600 text-white' : 'bg-gray-100 text-gray-700 hover:bg-gray-200'
+                    }`}
+                  >
+                    Week {week.week}
+                  </button>
+                ))}
+              </div>
+            )}
+            {deferred && weekDays === null && (
+              <p className="text-gray-500">Preparing week {selectedWeek}...</p>
+            )}
             <div className="space-y-4">
-              {content.daily_tasks.slice(0, 14).map((day, idx) => (
+              {days.map((day, idx) => (
                 <div key={idx} className="border rounded-lg p-4">
                   <h3 className="font-semibold text-gray-900 mb-2">
                     Day {day.day} (Week {day.week})
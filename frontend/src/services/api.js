@@ -79,6 +79,24 @@ export const plansAPI = {
   get: (id) => api.get(`/plans/${id}`),
   create: (data) => api.post('/plans/', data),
   regenerate: (id, data) => api.post(`/plans/${id}/regenerate`, data),
+  // Daily tasks of one week; for two-phase plans a 202 with the generation job until they exist
+  week: (id, week) => api.get(`/plans/${id}/weeks/${week}`),
+  job: (jobId) => api.get(`/plans/jobs/${jobId}`),
+  // Poll a generation job until the worker has finished it
+  waitForJob: async (jobId, { interval = 1500, timeout = 180000 } = {}) => {
+    const startedAt = Date.now()
+    while (Date.now() - startedAt < timeout) {
+      const response = await api.get(`/plans/jobs/${jobId}`)
+      if (response.data.status === 'done') {
+        return response.data
+      }
+      if (response.data.status === 'failed') {
+        throw new Error(response.data.error || 'Plan generation failed')
+      }
+      await new Promise((resolve) => setTimeout(resolve, interval))
+    }
+    throw new Error('Plan generation timed out')
+  },
 }
 
 // Admin API